@@ -11,6 +11,10 @@ class BaseService(ABC):
     that invoke the corresponding batch methods.
     """
     
+    # Batch methods that may run concurrently with the service's other calls (on disjoint
+    # environments). BatchEnvServer calls them without the service lock; all others run one at a time.
+    CONCURRENT_METHODS: Tuple[str, ...] = ()
+    
     @abstractmethod
     def create_environments_batch(self, ids2configs: Dict[str, Any]) -> None:
         """
@@ -128,3 +132,38 @@ class BaseService(ABC):
             The implementation should perform cleanup concurrently and handle any errors gracefully.
         """
         pass
+
+    def collect_state_rewards_batch(self, env_ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        Collect the state rewards that were judged in the background (async_state_reward).
+
+        Args:
+            env_ids (List[str]): A list of environment IDs.
+
+        Returns:
+            Dict[str, Dict[str, Dict]]:
+                {env_id: {ticket: {"reward": float, "turn_metrics": dict}}}, where each ticket is
+                the info["pending_state_reward"] of the step it belongs to.
+                Empty for services that judged every step synchronously.
+        """
+        deferred = getattr(self, "deferred_state_rewards", None)
+        if deferred is None:
+            return {}
+        return deferred.collect(
+            self.env_configs,
+            env_ids,
+            timeout=self.config.get("state_reward_timeout", 120.0),
+            fallback_score=self.config.get("state_reward_fallback_score", 0.0),
+        )
+
+    def discard_state_rewards(self, env_ids: List[str]) -> None:
+        """
+        Drop the background state-reward judgments that were not collected for env_ids.
+        Called from close_batch by services using the service_state_reward_wrapper* decorators.
+
+        Args:
+            env_ids (List[str]): A list of environment IDs.
+        """
+        deferred = getattr(self, "deferred_state_rewards", None)
+        if deferred is not None:
+            deferred.discard(env_ids)
@@ -4,6 +4,11 @@ from typing import Optional, List, Union
 @dataclass
 class BaseServiceConfig(ABC):
     max_workers: int = 10
+    # State rewards (see vagen/env/utils/deferred_state_reward.py): judge in the background and
+    # return step_batch at once, rewards are collected with collect_state_rewards_batch
+    async_state_reward: bool = False
+    state_reward_timeout: float = 120.0  # seconds after submission before the fallback score is used
+    state_reward_fallback_score: float = 0.0
     
     def get(self, key, default=None):
         """
@@ -77,6 +77,7 @@ class BlackjackService(BaseService):
             env = self.environments[env_id]
             env.close()
             
+        self.discard_state_rewards(env_ids)
         for env_id in env_ids:
             self.environments.pop(env_id, None)
             self.env_configs.pop(env_id, None)
@@ -6,10 +6,12 @@ from gymnasium.utils import seeding
 from gymnasium.envs.toy_text.frozen_lake import FrozenLakeEnv as GymFrozenLakeEnv
 from vagen.env.utils.env_utils import NoLoggerWarnings, set_seed
 from vagen.env.utils.context_utils import convert_numpy_to_PIL
+from vagen.env.utils.tile_renderer import TileRenderer, frozenlake_atlas, frozenlake_cell_kinds, frozenlake_tile_ids
 from vagen.env.utils.parse_utils import PARSE_FUNC_MAP
 from .prompt import system_prompt, init_observation_template, action_template, format_prompt
 from .env_config import FrozenLakeEnvConfig
 from .utils import generate_random_map, is_valid
+from .map_bank import load_map_bank
 from vagen.env.utils.state_reward_text_utils import env_state_reward_wrapper
 from .utils import state_to_sentences, convert_frozenlake_state_to_relative_list
 class FrozenLakeEnv(BaseEnv):
@@ -71,11 +73,23 @@ class FrozenLakeEnv(BaseEnv):
             is_slippery=self.config.is_slippery
         )
         
+        # Seeded maps from a map bank (see map_bank.py): each reset(seed) plays
+        # generate_random_map(size, p, seed=seed), looked up in the bank or generated live
+        self.map_bank = None
+        if self.config.desc is None and self.config.map_bank_path:
+            self.map_bank = load_map_bank(self.config.map_bank_path)
+            if not self.map_bank.matches(self.config.size, self.config.p):
+                raise ValueError(f"Map bank {self.config.map_bank_path} was generated with different parameters: {self.map_bank.meta}")
+        
         # Initialize episode state
         self.total_reward = 0
         self.valid_actions = []
         self.reward = 0
         
+        # Vision frames from the tile atlas, set up per map in _render
+        self.tile_renderer = None
+        self.cell_kinds = None
+        
         # Store the format prompt function for later use
         self.format_prompt_func = format_prompt[self.config.prompt_format]
         
@@ -98,6 +112,13 @@ class FrozenLakeEnv(BaseEnv):
                 - obs: Dictionary containing observation string and optional image data
                 - info: Empty dictionary for initial state
         """
+        if self.map_bank is not None and seed is not None:
+            seeded_map = self.map_bank.get(seed)
+            if seeded_map is None:
+                seeded_map = generate_random_map(size=self.config.size, p=self.config.p, seed=seed)
+            if not np.array_equal(self.gym_env.desc, np.asarray(seeded_map, dtype="c")):
+                self.gym_env.close()
+                self.gym_env = GymFrozenLakeEnv(desc=seeded_map, is_slippery=self.config.is_slippery)
         with NoLoggerWarnings():
             with set_seed(seed):
                 self.gym_env.reset(seed=seed)
@@ -128,6 +149,26 @@ class FrozenLakeEnv(BaseEnv):
                 - done: Boolean indicating if episode is complete
                 - info: Dictionary containing metrics and parsed action data
         """
+        step = self._begin_step(action_str)
+        
+        # Execute each action in the list until done or all actions processed
+        for action in step["rst"]['actions']:
+            if action in self.ACTION_LOOKUP:
+                # Convert string action to integer and execute in gym environment
+                _, step_reward, terminated, _, _ = self.gym_env.step(self.ACTION_LOOKUP[action])
+                self._record_action(step, action, step_reward)
+                assert terminated == step["done"]
+                if step["done"]:
+                    break
+            else:
+                # If an invalid action is encountered, mark actions as invalid and stop
+                step["metrics"]["turn_metrics"]['action_is_valid'] = False
+                break
+        
+        return self._end_step(step)
+
+    def _begin_step(self, action_str: str) -> Dict:
+        """Parse the response and start a turn, the actions are applied by step or by a batch engine"""
         # Parse the LLM's raw response to extract actions
         rst = self.parse_func(
             response=action_str,
@@ -136,13 +177,10 @@ class FrozenLakeEnv(BaseEnv):
             max_actions=self.config.max_actions_per_step
         )
         
-        action_list = rst['actions']
-        prev_player_position = self._get_player_position()
-        
         # Initialize metrics for this step
         metrics = {
             "turn_metrics": {
-                "action_is_valid": len(action_list) != 0,  # True if at least one valid action was parsed
+                "action_is_valid": len(rst['actions']) != 0,  # True if at least one valid action was parsed
                 "action_is_effective": False,  # Will be updated after actions are executed
             },
             "traj_metrics": {
@@ -153,31 +191,29 @@ class FrozenLakeEnv(BaseEnv):
         # Reset step-specific state
         self.reward = 0
         self.valid_actions = []
-        done = False
+        return {
+            "rst": rst,
+            "metrics": metrics,
+            "prev_player_position": self._get_player_position(),
+            "done": False,
+        }
+
+    def _record_action(self, step: Dict, action: str, step_reward: float) -> None:
+        """Book-keeping after one action of the turn was applied to the gym environment"""
+        self.reward += step_reward
+        self.valid_actions.append(action)
+        step["done"] = self._finished()
+        # If episode is done and successful, add bonus reward
+        if step["done"] and self._success():
+            step["metrics"]["traj_metrics"]['success'] = True
+            self.reward += 9  # Bonus reward for reaching goal
+
+    def _end_step(self, step: Dict):
+        """Finish the turn: format reward, metrics and observation"""
+        rst, metrics = step["rst"], step["metrics"]
         info = {}
         info.update(rst)  # Include parsed action data in info
         
-        # Execute each action in the list until done or all actions processed
-        for action in action_list:
-            if action in self.ACTION_LOOKUP:
-                # Convert string action to integer and execute in gym environment
-                action_int = self.ACTION_LOOKUP[action]
-                _, step_reward, terminated, _, _ = self.gym_env.step(action_int)
-                self.reward += step_reward
-                self.valid_actions.append(action)
-                done = self._finished()
-                assert terminated == done
-                if done:
-                    # If episode is done and successful, add bonus reward
-                    if self._success():
-                        metrics["traj_metrics"]['success'] = True
-                        self.reward += 9  # Bonus reward for reaching goal
-                    break
-            else:
-                # If an invalid action is encountered, mark actions as invalid and stop
-                metrics["turn_metrics"]['action_is_valid'] = False
-                break
-        
         # Add format reward if actions were valid
         if metrics["turn_metrics"]['action_is_valid'] and rst["format_correct"]:
             self.reward += self.config.format_reward
@@ -185,15 +221,14 @@ class FrozenLakeEnv(BaseEnv):
         else:
             info["is_format_rewarded"] = False
         
-        
         # Check if position changed to determine if action was effective
-        metrics["turn_metrics"]['action_is_effective'] = not np.array_equal(prev_player_position, self._get_player_position())
+        metrics["turn_metrics"]['action_is_effective'] = not np.array_equal(step["prev_player_position"], self._get_player_position())
         info["metrics"] = metrics
         # Update total reward for the episode
         self.total_reward += self.reward
         
         # Generate observation, return result tuple
-        return self._render(init_obs=False), self.reward, done, info
+        return self._render(init_obs=False), self.reward, step["done"], info
 
     def system_prompt(self):
         """
@@ -251,7 +286,7 @@ class FrozenLakeEnv(BaseEnv):
             # For vision mode, generate an image of the environment
             img_placeholder = self.config.image_placeholder
             multi_modal_data = {
-                img_placeholder: [convert_numpy_to_PIL(self.gym_env._render_gui(mode='rgb_array'))]
+                img_placeholder: [convert_numpy_to_PIL(self._render_frame())]
             }
             observation = img_placeholder  # In the text, just use the placeholder
         else:
@@ -282,6 +317,19 @@ class FrozenLakeEnv(BaseEnv):
                 "obs_str": obs_str,
             }
 
+    def _render_frame(self):
+        """RGB frame of the current state, from the tile atlas if gymnasium's renderer is reproduced exactly"""
+        if not self.config.use_tile_renderer:
+            return self.gym_env._render_gui(mode='rgb_array')
+        desc = self.gym_env.desc
+        if self.cell_kinds is None or self.cell_kinds.shape != desc.shape or not np.array_equal(self.cell_desc, desc):
+            atlas = frozenlake_atlas(*desc.shape)
+            self.tile_renderer = TileRenderer(atlas) if atlas is not None else None
+            self.cell_kinds, self.cell_desc = frozenlake_cell_kinds(desc), desc.copy()
+        if self.tile_renderer is None:
+            return self.gym_env._render_gui(mode='rgb_array')
+        return self.tile_renderer.render(frozenlake_tile_ids(self.cell_kinds, self.gym_env.s))
+
     def _get_text_representation(self):
         room_state = copy.deepcopy(self.gym_env.desc)
         
@@ -19,6 +19,11 @@ class FrozenLakeEnvConfig(BaseEnvConfig):
     grounding_reward_weight: float = 0.5
     worldmodeling_reward_weight: float = 0.5
     
+    # seeded maps (see map_bank.py), seeds missing from the bank are generated live
+    map_bank_path: Optional[str] = None
+    # compose vision frames from a tile atlas (see vagen/env/utils/tile_renderer.py), pixel-identical to gymnasium's rgb_array
+    use_tile_renderer: bool = True
+    
     def config_id(self) -> str:
         id_fields=["is_slippery", "size", "p", "render_mode", "max_actions_per_step", "min_actions_to_succeed","format_reward"]
         id_str = ",".join([f"{field.name}={getattr(self, field.name)}" for field in fields(self) if field.name in id_fields])
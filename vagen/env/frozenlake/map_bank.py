@@ -0,0 +1,166 @@
+"""
+Seed-indexed bank of FrozenLake maps.
+
+The map of seed k is generate_random_map(size, p, seed=k): boards are rejection-sampled until
+the goal is reachable from the start. Building the bank draws candidate boards for many
+seeds with each seed's own generator (a few candidates ahead, the draws do not depend on the
+validity checks) and checks all of them at once with a vectorized flood fill, keeping the
+first valid candidate of every seed. The result is identical to calling generate_random_map
+per seed.
+
+    python -m vagen.env.frozenlake.map_bank --output ./frozenlake_4x4.npy --num_seeds 100000 --size 4
+
+The bank is a (num_seeds, size, size) array of map characters plus a .json sidecar.
+"""
+import os
+import json
+import argparse
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+from gymnasium.utils import seeding
+
+
+def reachable(boards: np.ndarray) -> np.ndarray:
+    """
+    Whether the goal can be reached from the start on every board, same as utils.is_valid.
+
+    Args:
+        boards: (num_boards, size, size) array of "S", "F", "H", "G"
+
+    Returns:
+        (num_boards,) bool array
+    """
+    passable = boards != "H"
+    reach = boards == "S"
+    while True:
+        grown = reach.copy()
+        grown[:, 1:, :] |= reach[:, :-1, :]
+        grown[:, :-1, :] |= reach[:, 1:, :]
+        grown[:, :, 1:] |= reach[:, :, :-1]
+        grown[:, :, :-1] |= reach[:, :, 1:]
+        grown &= passable
+        if np.array_equal(grown, reach):
+            break
+        reach = grown
+    return (reach & (boards == "G")).any(axis=(1, 2))
+
+
+def _draw_candidate(np_random, size: int, p: float) -> np.ndarray:
+    """One iteration of generate_random_map's rejection loop"""
+    p = min(1, p)
+    board = np_random.choice(["F", "H"], (size, size), p=[p, 1 - p])
+    while True:
+        start_r = np_random.integers(0, size)
+        start_c = np_random.integers(0, size)
+        goal_r = np_random.integers(0, size)
+        goal_c = np_random.integers(0, size)
+        if (start_r, start_c) != (goal_r, goal_c):
+            break
+    board[start_r][start_c] = "S"
+    board[goal_r][goal_c] = "G"
+    return board
+
+
+def generate_maps(seeds: List[int], size: int = 4, p: float = 0.8, lookahead: int = 4) -> np.ndarray:
+    """
+    generate_random_map(size, p, seed) for many seeds at once.
+
+    Args:
+        seeds: Seeds
+        size: Size of each side of the grid
+        p: Probability that a tile is frozen
+        lookahead: Candidates drawn per seed and round
+
+    Returns:
+        (len(seeds), size, size) array of map characters
+    """
+    generators = [seeding.np_random(seed)[0] for seed in seeds]
+    maps = np.empty((len(seeds), size, size), dtype="<U1")
+    pending = list(range(len(seeds)))
+    # Most first candidates are valid, only seeds that need more draw several ahead
+    num_ahead = 1
+    while pending:
+        candidates = np.stack([
+            _draw_candidate(generators[i], size, p) for i in pending for _ in range(num_ahead)
+        ]).reshape(len(pending), num_ahead, size, size)
+        valid = reachable(candidates.reshape(-1, size, size)).reshape(len(pending), num_ahead)
+        still_pending = []
+        for row, i in enumerate(pending):
+            if valid[row].any():
+                maps[i] = candidates[row, np.argmax(valid[row])]
+            else:
+                still_pending.append(i)
+        pending = still_pending
+        num_ahead = lookahead
+    return maps
+
+
+def build_map_bank(output_path: str, seed_start: int, num_seeds: int, size: int = 4, p: float = 0.8,
+                   chunk_size: int = 4096) -> str:
+    """
+    Generate the maps of seeds [seed_start, seed_start + num_seeds) and write them to a bank.
+
+    Args:
+        output_path: Path of the .npy file, the parameters are written to output_path + ".json"
+        seed_start: First seed
+        num_seeds: Number of consecutive seeds
+        size: Map size, as in FrozenLakeEnvConfig
+        p: Probability of a frozen tile, as in FrozenLakeEnvConfig
+        chunk_size: Seeds generated per vectorized batch
+
+    Returns:
+        output_path
+    """
+    maps = np.lib.format.open_memmap(output_path, mode="w+", dtype="S1", shape=(num_seeds, size, size))
+    for start in range(0, num_seeds, chunk_size):
+        seeds = range(seed_start + start, seed_start + min(start + chunk_size, num_seeds))
+        maps[start:start + len(seeds)] = generate_maps(list(seeds), size=size, p=p).astype("S1")
+    maps.flush()
+    del maps
+    with open(output_path + ".json", "w") as f:
+        json.dump({"seed_start": seed_start, "num_seeds": num_seeds, "size": size, "p": p}, f, indent=2)
+    print(f"Wrote {num_seeds} maps to {output_path}")
+    return output_path
+
+
+class FrozenLakeMapBank:
+    """Read-only view of a map bank"""
+
+    def __init__(self, path: str):
+        with open(path + ".json") as f:
+            self.meta = json.load(f)
+        self.seed_start = self.meta["seed_start"]
+        self.num_seeds = self.meta["num_seeds"]
+        self.maps = np.load(path, mmap_mode="r")
+
+    def matches(self, size: int, p: float) -> bool:
+        """Whether the bank was generated with the given parameters"""
+        return size == self.meta["size"] and p == self.meta["p"]
+
+    def get(self, seed) -> Optional[List[str]]:
+        """Map of a seed in the format generate_random_map returns, None if not in the bank"""
+        if seed is None:
+            return None
+        index = int(seed) - self.seed_start
+        if not 0 <= index < self.num_seeds:
+            return None
+        return [row.tobytes().decode() for row in self.maps[index]]
+
+
+@lru_cache(maxsize=None)
+def load_map_bank(path: str) -> FrozenLakeMapBank:
+    """Open a map bank once per process"""
+    return FrozenLakeMapBank(os.path.expanduser(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, required=True, help="Path of the map bank .npy file")
+    parser.add_argument("--seed_start", type=int, default=0, help="First seed")
+    parser.add_argument("--num_seeds", type=int, default=100000, help="Number of consecutive seeds")
+    parser.add_argument("--size", type=int, default=4, help="Map size")
+    parser.add_argument("--p", type=float, default=0.8, help="Probability of a frozen tile")
+    args = parser.parse_args()
+    build_map_bank(args.output, seed_start=args.seed_start, num_seeds=args.num_seeds, size=args.size, p=args.p)
@@ -5,6 +5,7 @@ from vagen.server.serial import serialize_observation
 
 from .env import FrozenLakeEnv
 from .env_config import FrozenLakeEnvConfig
+from .batch_engine import FrozenLakeBatchEngine
 from ..base.base_service_config import BaseServiceConfig
 from vagen.env.utils.state_reward_text_utils import service_state_reward_wrapper_v2 as service_state_reward_wrapper
 from .prompt import visual_reasoning_reward_prompt
@@ -27,6 +28,8 @@ class FrozenLakeService(BaseService):
         self.environments = {}
         self.env_configs = {}
         self.config= config
+        # Vectorized stepping of all environments, see batch_engine.py
+        self.engine = FrozenLakeBatchEngine() if self.config.get('use_batch_engine', False) else None
         if self.config.use_state_reward:
             self.top_strings_tracker_grounding = TopKStringTracker(self.config.top_strings_m)
             self.top_strings_tracker_worldmodeling = TopKStringTracker(self.config.top_strings_m)
@@ -127,6 +130,15 @@ class FrozenLakeService(BaseService):
                 else:
                     results[env_id] = result
         
+        if self.engine is not None:
+            for env_id, result in results.items():
+                env = self.environments.get(env_id)
+                # The state reward wrapper needs per-env stepping around get_env_state
+                if env is not None and "error" not in result[1] and not env.config.get('use_state_reward', False):
+                    self.engine.attach(env_id, env.gym_env)
+                else:
+                    self.engine.detach(env_id)
+        
         return results
     
     @service_state_reward_wrapper
@@ -143,6 +155,11 @@ class FrozenLakeService(BaseService):
         """
         results = {}
         
+        if self.engine is not None:
+            batched = {env_id: action for env_id, action in ids2actions.items() if env_id in self.engine}
+            results.update(self._step_batch_engine(batched))
+            ids2actions = {env_id: action for env_id, action in ids2actions.items() if env_id not in results}
+        
         # Define worker function
         def step_single_env(env_id, action):
             try:
@@ -176,6 +193,46 @@ class FrozenLakeService(BaseService):
         
         return results
     
+    def _step_batch_engine(self, ids2actions: Dict[Any, Any]) -> Dict[Any, Tuple[Dict, float, bool, Dict]]:
+        """
+        Same as FrozenLakeEnv.step for every environment, but the k-th action of all environments
+        is applied at once by the batch engine.
+        
+        Args:
+            ids2actions: Attached environment IDs mapped to LLM responses
+            
+        Returns:
+            A dictionary mapping environment IDs to tuples of the form (observation, reward, done, info)
+        """
+        steps = {env_id: self.environments[env_id]._begin_step(action) for env_id, action in ids2actions.items()}
+        running = set(steps.keys())
+        action_index = 0
+        while running:
+            ids2action_ints = {}
+            for env_id in list(running):
+                step, env = steps[env_id], self.environments[env_id]
+                actions = step["rst"]['actions']
+                if action_index >= len(actions):
+                    running.discard(env_id)
+                elif actions[action_index] in env.ACTION_LOOKUP:
+                    ids2action_ints[env_id] = env.ACTION_LOOKUP[actions[action_index]]
+                else:
+                    step["metrics"]['turn_metrics']['action_is_valid'] = False
+                    running.discard(env_id)
+            for env_id, (step_reward, terminated) in self.engine.step(ids2action_ints).items():
+                step = steps[env_id]
+                self.environments[env_id]._record_action(step, step["rst"]['actions'][action_index], step_reward)
+                assert terminated == step["done"]
+                if step["done"]:
+                    running.discard(env_id)
+            action_index += 1
+        
+        results = {}
+        for env_id, step in steps.items():
+            observation, reward, done, info = self.environments[env_id]._end_step(step)
+            results[env_id] = (serialize_observation(observation), reward, done, info)
+        return results
+    
     def compute_reward_batch(self, env_ids: List[str]) -> Dict[Any, float]:
         """
         Compute the total reward for multiple FrozenLake environments in parallel.
@@ -296,8 +353,11 @@ class FrozenLakeService(BaseService):
                 if error:
                     print(f"Error closing environment: {error}")
         
-        # Remove closed environments from dictionaries
+        # Remove closed environments and their uncollected state rewards
+        self.discard_state_rewards(env_ids)
         for env_id in env_ids:
+            if self.engine is not None:
+                self.engine.detach(env_id)
             self.environments.pop(env_id, None)
             self.env_configs.pop(env_id, None)
     
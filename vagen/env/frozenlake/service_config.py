@@ -7,4 +7,5 @@ class FrozenLakeServiceConfig(BaseServiceConfig):
     device: Dict[str, Any] = field(default_factory=lambda: {"clip": 0})
     use_state_reward: bool = False
     top_strings_m: int = 1000
-    top_strings_k: int = 5
\ No newline at end of file
+    top_strings_k: int = 5
+    use_batch_engine: bool = False # step all environments with the vectorized engine in batch_engine.py
@@ -282,7 +282,8 @@ class NavigationService(BaseService):
                 if error:
                     print(f"Error closing environment: {error}")
         
-        # Remove closed environments from dictionaries
+        # Remove closed environments and their uncollected state rewards
+        self.discard_state_rewards(env_ids)
         for env_id in env_ids:
             self.environments.pop(env_id, None)
             self.env_configs.pop(env_id, None)
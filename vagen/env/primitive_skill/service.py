@@ -1,12 +1,12 @@
 from typing import Dict, List, Tuple, Optional, Any, Union
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, Future, TimeoutError as FutureTimeoutError
 import threading
+import itertools
 import os
 import numpy as np
 import time
 import logging
 import multiprocessing as mp
-from queue import Empty
 from functools import partial
 import torch
 from vagen.env.base.base_service import BaseService
@@ -67,6 +67,12 @@ class PrimitiveSkillService(BaseService):
         
         # Initialize communication queues
         self._setup_mp_queues()
+        
+        # Results are routed to futures by task ID, one dispatcher thread per worker process
+        self._task_ids = itertools.count()
+        self._pending = [{} for _ in range(self.max_process_workers)]  # task_id -> (future, command)
+        self._pending_lock = threading.Lock()
+        self._dispatchers = []
     
     def _assign_devices_to_processes(self):
         """
@@ -139,6 +145,82 @@ class PrimitiveSkillService(BaseService):
         # Create thread pool for local thread-based parallelism
         thread_pool = ThreadPoolExecutor(max_workers=max_thread_workers)
         
+        def handle_command(command, args):
+            """Run one environment command, returning its result or raising with the error message"""
+            if command == "create":
+                # Create a new environment
+                env_id, config = args
+                
+                # Verify environment type
+                env_name = config.get('env_name', 'primitive_skill')
+                if env_name != 'primitive_skill':
+                    raise Exception(f"Expected environment type 'primitive_skill', got '{env_name}'")
+                
+                try:
+                    # Create environment config
+                    env_config_dict = config.get('env_config', {})
+                    env_config = PrimitiveSkillEnvConfig(**env_config_dict)
+                    
+                    # Create environment
+                    env = PrimitiveSkillEnv(env_config)
+                except Exception as e:
+                    raise Exception(f"Error creating environment {env_id}: {str(e)}")
+                
+                # Store locally
+                local_environments[env_id] = env
+                local_env_configs[env_id] = env_config
+                return env_id
+            
+            env_id = args[0] if command in ("reset", "step") else args
+            if env_id not in local_environments:
+                raise Exception(f"Environment {env_id} not found in process {process_id}")
+            env = local_environments[env_id]
+            
+            if command == "reset":
+                # Reset an environment
+                try:
+                    observation, info = env.reset(seed=args[1])
+                    return serialize_observation(observation), info
+                except Exception as e:
+                    raise Exception(f"Error resetting environment {env_id}: {str(e)}")
+            
+            elif command == "step":
+                # Step an environment
+                try:
+                    observation, reward, done, info = env.step(args[1])
+                    return serialize_observation(observation), reward, done, info
+                except Exception as e:
+                    raise Exception(f"Error stepping environment {env_id}: {str(e)}")
+            
+            elif command == "compute_reward":
+                # Compute reward for an environment
+                try:
+                    return env.compute_reward()
+                except Exception as e:
+                    raise Exception(f"Error computing reward for environment {env_id}: {str(e)}")
+            
+            elif command == "system_prompt":
+                # Get system prompt for an environment
+                try:
+                    return env.system_prompt()
+                except Exception as e:
+                    raise Exception(f"Error getting system prompt for environment {env_id}: {str(e)}")
+            
+            elif command == "close":
+                # Close an environment
+                try:
+                    env.close()
+                except Exception as e:
+                    raise Exception(f"Error closing environment {env_id}: {str(e)}")
+                
+                # Remove from local storage
+                local_environments.pop(env_id, None)
+                local_env_configs.pop(env_id, None)
+                return True
+            
+            # Unknown command
+            raise Exception(f"Unknown command: {command}")
+        
         # Main worker loop
         running = True
         while running:
@@ -146,126 +228,28 @@ class PrimitiveSkillService(BaseService):
                 # Get task from queue
                 command, task_id, args = task_queue.get()
                 
-                if command == "create":
-                    # Create a new environment
-                    env_id, config = args
-                    
-                    try:
-                        # Verify environment type
-                        env_name = config.get('env_name', 'primitive_skill')
-                        if env_name != 'primitive_skill':
-                            result_queue.put((task_id, "error", f"Expected environment type 'primitive_skill', got '{env_name}'"))
-                            continue
-                        
-                        # Create environment config
-                        env_config_dict = config.get('env_config', {})
-                        env_config = PrimitiveSkillEnvConfig(**env_config_dict)
-                        
-                        # Create environment
-                        env = PrimitiveSkillEnv(env_config)
-                        
-                        # Store locally
-                        local_environments[env_id] = env
-                        local_env_configs[env_id] = env_config
-                        
-                        result_queue.put((task_id, "success", env_id))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error creating environment {env_id}: {str(e)}"))
-                
-                elif command == "reset":
-                    # Reset an environment
-                    env_id, seed = args
-                    
-                    try:
-                        if env_id not in local_environments:
-                            result_queue.put((task_id, "error", f"Environment {env_id} not found in process {process_id}"))
-                            continue
-                        
-                        env = local_environments[env_id]
-                        observation, info = env.reset(seed=seed)
-                        serialized_observation = serialize_observation(observation)
-                        
-                        result_queue.put((task_id, "success", (serialized_observation, info)))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error resetting environment {env_id}: {str(e)}"))
-                
-                elif command == "step":
-                    # Step an environment
-                    env_id, action = args
-                    
-                    try:
-                        if env_id not in local_environments:
-                            result_queue.put((task_id, "error", f"Environment {env_id} not found in process {process_id}"))
-                            continue
-                        
-                        env = local_environments[env_id]
-                        observation, reward, done, info = env.step(action)
-                        serialized_observation = serialize_observation(observation)
-                        
-                        result_queue.put((task_id, "success", (serialized_observation, reward, done, info)))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error stepping environment {env_id}: {str(e)}"))
-                
-                elif command == "compute_reward":
-                    # Compute reward for an environment
-                    env_id = args
-                    
-                    try:
-                        if env_id not in local_environments:
-                            result_queue.put((task_id, "error", f"Environment {env_id} not found in process {process_id}"))
-                            continue
-                        
-                        env = local_environments[env_id]
-                        reward = env.compute_reward()
-                        
-                        result_queue.put((task_id, "success", reward))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error computing reward for environment {env_id}: {str(e)}"))
-                
-                elif command == "system_prompt":
-                    # Get system prompt for an environment
-                    env_id = args
-                    
-                    try:
-                        if env_id not in local_environments:
-                            result_queue.put((task_id, "error", f"Environment {env_id} not found in process {process_id}"))
-                            continue
-                        
-                        env = local_environments[env_id]
-                        prompt = env.system_prompt()
-                        
-                        result_queue.put((task_id, "success", prompt))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error getting system prompt for environment {env_id}: {str(e)}"))
-                
-                elif command == "close":
-                    # Close an environment
-                    env_id = args
-                    
-                    try:
-                        if env_id not in local_environments:
-                            result_queue.put((task_id, "error", f"Environment {env_id} not found in process {process_id}"))
-                            continue
-                        
-                        env = local_environments[env_id]
-                        env.close()
-                        
-                        # Remove from local storage
-                        local_environments.pop(env_id, None)
-                        local_env_configs.pop(env_id, None)
-                        
-                        result_queue.put((task_id, "success", True))
-                    except Exception as e:
-                        result_queue.put((task_id, "error", f"Error closing environment {env_id}: {str(e)}"))
-                
-                elif command == "exit":
+                if command == "exit":
                     # Exit worker process
                     running = False
                     result_queue.put((task_id, "success", "Worker exiting"))
                 
+                elif command == "batch":
+                    # One message for the same command on several environments, answered with
+                    # one (status, result) per item in a single message
+                    sub_command, items = args
+                    item_results = []
+                    for item in items:
+                        try:
+                            item_results.append(("success", handle_command(sub_command, item)))
+                        except Exception as e:
+                            item_results.append(("error", str(e)))
+                    result_queue.put((task_id, "success", item_results))
+                
                 else:
-                    # Unknown command
-                    result_queue.put((task_id, "error", f"Unknown command: {command}"))
+                    try:
+                        result_queue.put((task_id, "success", handle_command(command, args)))
+                    except Exception as e:
+                        result_queue.put((task_id, "error", str(e)))
             
             except Exception as e:
                 # Handle any unexpected exceptions
@@ -300,6 +284,43 @@ class PrimitiveSkillService(BaseService):
             self.processes.append(p)
             
             self.logger.info(f"Started worker process {i} with PID {p.pid} on GPU device {device_id}")
+        
+        # Start the dispatchers after forking so the workers do not inherit their threads
+        for i in range(self.max_process_workers):
+            dispatcher = threading.Thread(target=self._dispatch_results, args=(i,), daemon=True)
+            dispatcher.start()
+            self._dispatchers.append(dispatcher)
+    
+    def _dispatch_results(self, process_id):
+        """
+        Dispatcher thread of a worker process: resolve the futures of its results by task ID.
+        
+        Args:
+            process_id: Process ID whose result queue this thread reads
+        """
+        while True:
+            message = self.result_queues[process_id].get()
+            if message is None:
+                break
+            task_id, status, result = message
+            if task_id == -1:
+                # Unsolicited worker messages (device setup, dataset loading, crashes)
+                if status == "error":
+                    self.logger.error(result)
+                elif status == "warning":
+                    self.logger.warning(result)
+                else:
+                    self.logger.info(result)
+                continue
+            with self._pending_lock:
+                future, command = self._pending[process_id].pop(task_id, (None, None))
+            if future is None:
+                # Abandoned after a timeout
+                continue
+            if status == "success":
+                future.set_result(result)
+            else:
+                future.set_exception(Exception(f"Command {command} failed: {result}"))
     
     def _assign_to_process(self, env_id):
         """
@@ -320,6 +341,31 @@ class PrimitiveSkillService(BaseService):
         target_pid = process_loads.index(min(process_loads))
         return target_pid
     
+    def _submit(self, process_id, command, args):
+        """
+        Send a command to a worker process without waiting for it.
+        
+        Args:
+            process_id: Process ID to send the command to
+            command: Command to execute
+            args: Command arguments
+            
+        Returns:
+            Future of the command result
+        """
+        future = Future()
+        with self._pending_lock:
+            task_id = next(self._task_ids)
+            self._pending[process_id][task_id] = (future, command)
+        future.task_id = task_id
+        self.task_queues[process_id].put((command, task_id, args))
+        return future
+    
+    def _abandon(self, process_id, future):
+        """Forget a timed-out command, its late result is dropped by the dispatcher"""
+        with self._pending_lock:
+            self._pending[process_id].pop(future.task_id, None)
+    
     def _send_command(self, process_id, command, env_id, args):
         """
         Send a command to a worker process and wait for the result.
@@ -333,24 +379,60 @@ class PrimitiveSkillService(BaseService):
         Returns:
             Command result
         """
-        # Generate a unique task ID
-        task_id = hash(f"{command}_{env_id}_{time.time()}")
+        future = self._submit(process_id, command, args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._abandon(process_id, future)
+            raise Exception(f"Timeout waiting for result of command {command} for environment {env_id}")
+    
+    def _group_by_process(self, env_args):
+        """
+        Group (env_id, args) pairs by the process holding the environment, unknown IDs are skipped.
         
-        # Send command to process
-        self.task_queues[process_id].put((command, task_id, args))
+        Returns:
+            Dictionary mapping process IDs to lists of (env_id, args)
+        """
+        process_items = {}
+        for env_id, args in env_args:
+            if env_id in self.environments:
+                process_items.setdefault(self.environments[env_id], []).append((env_id, args))
+        return process_items
+    
+    def _run_batch(self, command, process_items):
+        """
+        Run a command on many environments with one message per worker process. All workers
+        work concurrently; each runs its items in order.
         
-        # Wait for result
-        while True:
+        Args:
+            command: Command to execute
+            process_items: Dictionary mapping process IDs to lists of (env_id, args)
+            
+        Returns:
+            Dictionary mapping environment IDs to (result, error), error is None on success
+        """
+        futures = {
+            process_id: self._submit(process_id, "batch", (command, [args for _, args in items]))
+            for process_id, items in process_items.items()
+        }
+        # every item of the largest batch gets the per-command timeout
+        deadline = time.monotonic() + self.timeout * max([len(items) for items in process_items.values()] + [1])
+        results = {}
+        for process_id, future in futures.items():
+            items = process_items[process_id]
             try:
-                result_task_id, status, result = self.result_queues[process_id].get(timeout=self.timeout)
-                if result_task_id == task_id:
-                    if status == "success":
-                        return result
-                    else:
-                        raise Exception(f"Command {command} failed: {result}")
-            except Empty:
-                # Timeout waiting for result
-                raise Exception(f"Timeout waiting for result of command {command} for environment {env_id}")
+                item_results = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                self._abandon(process_id, future)
+                item_results = [("error", f"Timeout waiting for result of command {command} in process {process_id}")] * len(items)
+            except Exception as e:
+                item_results = [("error", str(e))] * len(items)
+            for (env_id, _), (status, result) in zip(items, item_results):
+                if status == "success":
+                    results[env_id] = (result, None)
+                else:
+                    results[env_id] = (None, f"Command {command} failed: {result}")
+        return results
     
     def create_environments_batch(self, ids2configs: Dict[Any, Any]) -> None:
         """
@@ -416,42 +498,14 @@ class PrimitiveSkillService(BaseService):
         """
         results = {}
         
-        # Group environments by process
-        process_envs = {}
-        for env_id, seed in ids2seeds.items():
-            if env_id in self.environments:
-                process_id = self.environments[env_id]
-                if process_id not in process_envs:
-                    process_envs[process_id] = []
-                process_envs[process_id].append((env_id, seed))
-        
-        # Function to reset environments in a process
-        def reset_envs_in_process(process_id, env_seed_pairs):
-            local_results = {}
-            
-            for env_id, seed in env_seed_pairs:
-                try:
-                    # Send reset command to process
-                    result = self._send_command(process_id, "reset", env_id, (env_id, seed))
-                    local_results[env_id] = result
-                except Exception as e:
-                    self.logger.error(f"Failed to reset environment {env_id}: {str(e)}")
-                    local_results[env_id] = ({}, {"error": str(e)})
-            
-            return local_results
-        
-        # Use ThreadPoolExecutor for parallel reset requests
-        with ThreadPoolExecutor(max_workers=self.max_process_workers) as executor:
-            # Submit reset tasks grouped by process
-            futures = [
-                executor.submit(reset_envs_in_process, process_id, env_seed_pairs)
-                for process_id, env_seed_pairs in process_envs.items()
-            ]
-            
-            # Collect results
-            for future in as_completed(futures):
-                local_results = future.result()
-                results.update(local_results)
+        # One reset message per process, all processes in parallel
+        process_items = self._group_by_process((env_id, (env_id, seed)) for env_id, seed in ids2seeds.items())
+        for env_id, (result, error) in self._run_batch("reset", process_items).items():
+            if error is None:
+                results[env_id] = result
+            else:
+                self.logger.error(f"Failed to reset environment {env_id}: {error}")
+                results[env_id] = ({}, {"error": error})
         
         return results
     
@@ -469,42 +523,14 @@ class PrimitiveSkillService(BaseService):
         """
         results = {}
         
-        # Group environments by process
-        process_envs = {}
-        for env_id, action in ids2actions.items():
-            if env_id in self.environments:
-                process_id = self.environments[env_id]
-                if process_id not in process_envs:
-                    process_envs[process_id] = []
-                process_envs[process_id].append((env_id, action))
-        
-        # Function to step environments in a process
-        def step_envs_in_process(process_id, env_action_pairs):
-            local_results = {}
-            
-            for env_id, action in env_action_pairs:
-                try:
-                    # Send step command to process
-                    result = self._send_command(process_id, "step", env_id, (env_id, action))
-                    local_results[env_id] = result
-                except Exception as e:
-                    self.logger.error(f"Failed to step environment {env_id}: {str(e)}")
-                    local_results[env_id] = ({}, 0.0, True, {"error": str(e)})
-            
-            return local_results
-        
-        # Use ThreadPoolExecutor for parallel step requests
-        with ThreadPoolExecutor(max_workers=self.max_process_workers) as executor:
-            # Submit step tasks grouped by process
-            futures = [
-                executor.submit(step_envs_in_process, process_id, env_action_pairs)
-                for process_id, env_action_pairs in process_envs.items()
-            ]
-            
-            # Collect results
-            for future in as_completed(futures):
-                local_results = future.result()
-                results.update(local_results)
+        # One step message per process, all processes in parallel
+        process_items = self._group_by_process((env_id, (env_id, action)) for env_id, action in ids2actions.items())
+        for env_id, (result, error) in self._run_batch("step", process_items).items():
+            if error is None:
+                results[env_id] = result
+            else:
+                self.logger.error(f"Failed to step environment {env_id}: {error}")
+                results[env_id] = ({}, 0.0, True, {"error": error})
         
         return results
     
@@ -520,42 +546,14 @@ class PrimitiveSkillService(BaseService):
         """
         results = {}
         
-        # Group environments by process
-        process_envs = {}
-        for env_id in env_ids:
-            if env_id in self.environments:
-                process_id = self.environments[env_id]
-                if process_id not in process_envs:
-                    process_envs[process_id] = []
-                process_envs[process_id].append(env_id)
-        
-        # Function to compute rewards for environments in a process
-        def compute_rewards_in_process(process_id, process_env_ids):
-            local_results = {}
-            
-            for env_id in process_env_ids:
-                try:
-                    # Send compute_reward command to process
-                    result = self._send_command(process_id, "compute_reward", env_id, env_id)
-                    local_results[env_id] = result
-                except Exception as e:
-                    self.logger.error(f"Failed to compute reward for environment {env_id}: {str(e)}")
-                    local_results[env_id] = 0.0
-            
-            return local_results
-        
-        # Use ThreadPoolExecutor for parallel reward computation requests
-        with ThreadPoolExecutor(max_workers=self.max_process_workers) as executor:
-            # Submit computation tasks grouped by process
-            futures = [
-                executor.submit(compute_rewards_in_process, process_id, process_env_ids)
-                for process_id, process_env_ids in process_envs.items()
-            ]
-            
-            # Collect results
-            for future in as_completed(futures):
-                local_results = future.result()
-                results.update(local_results)
+        # One compute_reward message per process, all processes in parallel
+        process_items = self._group_by_process((env_id, env_id) for env_id in env_ids)
+        for env_id, (result, error) in self._run_batch("compute_reward", process_items).items():
+            if error is None:
+                results[env_id] = result
+            else:
+                self.logger.error(f"Failed to compute reward for environment {env_id}: {error}")
+                results[env_id] = 0.0
         
         return results
         
@@ -571,42 +569,14 @@ class PrimitiveSkillService(BaseService):
         """
         results = {}
         
-        # Group environments by process
-        process_envs = {}
-        for env_id in env_ids:
-            if env_id in self.environments:
-                process_id = self.environments[env_id]
-                if process_id not in process_envs:
-                    process_envs[process_id] = []
-                process_envs[process_id].append(env_id)
-        
-        # Function to get system prompts for environments in a process
-        def get_system_prompts_in_process(process_id, process_env_ids):
-            local_results = {}
-            
-            for env_id in process_env_ids:
-                try:
-                    # Send system_prompt command to process
-                    result = self._send_command(process_id, "system_prompt", env_id, env_id)
-                    local_results[env_id] = result
-                except Exception as e:
-                    self.logger.error(f"Failed to get system prompt for environment {env_id}: {str(e)}")
-                    local_results[env_id] = ""
-            
-            return local_results
-        
-        # Use ThreadPoolExecutor for parallel system prompt requests
-        with ThreadPoolExecutor(max_workers=self.max_process_workers) as executor:
-            # Submit system prompt tasks grouped by process
-            futures = [
-                executor.submit(get_system_prompts_in_process, process_id, process_env_ids)
-                for process_id, process_env_ids in process_envs.items()
-            ]
-            
-            # Collect results
-            for future in as_completed(futures):
-                local_results = future.result()
-                results.update(local_results)
+        # One system_prompt message per process, all processes in parallel
+        process_items = self._group_by_process((env_id, env_id) for env_id in env_ids)
+        for env_id, (result, error) in self._run_batch("system_prompt", process_items).items():
+            if error is None:
+                results[env_id] = result
+            else:
+                self.logger.error(f"Failed to get system prompt for environment {env_id}: {error}")
+                results[env_id] = ""
         
         return results
     
@@ -621,37 +591,14 @@ class PrimitiveSkillService(BaseService):
         if env_ids is None:
             env_ids = list(self.environments.keys())
         
-        # Group environments by process
-        process_envs = {}
-        for env_id in env_ids:
-            if env_id in self.environments:
-                process_id = self.environments[env_id]
-                if process_id not in process_envs:
-                    process_envs[process_id] = []
-                process_envs[process_id].append(env_id)
-        
-        # Function to close environments in a process
-        def close_envs_in_process(process_id, process_env_ids):
-            for env_id in process_env_ids:
-                try:
-                    # Send close command to process
-                    self._send_command(process_id, "close", env_id, env_id)
-                except Exception as e:
-                    self.logger.error(f"Failed to close environment {env_id}: {str(e)}")
-        
-        # Use ThreadPoolExecutor for parallel close requests
-        with ThreadPoolExecutor(max_workers=self.max_process_workers) as executor:
-            # Submit close tasks grouped by process
-            futures = [
-                executor.submit(close_envs_in_process, process_id, process_env_ids)
-                for process_id, process_env_ids in process_envs.items()
-            ]
-            
-            # Wait for all tasks to complete
-            for future in as_completed(futures):
-                future.result()
+        # One close message per process, all processes in parallel
+        process_items = self._group_by_process((env_id, env_id) for env_id in env_ids)
+        for env_id, (_, error) in self._run_batch("close", process_items).items():
+            if error is not None:
+                self.logger.error(f"Failed to close environment {env_id}: {error}")
         
-        # Remove closed environments from dictionaries
+        # Remove closed environments and their uncollected state rewards
+        self.discard_state_rewards(env_ids)
         for env_id in env_ids:
             self.environments.pop(env_id, None)
             self.env_configs.pop(env_id, None)
@@ -673,6 +620,13 @@ class PrimitiveSkillService(BaseService):
             except:
                 pass
         
+        # Stop the result dispatchers
+        for result_queue in self.result_queues:
+            try:
+                result_queue.put(None)
+            except:
+                pass
+        
         # Wait for processes to exit
         for p in self.processes:
             try:
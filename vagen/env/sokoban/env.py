@@ -2,10 +2,13 @@ from vagen.env.base.base_env import BaseEnv
 import gym
 from gym_sokoban.envs.sokoban_env import SokobanEnv as GymSokobanEnv
 from .utils import generate_room
+from .level_bank import load_level_bank
 from typing import Dict
-from vagen.env.utils.env_utils import NoLoggerWarnings, set_seed
+from vagen.env.utils.env_utils import NoLoggerWarnings
 from vagen.env.utils.context_utils import convert_numpy_to_PIL
+from vagen.env.utils.tile_renderer import TileRenderer, sokoban_atlas, sokoban_tile_ids
 import numpy as np
+import random
 from vagen.env.utils.parse_utils import PARSE_FUNC_MAP
 from .prompt import (
     system_prompt, 
@@ -51,17 +54,36 @@ class SokobanEnv(BaseEnv):
     
         
         self.parse_func = PARSE_FUNC_MAP[self.config.prompt_format]
+
+        # Optional pre-generated levels, resets of seeds in the bank skip generate_room
+        self.level_bank = None
+        if self.config.get('level_bank_path', None):
+            self.level_bank = load_level_bank(self.config.level_bank_path)
+            if not self.level_bank.matches(self.env.dim_room, self.env.num_boxes,
+                                           self.config.get('search_depth', 100), self.env.num_gen_steps):
+                raise ValueError(f"Level bank {self.config.level_bank_path} was generated with different parameters: {self.level_bank.meta}")
+
+        # Vision frames from the tile atlas, only cells that changed since the last frame are redrawn
+        self.tile_renderer = None
+        if self.config.render_mode == 'vision' and self.config.get('use_tile_renderer', True):
+            self.tile_renderer = TileRenderer(sokoban_atlas())
         
     def reset(self, seed=None):
         with NoLoggerWarnings():
             try:
-                with set_seed(seed):
-                    self.env.room_fixed, self.env.room_state, self.env.box_mapping, action_sequence = generate_room(
+                level = self.level_bank.get(seed) if self.level_bank is not None else None
+                if level is None:
+                    # Per-call generators give the same room as set_seed(seed) without touching global state
+                    room_fixed, room_state, box_mapping, action_sequence = generate_room(
                         dim=self.env.dim_room,
                         num_steps=self.env.num_gen_steps,
                         num_boxes=self.env.num_boxes,
                         search_depth=self.config.get('search_depth', 100),
+                        rng=random.Random(seed),
+                        np_rng=np.random.RandomState(seed),
                     )
+                    level = (room_fixed, room_state, box_mapping)
+                self.env.room_fixed, self.env.room_state, self.env.box_mapping = level
             except (RuntimeError, RuntimeWarning) as e:
                 print("[SOKOBAN] Runtime Error/Warning: {}".format(e))
                 print("[SOKOBAN] Retry . . .")
@@ -75,6 +97,20 @@ class SokobanEnv(BaseEnv):
     
     @env_state_reward_wrapper
     def step(self, action_str: str):
+        step = self._begin_step(action_str)
+        for action in step["rst"]['actions']:
+            if action in self.ACTION_LOOKUP:
+                _, step_reward, _, _ = self.env.step(self.ACTION_LOOKUP[action])
+                self._record_action(step, action, step_reward)
+                if step["done"]:
+                    break
+            else:
+                step["metrics"]['turn_metrics']['action_is_valid'] = False
+                break
+        return self._end_step(step)
+
+    def _begin_step(self, action_str: str) -> Dict:
+        """Parse the response and start a turn, the actions are applied by step or by a batch engine"""
         rst=self.parse_func(
             response=action_str,
             special_token_list=self.config.get('special_token_list', None),
@@ -83,7 +119,6 @@ class SokobanEnv(BaseEnv):
         )
         #print("rst:", rst)
         action_list=rst['actions']
-        prev_player_position = self.env.player_position
         
         metrics={
             "turn_metrics":{
@@ -96,33 +131,36 @@ class SokobanEnv(BaseEnv):
         
         self.reward=0
         self.valid_actions=[]
-        done=False
+        return {
+            "rst": rst,
+            "metrics": metrics,
+            "prev_player_position": self.env.player_position,
+            "done": False,
+        }
+
+    def _record_action(self, step: Dict, action: str, step_reward: float) -> None:
+        """Book-keeping after one action of the turn was applied to the room"""
+        step["done"]=self._success()
+        self.reward+=step_reward
+        self.valid_actions.append(action)
+        if step["done"]:
+            step["metrics"]['traj_metrics']['success'] = True
+
+    def _end_step(self, step: Dict):
+        """Finish the turn: format reward, metrics and observation"""
+        rst, metrics = step["rst"], step["metrics"]
         info={}
         info.update(rst)
-        
-        for action in action_list:
-            if action in self.ACTION_LOOKUP:
-                action_int=self.ACTION_LOOKUP[action]
-                _,step_reward, _, _=self.env.step(action_int)
-                done=self._success()
-                self.reward+=step_reward
-                self.valid_actions.append(action)
-                if done:
-                    metrics['traj_metrics']['success'] = True
-                    break
-            else:
-                metrics['turn_metrics']['action_is_valid'] = False
-                break
         if metrics['turn_metrics']['action_is_valid'] and rst["format_correct"]:
             self.reward += self.config.format_reward
             info["is_format_rewarded"] = True
         else:
             info["is_format_rewarded"] = False
         info["metrics"] = metrics
-        metrics['turn_metrics']['action_is_effective'] = not np.array_equal(prev_player_position, self.env.player_position)
+        metrics['turn_metrics']['action_is_effective'] = not np.array_equal(step["prev_player_position"], self.env.player_position)
         self.total_reward += self.reward
 
-        return self._render(init_obs=False), self.reward, done, info
+        return self._render(init_obs=False), self.reward, step["done"], info
     
     def system_prompt(self):
         format_prompt=self.format_prompt_func(
@@ -149,8 +187,12 @@ class SokobanEnv(BaseEnv):
         
         if self.config.render_mode == 'vision':
             img_placeholder=self.config.get("image_placeholder", "<image>")
+            if self.tile_renderer is not None:
+                frame = self.tile_renderer.render(sokoban_tile_ids(self.env.room_state, self.env.room_fixed))
+            else:
+                frame = self.env.render(mode='rgb_array')
             multi_modal_data={
-                img_placeholder: [convert_numpy_to_PIL(self.env.render(mode='rgb_array'))],
+                img_placeholder: [convert_numpy_to_PIL(frame)],
                 } 
             img_str=img_placeholder
         else:
@@ -1,5 +1,6 @@
 from vagen.env.base.base_env_config import BaseEnvConfig
 from dataclasses import dataclass, field, fields
+from typing import Optional
 from .utils import generate_seeds
 @dataclass
 class SokobanEnvConfig(BaseEnvConfig):
@@ -20,6 +21,11 @@ class SokobanEnvConfig(BaseEnvConfig):
     use_state_reward: bool = False
     grounding_reward_weight: float = 0.5
     worldmodeling_reward_weight: float = 0.5
+
+    # pre-generated levels (see level_bank.py), seeds missing from the bank are generated live
+    level_bank_path: Optional[str] = None
+    # compose vision frames from a tile atlas (see vagen/env/utils/tile_renderer.py), pixel-identical to room_to_rgb
+    use_tile_renderer: bool = True
     
     def config_id(self) -> str:
         id_fields = ["dim_room", "max_steps", "num_boxes", "render_mode", "min_actions_to_succeed", "max_actions_per_step"]
@@ -0,0 +1,182 @@
+"""
+Pre-generated Sokoban levels, stored in a memory-mapped file indexed by seed.
+
+`generate_room` (random-walk topology + reverse-play search) dominates SokobanEnv.reset.
+A level bank runs it offline for a contiguous seed range and stores the result, so a reset
+becomes an O(1) lookup. The bank is a structured .npy file plus a .json sidecar holding the
+generation parameters:
+
+    python -m vagen.env.sokoban.level_bank --output ./sokoban_6x6_1box.npy \
+        --seed_start 0 --num_seeds 100000 --dim_room 6 6 --num_boxes 1
+
+and is used by setting `level_bank_path` in SokobanEnvConfig. Seeds outside the bank, or
+seeds whose generation needed a retry (the retry seed is derived from the per-process
+string hash and is therefore not reproducible), fall back to live generation.
+"""
+import os
+import json
+import random
+import argparse
+import multiprocessing as mp
+from functools import lru_cache, partial
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from .utils import generate_room
+
+
+def default_num_gen_steps(dim_room) -> int:
+    """Same default as gym_sokoban's SokobanEnv"""
+    return int(1.7 * (dim_room[0] + dim_room[1]))
+
+
+def _level_dtype(dim_room, num_boxes) -> np.dtype:
+    return np.dtype([
+        ("valid", np.uint8),
+        ("room_fixed", np.uint8, tuple(dim_room)),
+        ("room_state", np.uint8, tuple(dim_room)),
+        # (target_row, target_col, box_row, box_col) per box
+        ("box_mapping", np.int16, (num_boxes, 4)),
+    ])
+
+
+def _generate_level(seed: int, dim_room, num_gen_steps: int, num_boxes: int, search_depth: int):
+    """Generate the level SokobanEnv.reset(seed) would generate, None if that needs a retry"""
+    try:
+        room_fixed, room_state, box_mapping, _ = generate_room(
+            dim=dim_room,
+            num_steps=num_gen_steps,
+            num_boxes=num_boxes,
+            search_depth=search_depth,
+            rng=random.Random(seed),
+            np_rng=np.random.RandomState(seed),
+        )
+    except (RuntimeError, RuntimeWarning):
+        return seed, None
+    return seed, (room_fixed, room_state, box_mapping)
+
+
+def build_level_bank(output_path: str, seed_start: int, num_seeds: int, dim_room=(6, 6), num_boxes: int = 1,
+                     search_depth: int = 100, num_gen_steps: Optional[int] = None,
+                     num_processes: Optional[int] = None) -> str:
+    """
+    Generate levels for seeds [seed_start, seed_start + num_seeds) in a process pool and write them to a bank.
+
+    Args:
+        output_path: Path of the .npy file, the parameters are written to output_path + ".json"
+        seed_start: First seed
+        num_seeds: Number of consecutive seeds
+        dim_room: Room dimensions, as in SokobanEnvConfig
+        num_boxes: Number of boxes, as in SokobanEnvConfig
+        search_depth: Reverse-play search depth, as in SokobanEnvConfig
+        num_gen_steps: Random-walk steps, defaults to the gym_sokoban default for dim_room
+        num_processes: Pool size, defaults to the number of CPUs
+
+    Returns:
+        output_path
+    """
+    dim_room = tuple(int(d) for d in dim_room)
+    num_gen_steps = num_gen_steps if num_gen_steps is not None else default_num_gen_steps(dim_room)
+    num_processes = num_processes or mp.cpu_count()
+
+    levels = np.lib.format.open_memmap(
+        output_path, mode="w+", dtype=_level_dtype(dim_room, num_boxes), shape=(num_seeds,)
+    )
+    generate = partial(_generate_level, dim_room=dim_room, num_gen_steps=num_gen_steps,
+                       num_boxes=num_boxes, search_depth=search_depth)
+    num_missing = 0
+    with mp.Pool(processes=num_processes) as pool:
+        results = pool.imap_unordered(generate, range(seed_start, seed_start + num_seeds), chunksize=64)
+        for seed, level in tqdm(results, total=num_seeds, desc="Generating sokoban levels"):
+            entry = levels[seed - seed_start]
+            if level is None:
+                num_missing += 1
+                continue
+            room_fixed, room_state, box_mapping = level
+            entry["room_fixed"] = room_fixed
+            entry["room_state"] = room_state
+            entry["box_mapping"] = [tuple(target) + tuple(box) for target, box in box_mapping.items()]
+            entry["valid"] = 1
+    levels.flush()
+    del levels
+
+    with open(output_path + ".json", "w") as f:
+        json.dump({
+            "seed_start": seed_start,
+            "num_seeds": num_seeds,
+            "dim_room": list(dim_room),
+            "num_boxes": num_boxes,
+            "search_depth": search_depth,
+            "num_gen_steps": num_gen_steps,
+        }, f, indent=2)
+    print(f"Wrote {num_seeds - num_missing}/{num_seeds} levels to {output_path} ({num_missing} left to live generation)")
+    return output_path
+
+
+class SokobanLevelBank:
+    """Read-only view of a level bank, levels are read from the memory map on demand"""
+
+    def __init__(self, path: str):
+        with open(path + ".json") as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.seed_start = self.meta["seed_start"]
+        self.num_seeds = self.meta["num_seeds"]
+        self.levels = np.load(path, mmap_mode="r")
+
+    def matches(self, dim_room, num_boxes: int, search_depth: int, num_gen_steps: int) -> bool:
+        """Whether the bank was generated with the given parameters"""
+        return (
+            list(dim_room) == self.meta["dim_room"]
+            and num_boxes == self.meta["num_boxes"]
+            and search_depth == self.meta["search_depth"]
+            and num_gen_steps == self.meta["num_gen_steps"]
+        )
+
+    def get(self, seed) -> Optional[Tuple[np.ndarray, np.ndarray, Dict]]:
+        """
+        Look up the level of a seed.
+
+        Returns:
+            (room_fixed, room_state, box_mapping) with the same types generate_room returns,
+            None if the seed is not in the bank
+        """
+        if seed is None:
+            return None
+        index = int(seed) - self.seed_start
+        if not 0 <= index < self.num_seeds:
+            return None
+        entry = self.levels[index]
+        if not entry["valid"]:
+            return None
+        box_mapping = {(int(t0), int(t1)): (int(b0), int(b1)) for t0, t1, b0, b1 in entry["box_mapping"]}
+        return entry["room_fixed"].astype(int), entry["room_state"].astype(int), box_mapping
+
+
+@lru_cache(maxsize=None)
+def load_level_bank(path: str) -> SokobanLevelBank:
+    """Open a level bank once per process, all environments share the memory map"""
+    return SokobanLevelBank(os.path.expanduser(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, required=True, help="Path of the level bank .npy file")
+    parser.add_argument("--seed_start", type=int, default=0, help="First seed")
+    parser.add_argument("--num_seeds", type=int, default=100000, help="Number of consecutive seeds")
+    parser.add_argument("--dim_room", type=int, nargs=2, default=[6, 6], help="Room dimensions")
+    parser.add_argument("--num_boxes", type=int, default=1, help="Number of boxes")
+    parser.add_argument("--search_depth", type=int, default=100, help="Reverse-play search depth")
+    parser.add_argument("--num_processes", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+    build_level_bank(
+        args.output,
+        seed_start=args.seed_start,
+        num_seeds=args.num_seeds,
+        dim_room=args.dim_room,
+        num_boxes=args.num_boxes,
+        search_depth=args.search_depth,
+        num_processes=args.num_processes,
+    )
@@ -1,4 +1,5 @@
 from typing import Dict, List, Tuple, Optional, Any, Union
+from concurrent.futures import ThreadPoolExecutor
 from vagen.env.base.base_service import BaseService
 from vagen.env.base.base_service_config import BaseServiceConfig
 # from vagen.env.utils.state_reward_text_utils import service_state_reward_wrapper_v2 as service_state_reward_wrapper
@@ -6,6 +7,7 @@ from vagen.server.serial import serialize_observation
 
 from .env import SokobanEnv
 from .env_config import SokobanEnvConfig
+from .batch_engine import SokobanBatchEngines
 from vagen.env.utils.state_reward_text_utils import service_state_reward_wrapper_v3 as service_state_reward_wrapper
 from .prompt import visual_reasoning_reward_prompt
 from vagen.env.utils.state_matching import calculate_visual_reasoning_reward_bipartite,calculate_f1_with_max_matching
@@ -16,6 +18,8 @@ class SokobanService(BaseService):
         self.environments = {}
         self.env_configs = {}
         self.config = config
+        # Vectorized stepping of all rooms, see batch_engine.py
+        self.engines = SokobanBatchEngines() if self.config.get('use_batch_engine', False) else None
         if self.config.use_state_reward:
             self.top_strings_tracker_grounding = TopKStringTracker(self.config.top_strings_m)
             self.top_strings_tracker_worldmodeling = TopKStringTracker(self.config.top_strings_m)
@@ -29,21 +33,39 @@ class SokobanService(BaseService):
             self.env_configs[env_id] = env_config
     
     def reset_batch(self, ids2seeds: Dict[Any, Any]) -> Dict[Any, Tuple[Any, Any]]:
-        results = {}
-        
-        for env_id, seed in ids2seeds.items():
+        def reset_single_env(env_id, seed):
             env = self.environments[env_id]
             observation, info = env.reset(seed=seed)
             serialized_observation = serialize_observation(observation)
-            results[env_id] = (serialized_observation, info)
-        
+            return env_id, (serialized_observation, info)
+
+        # Room generation keeps no global state, so environments can be reset concurrently
+        if len(ids2seeds) <= 1 or self.config.max_workers <= 1:
+            results = dict(reset_single_env(env_id, seed) for env_id, seed in ids2seeds.items())
+        else:
+            with ThreadPoolExecutor(max_workers=self.config.max_workers) as executor:
+                futures = [executor.submit(reset_single_env, env_id, seed) for env_id, seed in ids2seeds.items()]
+                results = dict(future.result() for future in futures)
+
+        if self.engines is not None:
+            for env_id in ids2seeds:
+                env = self.environments[env_id]
+                # The state reward wrapper needs per-env stepping around get_env_state
+                if not env.config.get('use_state_reward', False):
+                    self.engines.attach(env_id, env.env)
         return results
     
     @service_state_reward_wrapper
     def step_batch(self, ids2actions: Dict[Any, Any]) -> Dict[Any, Tuple[Dict, float, bool, Dict]]:
         results = {}
         
+        if self.engines is not None:
+            batched = {env_id: action for env_id, action in ids2actions.items() if env_id in self.engines}
+            results.update(self._step_batch_engine(batched))
+        
         for env_id, action in ids2actions.items():
+            if env_id in results:
+                continue
             env = self.environments[env_id]
             observation, reward, done, info = env.step(action)
             serialized_observation = serialize_observation(observation)
@@ -51,6 +73,39 @@ class SokobanService(BaseService):
         
         return results
     
+    def _step_batch_engine(self, ids2actions: Dict[Any, Any]) -> Dict[Any, Tuple[Dict, float, bool, Dict]]:
+        """
+        Same as SokobanEnv.step for every environment, but the k-th action of all environments
+        is applied to all rooms at once by the batch engine.
+        """
+        steps = {env_id: self.environments[env_id]._begin_step(action) for env_id, action in ids2actions.items()}
+        running = set(steps.keys())
+        action_index = 0
+        while running:
+            ids2action_ints = {}
+            for env_id in list(running):
+                step, env = steps[env_id], self.environments[env_id]
+                actions = step["rst"]['actions']
+                if action_index >= len(actions):
+                    running.discard(env_id)
+                elif actions[action_index] in env.ACTION_LOOKUP:
+                    ids2action_ints[env_id] = env.ACTION_LOOKUP[actions[action_index]]
+                else:
+                    step["metrics"]['turn_metrics']['action_is_valid'] = False
+                    running.discard(env_id)
+            for env_id, step_reward in self.engines.step(ids2action_ints).items():
+                step = steps[env_id]
+                self.environments[env_id]._record_action(step, step["rst"]['actions'][action_index], step_reward)
+                if step["done"]:
+                    running.discard(env_id)
+            action_index += 1
+        
+        results = {}
+        for env_id, step in steps.items():
+            observation, reward, done, info = self.environments[env_id]._end_step(step)
+            results[env_id] = (serialize_observation(observation), reward, done, info)
+        return results
+    
     def compute_reward_batch(self, env_ids: List[str]) -> Dict[Any, float]:
         results = {}
         
@@ -76,7 +131,10 @@ class SokobanService(BaseService):
         for env_id in env_ids:
             env = self.environments[env_id]
             env.close()
+            if self.engines is not None:
+                self.engines.detach(env_id)
             
+        self.discard_state_rewards(env_ids)
         for env_id in env_ids:
             self.environments.pop(env_id, None)
             self.env_configs.pop(env_id, None)
@@ -93,6 +151,8 @@ class SokobanService(BaseService):
             response: The output of the llm judge (structured state).
             state: The current state of the environment.
             content: The input to the llm judge (natural lanagugae state).
+            top_k_strings: Most repeated strings of r_type when the step was judged, defaults to
+                the current top-k of the tracker
         
         Returns:
             A float representing the calculated reward.
@@ -118,9 +178,10 @@ class SokobanService(BaseService):
         )
         target_reward = target_result['f1']
         box_reward = box_result['f1']
-        if r_type=="grounding":
+        top_k_strings = kwargs.get("top_k_strings")
+        if top_k_strings is None and r_type=="grounding":
             top_k_strings = self.top_strings_tracker_grounding.get_top_k(self.config.top_strings_k)
-        if r_type=="worldmodeling":
+        if top_k_strings is None and r_type=="worldmodeling":
             top_k_strings = self.top_strings_tracker_worldmodeling.get_top_k(self.config.top_strings_k)
         
         if content in top_k_strings and target_reward+box_reward<0.7:
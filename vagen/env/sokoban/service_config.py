@@ -5,4 +5,5 @@ from dataclasses import dataclass, fields, field
 class SokobanServiceConfig(BaseServiceConfig):
     use_state_reward: bool = False
     top_strings_m: int = 1000
-    top_strings_k: int = 5
\ No newline at end of file
+    top_strings_k: int = 5
+    use_batch_engine: bool = False # step all rooms with the vectorized engine in batch_engine.py
\ No newline at end of file
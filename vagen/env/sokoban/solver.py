@@ -0,0 +1,199 @@
+"""
+Compact Sokoban solver used by get_shortest_action_path.
+
+A search state is the player cell plus the sorted box cells, as flat indices into the room
+padded with a wall border (so moves never need bounds checks), bit-packed into one int key.
+Squares from which a box can never be pushed onto any target are precomputed ("dead squares")
+and states with a box on one are never generated; such states cannot lead to a solution, so
+the search returns the same action sequence as the plain BFS.
+
+Two searches are available:
+    - "bfs": breadth-first, same expansion order as the original deepcopy BFS, so the returned
+      action sequence is identical, not only its length
+    - "astar": A* with the sum of per-box push distances as heuristic (admissible and
+      consistent), returns a shortest sequence but may pick a different one among equals
+"""
+import heapq
+from collections import deque
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+# up, down, left, right; action ids as in gym_sokoban
+ACTIONS = (1, 2, 3, 4)
+MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def _prepare(room_fixed: np.ndarray, room_state: np.ndarray):
+    """Flatten the padded room, returns walls, targets, offsets, player, boxes"""
+    fixed = np.pad(np.asarray(room_fixed), 1, constant_values=0)
+    state = np.pad(np.asarray(room_state), 1, constant_values=0)
+    width = fixed.shape[1]
+    walls = (fixed == 0).ravel().tolist()
+    targets = frozenset(np.flatnonzero(fixed == 2).tolist())
+    offsets = tuple(dr * width + dc for dr, dc in MOVES)
+    player = int(np.flatnonzero(state == 5)[0])
+    boxes = tuple(sorted(np.flatnonzero((state == 3) | (state == 4)).tolist()))
+    return walls, targets, offsets, player, boxes
+
+
+def push_distances(walls: List[bool], targets, offsets) -> List[float]:
+    """
+    Minimum number of pushes to bring a box from each cell onto any target, ignoring other boxes.
+    Cells with infinite distance are dead squares.
+    """
+    dist = [float("inf")] * len(walls)
+    queue = deque()
+    for target in targets:
+        dist[target] = 0
+        queue.append(target)
+    while queue:
+        cell = queue.popleft()
+        for offset in offsets:
+            # A box at `cell - offset` pushed by a player at `cell - 2 * offset` lands on `cell`
+            previous, player = cell - offset, cell - 2 * offset
+            if 0 <= player < len(walls) and not walls[previous] and not walls[player] \
+                    and dist[previous] == float("inf"):
+                dist[previous] = dist[cell] + 1
+                queue.append(previous)
+    return dist
+
+
+class _Packer:
+    """Bit-packs (player, sorted boxes) into an int"""
+
+    def __init__(self, num_cells: int):
+        self.bits = max(num_cells - 1, 1).bit_length()
+
+    def pack(self, player: int, boxes: Tuple[int, ...]) -> int:
+        key = player
+        for box in boxes:
+            key = (key << self.bits) | box
+        return key
+
+
+def _successors(player, boxes, walls, offsets, dist):
+    """Yield (action, new_player, new_boxes) in action order, skipping moves into dead squares"""
+    box_set = set(boxes)
+    for action, offset in zip(ACTIONS, offsets):
+        new_player = player + offset
+        if walls[new_player]:
+            continue
+        if new_player in box_set:
+            new_box = new_player + offset
+            if walls[new_box] or new_box in box_set or dist[new_box] == float("inf"):
+                continue
+            new_boxes = tuple(sorted(new_box if box == new_player else box for box in boxes))
+        else:
+            new_boxes = boxes
+        yield action, new_player, new_boxes
+
+
+def _backtrack(parents: Dict[int, Tuple[int, int]], key: int) -> List[int]:
+    path = []
+    while parents[key] is not None:
+        key, action = parents[key]
+        path.append(action)
+    return path[::-1]
+
+
+def solve(room_fixed: np.ndarray, room_state: np.ndarray, max_depth: int = 100, search: str = "bfs") -> List[int]:
+    """
+    Shortest action sequence pushing all boxes onto targets.
+
+    Args:
+        room_fixed: Fixed part of the room (0 wall, 1 floor, 2 target)
+        room_state: Current room (3 box on target, 4 box, 5 player)
+        max_depth: Longest sequence searched for
+        search: "bfs" or "astar"
+
+    Returns:
+        Action sequence (1 up, 2 down, 3 left, 4 right), [] if already solved or no
+        solution of at most max_depth actions exists
+    """
+    if search not in ("bfs", "astar"):
+        raise ValueError(f"Unknown search: {search}")
+    walls, targets, offsets, player, boxes = _prepare(room_fixed, room_state)
+    if targets.issuperset(boxes):
+        return []
+    dist = push_distances(walls, targets, offsets)
+    if any(dist[box] == float("inf") for box in boxes):
+        return []
+    packer = _Packer(len(walls))
+    start = packer.pack(player, boxes)
+    parents = {start: None}
+
+    if search == "bfs":
+        queue = deque([(player, boxes, 0)])
+        while queue:
+            player, boxes, depth = queue.popleft()
+            if depth >= max_depth:
+                return []  # BFS order: every remaining state is at least this deep
+            parent = packer.pack(player, boxes)
+            for action, new_player, new_boxes in _successors(player, boxes, walls, offsets, dist):
+                key = packer.pack(new_player, new_boxes)
+                if key in parents:
+                    continue
+                parents[key] = (parent, action)
+                if targets.issuperset(new_boxes):
+                    return _backtrack(parents, key)
+                queue.append((new_player, new_boxes, depth + 1))
+        return []
+
+    # A*, heuristic: pushes still needed, each action pushes at most once
+    heuristic = lambda boxes: sum(dist[box] for box in boxes)
+    best_depth = {start: 0}
+    counter = 0  # FIFO tie-break among equal f
+    heap = [(heuristic(boxes), counter, 0, player, boxes)]
+    while heap:
+        _, _, depth, player, boxes = heapq.heappop(heap)
+        key = packer.pack(player, boxes)
+        if depth > best_depth[key]:
+            continue
+        if targets.issuperset(boxes):
+            return _backtrack(parents, key)
+        for action, new_player, new_boxes in _successors(player, boxes, walls, offsets, dist):
+            new_depth = depth + 1
+            estimate = new_depth + heuristic(new_boxes)
+            if estimate > max_depth:
+                continue
+            new_key = packer.pack(new_player, new_boxes)
+            if new_depth >= best_depth.get(new_key, float("inf")):
+                continue
+            best_depth[new_key] = new_depth
+            parents[new_key] = (key, action)
+            counter += 1
+            heapq.heappush(heap, (estimate, counter, new_depth, new_player, new_boxes))
+    return []
+
+
+if __name__ == "__main__":
+    # Equivalence check and benchmark against the original BFS on generated rooms, as in generate_seeds
+    import time
+    from vagen.env.utils.env_utils import set_seed
+    from vagen.env.sokoban.utils import generate_room, get_shortest_action_path_reference
+
+    num_candidates, max_depth = 300, 5
+    rooms = []
+    for seed in range(num_candidates):
+        try:
+            with set_seed(seed):
+                room_fixed, room_state, _, _ = generate_room(dim=(6, 6), num_steps=20, num_boxes=1)
+            rooms.append((room_fixed, room_state))
+        except (RuntimeError, RuntimeWarning):
+            continue
+
+    for depth in (max_depth, 100):
+        timings = {}
+        for name, solver in (
+            ("reference", lambda f, s: get_shortest_action_path_reference(f, s, MAX_DEPTH=depth)),
+            ("bfs", lambda f, s: solve(f, s, max_depth=depth, search="bfs")),
+            ("astar", lambda f, s: solve(f, s, max_depth=depth, search="astar")),
+        ):
+            start = time.perf_counter()
+            timings[name] = ([solver(f, s) for f, s in rooms], time.perf_counter() - start)
+        reference = timings["reference"][0]
+        assert timings["bfs"][0] == reference, "bfs paths differ from the reference"
+        assert [len(p) for p in timings["astar"][0]] == [len(p) for p in reference], "astar lengths differ"
+        print(f"MAX_DEPTH={depth}, {len(rooms)} rooms: " + ", ".join(
+            f"{name} {elapsed:.3f}s" for name, (_, elapsed) in timings.items()))
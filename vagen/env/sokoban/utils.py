@@ -11,6 +11,7 @@ import multiprocessing as mp
 from functools import partial
 from tqdm import tqdm
 import numpy as np
+from .solver import solve
 
 def process_seed(seed: int,config, min_actions_to_succeed: int = 5):
     from .env import SokobanEnv
@@ -88,10 +89,20 @@ def generate_seeds(size,config,min_actions_to_succeed=5,seed=0,n_candidate: int
         print(f"  Length {length}: {count} instances ({percentage:.2f}%)")
     return valid_seeds[:size]
         
-def get_shortest_action_path(room_fixed, room_state, MAX_DEPTH=100):
+def get_shortest_action_path(room_fixed, room_state, MAX_DEPTH=100, search="bfs"):
+    """
+    Get the shortest action path to push all boxes to the target spots.
+    Uses the compact solver in solver.py (packed states, dead-square pruning), which returns
+    the same action sequence as get_shortest_action_path_reference for search="bfs" and a
+    sequence of the same length for search="astar".
+    """
+    return solve(room_fixed, room_state, max_depth=MAX_DEPTH, search=search)
+
+def get_shortest_action_path_reference(room_fixed, room_state, MAX_DEPTH=100):
         """
         Get the shortest action path to push all boxes to the target spots.
         Use BFS to find the shortest path.
+        Reference implementation over full room states, kept for equivalence checks.
         NOTE currently only support one player, only one shortest solution
         =========================================================
         Parameters:
@@ -236,7 +247,7 @@ def solve_sokoban(env, saved_animation_path):
 
 
 
-def add_random_player_movement(room_state, room_structure, move_probability=0.5, continue_probability=0.5, max_steps=3):
+def add_random_player_movement(room_state, room_structure, move_probability=0.5, continue_probability=0.5, max_steps=3, rng=random):
     """
     Randomly move the player after reverse_playing to make the level more challenging, also fix the problem that in generated map, the player is always adjacent to the box
     
@@ -246,12 +257,13 @@ def add_random_player_movement(room_state, room_structure, move_probability=0.5,
         move_probability (float): Probability of moving the player at all (0.0-1.0)
         continue_probability (float): Probability of continuing to move after each step (0.0-1.0)
         max_steps (int): Maximum number of steps the player can move (1-3)
+        rng: random.Random instance, defaults to the global random module
     
     Returns:
         np.ndarray: Updated room state with randomly moved player
     """
     # Check if we should move the player at all
-    if random.random() > move_probability:
+    if rng.random() > move_probability:
         return room_state
     
     # Find player position
@@ -280,7 +292,7 @@ def add_random_player_movement(room_state, room_structure, move_probability=0.5,
             break
         
         # Choose a random valid move
-        chosen_action, next_pos = random.choice(valid_moves)
+        chosen_action, next_pos = rng.choice(valid_moves)
         # print(f"player_pos: {player_pos}, next_pos: {next_pos}")
         
         # Move player
@@ -294,7 +306,7 @@ def add_random_player_movement(room_state, room_structure, move_probability=0.5,
         steps_taken += 1
         
         # Decide whether to continue moving
-        if steps_taken >= max_steps or random.random() > continue_probability:
+        if steps_taken >= max_steps or rng.random() > continue_probability:
             break
     
     return room_state
@@ -305,7 +317,8 @@ def add_random_player_movement(room_state, room_structure, move_probability=0.5,
 Following code is adapted from the nicely written gym_sokoban repo
 """
 
-def generate_room(dim=(13, 13), p_change_directions=0.35, num_steps=25, num_boxes=3, tries=4, second_player=False, search_depth=100):
+def generate_room(dim=(13, 13), p_change_directions=0.35, num_steps=25, num_boxes=3, tries=4, second_player=False, search_depth=100,
+                  rng=None, np_rng=None):
     """
     Generates a Sokoban room, represented by an integer matrix. The elements are encoded as follows:
     wall = 0
@@ -321,16 +334,23 @@ def generate_room(dim=(13, 13), p_change_directions=0.35, num_steps=25, num_boxe
     :param num_boxes:
     :param tries:
     :param second_player:
+    :param rng: random.Random instance, defaults to the global random module
+    :param np_rng: np.random.RandomState instance, defaults to the global np.random
     :return: Numpy 2d Array, box mapping, action sequence
+
+    With per-call generators (random.Random(seed), np.random.RandomState(seed)) the room is the
+    same as with the global generators seeded by set_seed(seed), and generation is thread-safe.
     """
+    rng = rng if rng is not None else random
+    np_rng = np_rng if np_rng is not None else np.random
     room_state = np.zeros(shape=dim)
     room_structure = np.zeros(shape=dim)
 
     # Some times rooms with a score == 0 are the only possibility.
     # In these case, we try another model.
     for t in range(tries):
-        room = room_topology_generation(dim, p_change_directions, num_steps)
-        room = place_boxes_and_player(room, num_boxes=num_boxes, second_player=second_player)
+        room = room_topology_generation(dim, p_change_directions, num_steps, rng=rng)
+        room = place_boxes_and_player(room, num_boxes=num_boxes, second_player=second_player, np_rng=np_rng)
 
         # Room fixed represents all not movable parts of the room
         room_structure = np.copy(room)
@@ -354,19 +374,21 @@ def generate_room(dim=(13, 13), p_change_directions=0.35, num_steps=25, num_boxe
         room_structure,
         move_probability=0.5,       # 50% chance the player will move
         continue_probability=0.5,   # 50% chance to continue moving after each step
-        max_steps=3                 # Maximum of 3 steps
+        max_steps=3,                # Maximum of 3 steps
+        rng=rng,
     )
 
     return room_structure, room_state, box_mapping, action_sequence
 
 
-def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=15):
+def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=15, rng=random):
     """
     Generate a room topology, which consits of empty floors and walls.
 
     :param dim:
     :param p_change_directions:
     :param num_steps:
+    :param rng:
     :return:
     """
     dim_x, dim_y = dim
@@ -404,12 +426,12 @@ def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=1
 
     # Possible directions during the walk
     directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-    direction = random.sample(directions, 1)[0]
+    direction = rng.sample(directions, 1)[0]
 
     # Starting position of random walk
     position = np.array([
-        random.randint(1, dim_x - 1),
-        random.randint(1, dim_y - 1)]
+        rng.randint(1, dim_x - 1),
+        rng.randint(1, dim_y - 1)]
     )
 
     level = np.zeros(dim, dtype=int)
@@ -417,8 +439,8 @@ def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=1
     for s in range(num_steps):
 
         # Change direction randomly
-        if random.random() < p_change_directions:
-            direction = random.sample(directions, 1)[0]
+        if rng.random() < p_change_directions:
+            direction = rng.sample(directions, 1)[0]
 
         # Update position
         position = position + direction
@@ -426,7 +448,7 @@ def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=1
         position[1] = max(min(position[1], dim_y - 2), 1)
 
         # Apply mask
-        mask = random.sample(masks, 1)[0]
+        mask = rng.sample(masks, 1)[0]
         mask_start = position - 1
         level[mask_start[0]:mask_start[0] + 3, mask_start[1]:mask_start[1] + 3] += mask
 
@@ -437,12 +459,13 @@ def room_topology_generation(dim=(10, 10), p_change_directions=0.35, num_steps=1
     return level
 
 
-def place_boxes_and_player(room, num_boxes, second_player):
+def place_boxes_and_player(room, num_boxes, second_player, np_rng=np.random):
     """
     Places the player and the boxes into the floors in a room.
 
     :param room:
     :param num_boxes:
+    :param np_rng:
     :return:
     """
     # Get all available positions
@@ -458,12 +481,12 @@ def place_boxes_and_player(room, num_boxes, second_player):
         )
 
     # Place player(s)
-    ind = np.random.randint(num_possible_positions)
+    ind = np_rng.randint(num_possible_positions)
     player_position = possible_positions[0][ind], possible_positions[1][ind]
     room[player_position] = 5
 
     if second_player:
-        ind = np.random.randint(num_possible_positions)
+        ind = np_rng.randint(num_possible_positions)
         player_position = possible_positions[0][ind], possible_positions[1][ind]
         room[player_position] = 5
 
@@ -472,22 +495,14 @@ def place_boxes_and_player(room, num_boxes, second_player):
         possible_positions = np.where(room == 1)
         num_possible_positions = possible_positions[0].shape[0]
 
-        ind = np.random.randint(num_possible_positions)
+        ind = np_rng.randint(num_possible_positions)
         box_position = possible_positions[0][ind], possible_positions[1][ind]
         room[box_position] = 2
 
     return room
 
 
-# Global variables used for reverse playing.
-explored_states = set()
-num_boxes = 0
-best_room_score = -1
-best_room = None
-best_box_mapping = None
-
-
-def reverse_playing(room_state, room_structure, search_depth=100):
+def reverse_playing(room_state, room_structure, search_depth=100, max_nodes=300000):
     """
     This function plays Sokoban reverse in a way, such that the player can
     move and pull boxes.
@@ -495,90 +510,101 @@ def reverse_playing(room_state, room_structure, search_depth=100):
     :param room_state:
     :param room_structure:
     :param search_depth:
+    :param max_nodes: maximum number of distinct states explored
     :return: 2d array, box mapping, action sequence
     """
-    global explored_states, num_boxes, best_room_score, best_room, best_box_mapping, best_action_sequence
-
-    # Box_Mapping is used to calculate the box displacement for every box
-    box_mapping = {}
-    box_locations = np.where(room_structure == 2)
-    num_boxes = len(box_locations[0])
-    for l in range(num_boxes):
-        box = (box_locations[0][l], box_locations[1][l])
-        box_mapping[box] = box
-
-    # explored_states globally stores the best room state and score found during search
-    explored_states = set()
-    best_room_score = -1
-    best_room = None
-    best_box_mapping = box_mapping
-    best_action_sequence = []
+    return ReversePlaySearch(room_structure, max_nodes=max_nodes).run(room_state, search_depth)
 
-    depth_first_search(room_state, room_structure, box_mapping, box_swaps=0, last_pull=(-1, -1), ttl=search_depth, action_sequence=[])
 
-    return best_room, best_box_mapping, best_action_sequence
-
-
-def depth_first_search(room_state, room_structure, box_mapping, box_swaps=0, last_pull=(-1, -1), ttl=300, action_sequence=[]):
-    """
-    Searches through all possible states of the room.
-    This is a recursive function, which stops if the ttl is reduced to 0 or
-    over 1.000.000 states have been explored.
-    :param room_state:
-    :param room_structure:
-    :param box_mapping:
-    :param box_swaps:
-    :param last_pull:
-    :param ttl:
-    :param action_sequence:
-    :return:
+class ReversePlaySearch:
     """
-    global explored_states, num_boxes, best_room_score, best_room, best_box_mapping, best_action_sequence
-
-    ttl -= 1
-    if ttl <= 0 or len(explored_states) >= 300000:
-        return
+    Depth-first search over reverse-play states, with all search state held in the instance
+    so that rooms can be generated concurrently.
 
-    state_tohash = marshal.dumps(room_state)
+    Uses an explicit stack instead of recursion and visits states in the same order as the
+    recursive search it replaces, so the same room is found for the same input. States are
+    deduplicated by their uint8 byte string.
+    """
 
-    # Only search this state, if it not yet has been explored
-    if not (state_tohash in explored_states):
+    def __init__(self, room_structure, max_nodes=300000):
+        self.room_structure = room_structure
+        self.max_nodes = max_nodes
+        self.num_boxes = int(np.sum(room_structure == 2))
+        self.explored_states = set()
+        self.best_room_score = -1
+        self.best_room = None
+        self.best_box_mapping = None
+        self.best_action_sequence = []
+
+    def _visit(self, room_state, box_mapping, box_swaps, action_sequence):
+        """Score a state, returns False if it was already explored"""
+        state_tohash = room_state.astype(np.uint8).tobytes()
+        if state_tohash in self.explored_states:
+            return False
 
-        # Add current state and its score to explored states
         room_score = box_swaps * box_displacement_score(box_mapping)
-        if np.where(room_state == 2)[0].shape[0] != num_boxes:
+        if np.where(room_state == 2)[0].shape[0] != self.num_boxes:
             room_score = 0
 
-        if room_score > best_room_score:
-            best_room = room_state.copy()
-            best_room_score = room_score
-            best_box_mapping = box_mapping.copy()
-            best_action_sequence = action_sequence.copy()
-
-        explored_states.add(state_tohash)
-
-        for action in ACTION_LOOKUP.keys():
-            # The state and box mapping need to be copied to ensure
-            # every action starts from a similar state.
-
-            # TODO: A tentitive try here to make less moves
+        if room_score > self.best_room_score:
+            self.best_room = room_state.copy()
+            self.best_room_score = room_score
+            self.best_box_mapping = box_mapping.copy()
+            self.best_action_sequence = action_sequence.copy()
+
+        self.explored_states.add(state_tohash)
+        return True
+
+    def _enter(self, room_state, box_mapping, box_swaps, last_pull, ttl, action_sequence):
+        """Frame for a state if it is to be expanded, None if the search stops here"""
+        ttl -= 1
+        if ttl <= 0 or len(self.explored_states) >= self.max_nodes:
+            return None
+        if not self._visit(room_state, box_mapping, box_swaps, action_sequence):
+            return None
+        # Pull actions 0-3 only, move actions 4-7 are not searched
+        return [room_state, box_mapping, box_swaps, last_pull, ttl, action_sequence, 0]
+
+    def run(self, room_state, search_depth=100):
+        """
+        :param room_state:
+        :param search_depth:
+        :return: 2d array, box mapping, action sequence
+        """
+        # Box_Mapping is used to calculate the box displacement for every box
+        box_mapping = {}
+        box_locations = np.where(self.room_structure == 2)
+        for l in range(len(box_locations[0])):
+            box = (box_locations[0][l], box_locations[1][l])
+            box_mapping[box] = box
+        self.best_box_mapping = box_mapping
+
+        stack = []
+        frame = self._enter(room_state, box_mapping, 0, (-1, -1), search_depth, [])
+        if frame is not None:
+            stack.append(frame)
+        while stack:
+            frame = stack[-1]
+            room_state, box_mapping, box_swaps, last_pull, ttl, action_sequence, action = frame
             if action >= 4:
+                stack.pop()
                 continue
+            frame[-1] += 1
 
-            room_state_next = room_state.copy()
-            box_mapping_next = box_mapping.copy()
-
-            room_state_next, box_mapping_next, last_pull_next = \
-                reverse_move(room_state_next, room_structure, box_mapping_next, last_pull, action)
-
+            # The state and box mapping are copied so every action starts from the same state
+            room_state_next, box_mapping_next, last_pull_next = reverse_move(
+                room_state.copy(), self.room_structure, box_mapping.copy(), last_pull, action)
             box_swaps_next = box_swaps
             if last_pull_next != last_pull:
                 box_swaps_next += 1
-            
-            action_sequence_next = action_sequence + [action]
-            # action_sequence_next = action_sequence + [(action, box_mapping_next != box_mapping)] # add whether a box is moved
-            depth_first_search(room_state_next, room_structure, box_mapping_next, box_swaps_next, last_pull_next, ttl, action_sequence_next)
-            
+
+            child = self._enter(room_state_next, box_mapping_next, box_swaps_next, last_pull_next, ttl,
+                                action_sequence + [action])
+            if child is not None:
+                stack.append(child)
+
+        return self.best_room, self.best_box_mapping, self.best_action_sequence
+
 
 def reverse_move(room_state, room_structure, box_mapping, last_pull, action):
     """
@@ -0,0 +1,124 @@
+"""
+CPU inference backends for the SVG perceptual scorers (DINOv2, DreamSim).
+
+Selected per environment with SvgEnvConfig.score_backend:
+
+    - "torch": the models in float32 on the configured device (default, usually CUDA)
+    - "cpu": float32 on CPU
+    - "cpu_int8": CPU with dynamic int8 quantization of every nn.Linear (the bulk of the
+      ViT encoders' compute)
+    - "cpu_compile": CPU with the encoder compiled by torch.compile
+
+SVGServiceConfig.score_threads pins torch's intra-op thread pool for the CPU backends. The
+pool is process-wide, so it is a service setting rather than a per-environment one.
+
+The CPU backends change scores slightly. Check them against the float reference on real
+ground-truth rasters before switching a fleet over:
+
+    python -m vagen.env.svg.cpu_backend --backend cpu_int8 --num_pairs 64 --tolerance 0.02
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
+
+SCORE_BACKENDS = ("torch", "cpu", "cpu_int8", "cpu_compile")
+
+
+def backend_device(backend: str, device: str) -> str:
+    """Device the models of a backend run on"""
+    if backend not in SCORE_BACKENDS:
+        raise ValueError(f"score_backend should be one of {SCORE_BACKENDS}, got {backend}")
+    return device if backend == "torch" else "cpu"
+
+
+def configure_cpu_threads(num_threads: Optional[int]) -> None:
+    """Pin torch's intra-op threads (process-wide); inter-op parallelism is not used by the scorers"""
+    if not num_threads:
+        return
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # only settable before the first inter-op parallel work of the process
+        pass
+
+
+def optimize_for_cpu(module: torch.nn.Module, backend: str, method: str = "forward") -> torch.nn.Module:
+    """
+    Prepare an encoder for a backend. `method` is the entry point the scorer calls,
+    compiled by the cpu_compile backend.
+    """
+    if backend == "torch":
+        return module
+    module = module.to("cpu").eval()
+    if backend == "cpu_int8":
+        from torch.ao.quantization import quantize_dynamic
+        module = quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "cpu_compile":
+        setattr(module, method, torch.compile(getattr(module, method)))
+    return module
+
+
+def check_score_parity(reference, candidate, gt_images: List[Any], gen_images: List[Any],
+                       tolerance: float = 0.02) -> Dict[str, Any]:
+    """Scores of a candidate scorer against the float reference on the same image pairs"""
+    timings = []
+    for scorer in (reference, candidate):
+        scorer.calculate_batch_scores(gt_images, gen_images)  # warm-up (compilation for these shapes)
+        start = time.perf_counter()
+        timings.append((scorer.calculate_batch_scores(gt_images, gen_images), time.perf_counter() - start))
+    (expected, reference_time), (actual, candidate_time) = timings
+    diffs = [abs(a - b) for a, b in zip(actual, expected)]
+    return {
+        "max_abs_diff": max(diffs),
+        "mean_abs_diff": sum(diffs) / len(diffs),
+        "reference_s": reference_time,
+        "candidate_s": candidate_time,
+        "passed": max(diffs) <= tolerance,
+    }
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import random
+    import argparse
+    from PIL import ImageFilter
+    from vagen.env.svg.svg_utils import load_svg_dataset, process_and_rasterize_svg
+    from vagen.env.svg.dino import DINOScoreCalculator
+    from vagen.env.svg.dreamsim import DreamSimScoreCalculator
+
+    parser = argparse.ArgumentParser(description="Score parity of a CPU backend against the float reference")
+    parser.add_argument("--backend", default="cpu_int8", choices=SCORE_BACKENDS[1:])
+    parser.add_argument("--dataset_name", default="starvector/svg-icons-simple")
+    parser.add_argument("--data_dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    parser.add_argument("--split", default="test")
+    parser.add_argument("--num_pairs", type=int, default=64)
+    parser.add_argument("--model_size", default="small")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    args = parser.parse_args()
+
+    dataset = load_svg_dataset(args.data_dir, args.dataset_name, args.split)
+    rng = random.Random(0)
+    indices = rng.sample(range(len(dataset)), min(2 * args.num_pairs, len(dataset)))
+    images = [process_and_rasterize_svg(dataset[i].get('Svg', dataset[i].get('svg', '')))[1] for i in indices]
+    half = len(images) // 2
+    # unrelated pairs and blurred near-duplicates cover low and high similarities
+    gt_images = images[:half] + images[:half]
+    gen_images = images[half:2 * half] + [im.filter(ImageFilter.GaussianBlur(2)) for im in images[:half]]
+
+    failed = False
+    for name, make in [
+        ("dino", lambda backend: DINOScoreCalculator(model_size=args.model_size, device="cpu", backend=backend,
+                                                     num_threads=args.threads)),
+        ("dreamsim", lambda backend: DreamSimScoreCalculator(device="cpu", backend=backend,
+                                                             num_threads=args.threads)),
+    ]:
+        result = check_score_parity(make("cpu"), make(args.backend), gt_images, gen_images, args.tolerance)
+        failed |= not result["passed"]
+        print(f"{name:<9} {args.backend}: max |diff| {result['max_abs_diff']:.4f}, mean {result['mean_abs_diff']:.4f}, "
+              f"{result['reference_s']:.2f}s -> {result['candidate_s']:.2f}s "
+              f"({'ok' if result['passed'] else 'FAILED'}, tolerance {args.tolerance})")
+    sys.exit(1 if failed else 0)
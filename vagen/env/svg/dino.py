@@ -5,6 +5,7 @@ from typing import Dict, List, Tuple, Optional, Any, Union
 from transformers import AutoModel, AutoImageProcessor
 from PIL import Image
 import math
+from vagen.env.svg.cpu_backend import backend_device, configure_cpu_threads, optimize_for_cpu
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -72,14 +73,19 @@ class BaseMetric:
 
 
 class DINOScoreCalculator(BaseMetric): 
-    def __init__(self, config=None, model_size='large', device='cuda:0'):
+    def __init__(self, config=None, model_size='large', device='cuda:0', backend='torch', num_threads=None):
         super().__init__()
         self.class_name = self.__class__.__name__
         self.config = config
         self.model_size = model_size
+        self.backend = backend
+        # key of the ground-truth features in GTFeatureCache, CPU backends score slightly differently
+        self.feature_name = f"dino-{model_size}" if backend == "torch" else f"dino-{model_size}-{backend}"
         self.model, self.processor = self.get_DINOv2_model(model_size)
-        self.device = device
-        self.model = self.model.to(self.device)
+        self.device = backend_device(backend, device)
+        if backend != "torch":
+            configure_cpu_threads(num_threads)
+        self.model = optimize_for_cpu(self.model.to(self.device).eval(), backend)
         self.metric = self.calculate_DINOv2_similarity_score
 
     def get_DINOv2_model(self, model_size):
@@ -137,15 +143,23 @@ class DINOScoreCalculator(BaseMetric):
 
         return sim
     
-    def calculate_batch_scores(self, gt_images: List[Any], gen_images: List[Any]) -> List[float]:
+    def get_features(self, images: List[Image.Image]) -> torch.Tensor:
+        """Mean-pooled DINOv2 features of a batch of images"""
+        return self.process_input(images, self.processor)
+
+    def calculate_batch_scores(self, gt_images: List[Any], gen_images: List[Any], gt_features=None) -> List[float]:
         """
         Calculate similarity scores for multiple image pairs in a single batch.
         DINO can process all images in a batch efficiently.
+        gt_features (e.g. from the ground-truth cache) replaces embedding the gt_images.
         """      
         if not gt_images: 
             return []
         
-        gt_features = self.process_input(gt_images, self.processor)
+        if gt_features is None:
+            gt_features = self.process_input(gt_images, self.processor)
+        else:
+            gt_features = torch.as_tensor(gt_features).to(self.device)
         gen_features = self.process_input(gen_images, self.processor)
         
         cos = nn.CosineSimilarity(dim=1)
@@ -1,19 +1,22 @@
 import torch
+import torch.nn.functional as F
 from PIL import Image
 import os
 from dreamsim import dreamsim
 import logging
 from concurrent.futures import ThreadPoolExecutor
 from typing import List, Any
+from vagen.env.svg.cpu_backend import backend_device, configure_cpu_threads, optimize_for_cpu
 
 class DreamSimScoreCalculator:
     """
     A wrapper class for DreamSim model to calculate similarity scores between images.
     """
 
-    def __init__(self, pretrained=True, cache_dir="~/.cache", device=None):
+    def __init__(self, pretrained=True, cache_dir="~/.cache", device=None, backend="torch", num_threads=None):
         """
         Initialize DreamSim model.
+        backend: "torch" or one of the CPU backends of cpu_backend.py
         """
         cache_dir = os.path.expanduser(cache_dir)
 
@@ -21,10 +24,15 @@ class DreamSimScoreCalculator:
         if device is None:
             self.device = "cpu"
         else:
-            self.device = device
+            self.device = backend_device(backend, device)
+        self.backend = backend
+        self.feature_name = "dreamsim" if backend == "torch" else f"dreamsim-{backend}"
+        if backend != "torch":
+            configure_cpu_threads(num_threads)
 
         # Load model and preprocessor
         self.model, self.preprocess = dreamsim(pretrained=pretrained, cache_dir=cache_dir, device=self.device)
+        self.model = optimize_for_cpu(self.model, backend, method="embed")
 
     def calculate_similarity_score(self, gt_im, gen_im):
         """
@@ -47,24 +55,26 @@ class DreamSimScoreCalculator:
 
         return similarity
 
-    def calculate_batch_scores(self, gt_images: List[Any], gen_images: List[Any]) -> List[float]:
+    def embed_batch(self, images: List[Any]) -> torch.Tensor:
+        """DreamSim embeddings of a batch of images"""
+        processed = torch.cat([self.preprocess(img) for img in images], dim=0).to(self.device)
+        with torch.no_grad():
+            return self.model.embed(processed)
+
+    def calculate_batch_scores(self, gt_images: List[Any], gen_images: List[Any], gt_features=None) -> List[float]:
         """
         Calculate similarity scores for multiple image pairs.
-        Since DreamSim doesn't natively support batch comparison, we process each pair individually.
+        Images are embedded in one batch; the DreamSim distance is 1 - cosine similarity of the embeddings.
+        gt_features (e.g. from the ground-truth cache) replaces embedding the gt_images.
         """
         if not gt_images or not gen_images:
             return []
-            
-        batch_size = len(gt_images)
         
-        gt_processed = [self.preprocess(img).to(self.device) for img in gt_images]
-        gen_processed = [self.preprocess(img).to(self.device) for img in gen_images]
-        
-        scores = []
-        for i in range(batch_size):
-            with torch.no_grad():
-                distance = self.model(gt_processed[i], gen_processed[i]).item()
-            similarity = 1.0 - min(1.0, max(0.0, distance))
-            scores.append(similarity)
+        if gt_features is None:
+            gt_features = self.embed_batch(gt_images)
+        else:
+            gt_features = torch.as_tensor(gt_features).to(self.device)
+        gen_features = self.embed_batch(gen_images)
         
-        return scores
\ No newline at end of file
+        distances = 1 - F.cosine_similarity(gt_features, gen_features, dim=-1)
+        return [1.0 - min(1.0, max(0.0, distance.item())) for distance in distances]
\ No newline at end of file
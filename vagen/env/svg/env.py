@@ -28,11 +28,12 @@ class SVGEnv(BaseEnv):
     reproduces the image as accurately as possible.
     """
     
-    def __init__(self, config: SvgEnvConfig,dataset):
+    def __init__(self, config: SvgEnvConfig,dataset, gt_cache=None):
         """Initialize the SVG environment.
         
         Args:
             config: Configuration for the environment
+            gt_cache: Optional GTFeatureCache of the dataset, shared by the service's environments
         """
         BaseEnv.__init__(self)
         self.config = config
@@ -51,6 +52,8 @@ class SVGEnv(BaseEnv):
         self.gen_image = None
         self.dino_model = None
         self.dataset = dataset
+        self.gt_cache = gt_cache
+        self.gt_index = None
         # Store the format prompt function for later use
         self.prompt_format=self.config.get('prompt_format', 'free_think')
         self.format_prompt_func = format_prompt[self.prompt_format]
@@ -79,6 +82,7 @@ class SVGEnv(BaseEnv):
         # Deterministically select a sample from the dataset
         dataset_length = len(self.dataset)
         index = self.rng.randint(0, dataset_length - 1)
+        self.gt_index = index
         self.current_sample = self.dataset[index]
         
         # Extract SVG code and filename
@@ -90,7 +94,10 @@ class SVGEnv(BaseEnv):
             raise ValueError(f"Ground truth SVG code not found in sample at index {index}")
             
         # Process ground truth SVG to get the image
-        _, self.gt_image = process_and_rasterize_svg(self.gt_svg_code)
+        if self.gt_cache is not None:
+            self.gt_image = self.gt_cache.get_raster(index, self.gt_svg_code)
+        else:
+            _, self.gt_image = process_and_rasterize_svg(self.gt_svg_code)
         
         # Reset tracking variables
         self.total_reward = 0
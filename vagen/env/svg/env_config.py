@@ -18,6 +18,8 @@ class SvgEnvConfig(BaseEnvConfig):
     dreamsim_weight: Optional[float] = None
     # Device configuration
     device: Dict[str, Any] = field(default_factory=lambda: {"dino": 0, "dreamsim": 0})
+    # Scorer inference backend: "torch", "cpu", "cpu_int8" or "cpu_compile" (see cpu_backend.py)
+    score_backend: str = "torch"
     # Reward configuration
     format_reward: float = 0.5
     format_penalty: float = 0.0
@@ -64,7 +66,8 @@ class SvgEnvConfig(BaseEnvConfig):
         """Get the score configuration dictionary"""
         score_config = {
             "model_size": self.model_size,
-            "device": self.device  # Include processed device configuration in score config
+            "device": self.device,  # Include processed device configuration in score config
+            "score_backend": self.score_backend
         }
         
         # Add optional weights if set
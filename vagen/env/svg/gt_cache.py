@@ -0,0 +1,190 @@
+"""
+Cache of ground-truth SVG rasters and scoring features, keyed by dataset index.
+
+Every reset of an SVGEnv rasterizes the sample's ground-truth SVG, and every step the scorers
+embed that same ground-truth image again with DINOv2 and DreamSim and recompute its Canny
+edges. With GRPO groups sharing a sample, most of this work is repeated. A GTFeatureCache
+belongs to one dataset split and keeps, per sample index:
+
+    - "raster": the rasterized ground-truth image
+    - "dino-<model_size>", "dreamsim": image embeddings (suffixed with the score backend
+      for the CPU backends)
+    - "edges": Canny edge map used by the structural score
+
+Entries live in an in-memory LRU. With a cache_dir they are also written to
+<cache_dir>/<feature>/<index>.npz, so a split can be precomputed ahead of training:
+
+    python -m vagen.env.svg.gt_cache --dataset_name starvector/svg-icons-simple --split train \
+        --cache_dir data/gt_cache --model_size small --device cuda:0
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from vagen.env.svg.svg_utils import process_and_rasterize_svg
+
+
+def gt_cache_path(cache_dir: str, dataset_name: str, split: str) -> str:
+    """Directory of the cache of one dataset split"""
+    return os.path.join(cache_dir, f"{dataset_name.replace('/', '-')}-{split}")
+
+
+class GTFeatureCache:
+    """Ground-truth rasters and features of one dataset split"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 1024):
+        """
+        Args:
+            cache_dir: Directory persisting the entries, None keeps them in memory only
+            max_entries: Samples kept in memory
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # index -> {feature: value}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, feature: str, index: int) -> str:
+        return os.path.join(self.cache_dir, feature, f"{index}.npz")
+
+    def lookup(self, feature: str, index: int) -> Optional[Any]:
+        """Cached feature of a sample, None if it has not been computed"""
+        with self.lock:
+            entry = self.entries.get(index)
+            if entry is not None and feature in entry:
+                self.entries.move_to_end(index)
+                self.hits += 1
+                return entry[feature]
+        if self.cache_dir is not None and os.path.exists(self._path(feature, index)):
+            with np.load(self._path(feature, index)) as data:
+                value = data["value"]
+            if feature == "raster":
+                value = Image.fromarray(value)
+            self.store(feature, index, value, persist=False)
+            with self.lock:
+                self.hits += 1
+            return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def store(self, feature: str, index: int, value: Any, persist: bool = True) -> None:
+        with self.lock:
+            self.entries.setdefault(index, {})[feature] = value
+            self.entries.move_to_end(index)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if persist and self.cache_dir is not None:
+            path = self._path(feature, index)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write-then-rename so concurrent readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+            np.savez_compressed(tmp_path, value=np.asarray(value))
+            os.replace(tmp_path, path)
+
+    def get_raster(self, index: int, svg_code: str) -> Image.Image:
+        """Rasterized ground truth of a sample"""
+        image = self.lookup("raster", index)
+        if image is None:
+            _, image = process_and_rasterize_svg(svg_code)
+            self.store("raster", index, image)
+        return image
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def gather_gt_features(feature: str, gt_images: Sequence[Image.Image], gt_caches: Optional[Sequence],
+                       gt_indices: Optional[Sequence[int]], compute_fn: Callable) -> List[Any]:
+    """
+    Feature of every ground-truth image of a scoring batch, read from the per-item caches
+    (None entries are computed without caching). Uncached misses of all caches go through
+    compute_fn together.
+    """
+    if gt_caches is None:
+        return list(compute_fn(list(gt_images)))
+    values = [None] * len(gt_images)
+    by_cache = OrderedDict()  # id(cache) -> (cache, positions)
+    uncached = []
+    for i, cache in enumerate(gt_caches):
+        if cache is None:
+            uncached.append(i)
+        else:
+            by_cache.setdefault(id(cache), (cache, []))[1].append(i)
+
+    # Collect every cache's misses first so they are computed in one batch
+    pending = {}
+    for cache, positions in by_cache.values():
+        for i in positions:
+            values[i] = cache.lookup(feature, gt_indices[i])
+            if values[i] is None:
+                pending.setdefault((id(cache), gt_indices[i]), (cache, gt_images[i]))
+    keys = list(pending)
+    batch = [pending[key][1] for key in keys] + [gt_images[i] for i in uncached]
+    if batch:
+        computed = list(compute_fn(batch))
+        for key, value in zip(keys, computed):
+            cache = pending[key][0]
+            cache.store(feature, key[1], value)
+            pending[key] = value
+        for i, value in zip(uncached, computed[len(keys):]):
+            values[i] = value
+        for cache, positions in by_cache.values():
+            for i in positions:
+                if values[i] is None:
+                    values[i] = pending[(id(cache), gt_indices[i])]
+    return values
+
+
+def precompute(cache: GTFeatureCache, dataset, dino_model=None, dreamsim_model=None, batch_size: int = 32) -> None:
+    """Fill a cache with the rasters, edges and (given the models) embeddings of a whole dataset split"""
+    from vagen.env.svg.score import canny_edges
+
+    for start in range(0, len(dataset), batch_size):
+        indices = list(range(start, min(start + batch_size, len(dataset))))
+        images = []
+        for index in indices:
+            sample = dataset[index]
+            images.append(cache.get_raster(index, sample.get('Svg', sample.get('svg', ''))))
+        caches = [cache] * len(indices)
+        gather_gt_features("edges", images, caches, indices, lambda batch: [canny_edges(image) for image in batch])
+        if dino_model is not None:
+            gather_gt_features(dino_model.feature_name, images, caches, indices,
+                               lambda batch: dino_model.get_features(batch).cpu().numpy())
+        if dreamsim_model is not None:
+            gather_gt_features(dreamsim_model.feature_name, images, caches, indices,
+                               lambda batch: dreamsim_model.embed_batch(batch).cpu().numpy())
+        print(f"Precomputed {indices[-1] + 1}/{len(dataset)}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from vagen.env.svg.svg_utils import load_svg_dataset
+
+    parser = argparse.ArgumentParser(description="Precompute the ground-truth feature cache of an SVG dataset split")
+    parser.add_argument("--dataset_name", default="starvector/svg-icons-simple")
+    parser.add_argument("--data_dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    parser.add_argument("--split", default="train")
+    parser.add_argument("--cache_dir", required=True)
+    parser.add_argument("--model_size", default="small")
+    parser.add_argument("--device", default="cuda:0")
+    parser.add_argument("--backend", default="torch", help="score backend the cache is for, see cpu_backend.py")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--rasters_only", action="store_true", help="skip the DINOv2 and DreamSim embeddings")
+    args = parser.parse_args()
+
+    dataset = load_svg_dataset(args.data_dir, args.dataset_name, args.split)
+    dino_model, dreamsim_model = None, None
+    if not args.rasters_only:
+        from vagen.env.svg.dino import DINOScoreCalculator
+        from vagen.env.svg.dreamsim import DreamSimScoreCalculator
+        dino_model = DINOScoreCalculator(model_size=args.model_size, device=args.device, backend=args.backend)
+        dreamsim_model = DreamSimScoreCalculator(device=args.device, backend=args.backend)
+    cache = GTFeatureCache(gt_cache_path(args.cache_dir, args.dataset_name, args.split), max_entries=args.batch_size)
+    precompute(cache, dataset, dino_model, dreamsim_model, batch_size=args.batch_size)
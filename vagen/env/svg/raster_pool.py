@@ -0,0 +1,178 @@
+"""
+Process pool for SVG rasterization with hard per-item deadlines.
+
+Rasterizing model-written SVG with cairosvg can take arbitrarily long (huge paths, deep
+nesting, pathological filters), and clean_svg's signal.alarm only works in the main thread,
+so inside the service's worker threads one bad SVG could stall a whole step_batch.
+
+RasterPool keeps `num_workers` pre-started worker processes, each with its own pipe and
+shared-memory slot. A batch is spread over the idle workers one item at a time. An item that
+is not done `timeout` seconds after it was handed out gets its worker killed and replaced
+with a fresh one, and the item fails with a TimeoutError. Pixels come back through the
+worker's shared-memory slot instead of being pickled.
+"""
+import time
+import atexit
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+# Modes that round-trip through raw bytes, anything else is converted to RGBA first
+_RAW_MODES = ("RGB", "RGBA", "L", "LA")
+
+
+def _worker_main(conn, shm_name: str, rasterize_fn: Optional[Callable], resolution: int, dpi: int, scale: int):
+    """Loop of a worker process: rasterize (index, svg) requests into the shared-memory slot"""
+    if rasterize_fn is None:
+        from vagen.env.svg.svg_utils import process_and_rasterize_svg as rasterize_fn
+    # Workers share the parent's resource tracker, the segment is unlinked once by RasterPool.close
+    shm = shared_memory.SharedMemory(name=shm_name)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        index, svg_code = request
+        try:
+            out_svg, image = rasterize_fn(svg_code, resolution=resolution, dpi=dpi, scale=scale)
+            if image.mode not in _RAW_MODES:
+                image = image.convert("RGBA")
+            data = image.tobytes()
+            if len(data) <= shm.size:
+                shm.buf[:len(data)] = data
+                conn.send((index, "ok", out_svg, image.mode, image.size, None))
+            else:
+                conn.send((index, "ok", out_svg, image.mode, image.size, data))
+        except Exception as e:
+            conn.send((index, "error", f"{type(e).__name__}: {e}", None, None, None))
+    shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, shm: shared_memory.SharedMemory, args: tuple):
+        self.shm = shm
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, shm.name) + args, daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RasterPool:
+    """Pre-started rasterization processes with per-item wall-clock deadlines"""
+
+    def __init__(self, num_workers: int = 4, timeout: float = 10.0, resolution: int = 256, dpi: int = 128,
+                 scale: int = 2, rasterize_fn: Optional[Callable] = None, start_method: str = "spawn"):
+        """
+        Args:
+            num_workers: Worker processes
+            timeout: Seconds an item may take before its worker is killed and replaced
+            resolution, dpi, scale: Passed to the rasterize function
+            rasterize_fn: Module-level function (svg, resolution, dpi, scale) -> (svg, PIL image),
+                defaults to svg_utils.process_and_rasterize_svg
+            start_method: multiprocessing start method of the workers
+        """
+        self.timeout = timeout
+        self.ctx = mp.get_context(start_method)
+        self.worker_args = (rasterize_fn, resolution, dpi, scale)
+        # Room for one RGBA frame of the configured output size
+        slot_size = 4 * (resolution * scale) ** 2
+        self.workers = []
+        for _ in range(num_workers):
+            shm = shared_memory.SharedMemory(create=True, size=slot_size)
+            self.workers.append(_Worker(self.ctx, shm, self.worker_args))
+        self.replaced = 0
+        self.lock = threading.Lock()  # one batch at a time owns all workers
+        self.closed = False
+        atexit.register(self.close)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        self.replaced += 1
+        replacement = _Worker(self.ctx, worker.shm, self.worker_args)
+        self.workers[self.workers.index(worker)] = replacement
+        return replacement
+
+    def rasterize_batch(self, svg_codes: List[str], timeout: Optional[float] = None
+                        ) -> List[Tuple[Optional[str], Optional[Image.Image], Optional[str]]]:
+        """
+        Rasterize SVGs on the workers.
+
+        Returns:
+            One (cleaned svg, image, error) per input; image is None and error is set if the
+            item failed or ran into its deadline
+        """
+        timeout = self.timeout if timeout is None else timeout
+        results = [None] * len(svg_codes)
+        with self.lock:
+            pending = deque(enumerate(svg_codes))
+            idle = deque(self.workers)
+            busy = {}  # conn -> (worker, index, deadline)
+            while pending or busy:
+                while pending and idle:
+                    worker = idle.popleft()
+                    index, svg_code = pending.popleft()
+                    try:
+                        worker.conn.send((index, svg_code))
+                    except (BrokenPipeError, OSError):
+                        # died while idle, retry the item on its replacement
+                        pending.appendleft((index, svg_code))
+                        idle.append(self._replace(worker))
+                        continue
+                    busy[worker.conn] = (worker, index, time.monotonic() + timeout)
+
+                next_deadline = min(deadline for _, _, deadline in busy.values())
+                for conn in wait(list(busy), timeout=max(0.0, next_deadline - time.monotonic())):
+                    worker, index, _ = busy.pop(conn)
+                    try:
+                        _, status, payload, mode, size, data = conn.recv()
+                    except (EOFError, OSError):
+                        results[index] = (None, None, "Rasterization worker died")
+                        idle.append(self._replace(worker))
+                        continue
+                    if status == "ok":
+                        if data is None:
+                            data = bytes(worker.shm.buf[:len(mode) * size[0] * size[1]])
+                        results[index] = (payload, Image.frombytes(mode, size, data), None)
+                    else:
+                        results[index] = (None, None, payload)
+                    idle.append(worker)
+
+                now = time.monotonic()
+                for conn, (worker, index, deadline) in list(busy.items()):
+                    if now >= deadline:
+                        del busy[conn]
+                        print(f"[RasterPool] SVG {index} exceeded {timeout}s, replacing its worker")
+                        results[index] = (None, None, f"TimeoutError: rasterization exceeded {timeout}s")
+                        idle.append(self._replace(worker))
+        return results
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for worker in self.workers:
+                try:
+                    worker.conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            for worker in self.workers:
+                worker.process.join(timeout=1.0)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+                worker.conn.close()
+                worker.shm.close()
+                worker.shm.unlink()
@@ -1,13 +1,15 @@
 import numpy as np
 import cv2
+from vagen.env.svg.gt_cache import gather_gt_features
 
-def calculate_structural_accuracy(gt_im, gen_im):
+def canny_edges(im):
+    return cv2.Canny(np.array(im.convert('L')), 100, 200)
+
+def calculate_structural_accuracy(gt_im, gen_im, gt_edges=None):
     "range from 0 - 1"
-    gt_gray = np.array(gt_im.convert('L'))
-    gen_gray = np.array(gen_im.convert('L'))
-    
-    gt_edges = cv2.Canny(gt_gray, 100, 200)
-    gen_edges = cv2.Canny(gen_gray, 100, 200)
+    if gt_edges is None:
+        gt_edges = canny_edges(gt_im)
+    gen_edges = canny_edges(gen_im)
     
     intersection = np.logical_and(gt_edges, gen_edges).sum()
     union = np.logical_or(gt_edges, gen_edges).sum()
@@ -59,10 +61,12 @@ def calculate_total_score(gt_im, gen_im, gt_code, gen_code, score_config, dino_m
 
 
 def calculate_total_score_batch(gt_images, gen_images, gt_codes, gen_codes, score_configs, dino_model=None,
-                              dreamsim_model=None):
+                              dreamsim_model=None, gt_caches=None, gt_indices=None):
     """
     Batch score calculation that leverages model batch processing.
     Always calculates all scores for metrics, regardless of weights.
+    With gt_caches (GTFeatureCache or None per item) and gt_indices (dataset index per item),
+    ground-truth embeddings and edges come from the caches and only the generated images are embedded.
     """
     batch_size = len(gt_images)
     if batch_size == 0:
@@ -85,10 +89,17 @@ def calculate_total_score_batch(gt_images, gen_images, gt_codes, gen_codes, scor
     if dreamsim_model is None:
         raise ValueError("DreamSim model must be provided by the service")
     
-    dino_scores = dino_model.calculate_batch_scores(gt_images, gen_images)
-    dreamsim_scores = dreamsim_model.calculate_batch_scores(gt_images, gen_images)
+    gt_dino = gather_gt_features(dino_model.feature_name, gt_images, gt_caches, gt_indices,
+                                 lambda images: dino_model.get_features(images).cpu().numpy())
+    gt_dreamsim = gather_gt_features(dreamsim_model.feature_name, gt_images, gt_caches, gt_indices,
+                                     lambda images: dreamsim_model.embed_batch(images).cpu().numpy())
+    gt_edges = gather_gt_features("edges", gt_images, gt_caches, gt_indices,
+                                  lambda images: [canny_edges(im) for im in images])
+
+    dino_scores = dino_model.calculate_batch_scores(gt_images, gen_images, gt_features=np.stack(gt_dino))
+    dreamsim_scores = dreamsim_model.calculate_batch_scores(gt_images, gen_images, gt_features=np.stack(gt_dreamsim))
     
-    structural_scores = [calculate_structural_accuracy(gt_images[i], gen_images[i]) 
+    structural_scores = [calculate_structural_accuracy(gt_images[i], gen_images[i], gt_edges=gt_edges[i])
                           for i in range(batch_size)]
 
     # Assign scores and calculate total scores
@@ -0,0 +1,212 @@
+"""
+Dynamic micro-batching of SVG similarity scoring across concurrent callers.
+
+Each step_batch of SVGService scores whatever number of (gt, gen) pairs that request carried,
+so concurrent requests each run their own small DINOv2 / DreamSim forward pass. ScoreBatcher
+wraps a scorer and exposes the same calculate_batch_scores. Calls from all threads are queued
+per pair. One scheduler thread takes the first waiting pair, keeps collecting pairs until
+max_batch_size is reached or max_wait has passed since that pair arrived, runs the wrapped
+model's calculate_batch_scores once, and scatters the scores back through futures. Other
+attributes (get_features, embed_batch, model_size, ...) are forwarded to the wrapped model.
+
+Enabled with SVGServiceConfig.score_batching. SVGService declares step_batch concurrent, so
+BatchEnvServer runs the SVG steps of concurrent /batch/step requests (several trainers, or
+pipelined rollout groups) in parallel and their pairs meet in the batcher. A lone caller pays
+max_wait per scoring call.
+
+    python -m vagen.env.svg.score_batcher --clients 16 --pairs 4
+
+benchmarks a small CPU stand-in model with and without batching.
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+class _Pair:
+    __slots__ = ("gt_image", "gen_image", "gt_feature", "future", "enqueued")
+
+    def __init__(self, gt_image, gen_image, gt_feature):
+        self.gt_image = gt_image
+        self.gen_image = gen_image
+        self.gt_feature = gt_feature
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class ScoreBatcher:
+    """Scores (gt, gen) pairs of all callers of a model in shared batches"""
+
+    def __init__(self, model, max_batch_size: int = 64, max_wait: float = 0.005, name: str = "scorer"):
+        """
+        Args:
+            model: Scorer with calculate_batch_scores(gt_images, gen_images, gt_features=None)
+            max_batch_size: Pairs per forward pass
+            max_wait: Seconds the oldest queued pair waits for more pairs before its batch runs
+            name: Prefix of the stats keys
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.batches = 0
+        self.pairs = 0
+        self.busy_time = 0.0
+        self.queue_wait = 0.0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, attr):
+        # only called for attributes ScoreBatcher does not define
+        return getattr(self.__dict__["model"], attr)
+
+    def calculate_batch_scores(self, gt_images: List[Any], gen_images: List[Any], gt_features=None) -> List[float]:
+        """Blocking drop-in for the wrapped model's calculate_batch_scores"""
+        if self.closed:
+            raise RuntimeError(f"{self.name} batcher is closed")
+        pairs = [_Pair(gt_images[i], gen_images[i], None if gt_features is None else gt_features[i])
+                 for i in range(len(gt_images))]
+        for pair in pairs:
+            self.queue.put(pair)
+        return [pair.future.result() for pair in pairs]
+
+    def _collect(self, first: _Pair) -> List[_Pair]:
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                pair = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if pair is None:
+                self.queue.put(None)  # let the loop see the shutdown after this batch
+                break
+            batch.append(pair)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self.queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            start = time.monotonic()
+            # pairs with cached ground-truth features and pairs without run as separate calls
+            for group in ([p for p in batch if p.gt_feature is not None], [p for p in batch if p.gt_feature is None]):
+                if not group:
+                    continue
+                try:
+                    gt_features = np.stack([p.gt_feature for p in group]) if group[0].gt_feature is not None else None
+                    scores = self.model.calculate_batch_scores(
+                        [p.gt_image for p in group], [p.gen_image for p in group], gt_features=gt_features
+                    )
+                    for pair, score in zip(group, scores):
+                        pair.future.set_result(score)
+                except Exception as e:
+                    for pair in group:
+                        pair.future.set_exception(e)
+            with self.lock:
+                self.batches += 1
+                self.pairs += len(batch)
+                self.busy_time += time.monotonic() - start
+                self.queue_wait += sum(start - p.enqueued for p in batch)
+
+    def stats(self) -> Dict[str, float]:
+        """Cumulative counters since the batcher was created"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                f"{self.name}/batches": self.batches,
+                f"{self.name}/pairs": self.pairs,
+                f"{self.name}/mean_batch_size": self.pairs / self.batches if self.batches else 0.0,
+                f"{self.name}/batch_fill": self.pairs / (self.batches * self.max_batch_size) if self.batches else 0.0,
+                f"{self.name}/utilization": self.busy_time / elapsed if elapsed > 0 else 0.0,
+                f"{self.name}/mean_queue_wait_ms": 1000 * self.queue_wait / self.pairs if self.pairs else 0.0,
+                f"{self.name}/queued": self.queue.qsize(),
+            }
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    import torch
+    import torch.nn as nn
+    from PIL import Image
+
+    class StandInScorer:
+        """Small conv net with the DINO/DreamSim scorer interface, for CPU benchmarks"""
+
+        def __init__(self, size: int = 64):
+            torch.manual_seed(0)
+            self.size = size
+            self.model_size = "stand-in"
+            self.net = nn.Sequential(
+                nn.Conv2d(3, 32, 3, stride=2, padding=1), nn.ReLU(),
+                nn.Conv2d(32, 64, 3, stride=2, padding=1), nn.ReLU(),
+                nn.Conv2d(64, 128, 3, stride=2, padding=1), nn.ReLU(),
+                nn.AdaptiveAvgPool2d(1), nn.Flatten(),
+            ).eval()
+
+        def get_features(self, images):
+            x = torch.stack([torch.from_numpy(np.asarray(im.convert("RGB").resize((self.size, self.size)),
+                                                         dtype=np.float32)).permute(2, 0, 1) / 255 for im in images])
+            with torch.no_grad():
+                return self.net(x)
+
+        def calculate_batch_scores(self, gt_images, gen_images, gt_features=None):
+            gt = self.get_features(gt_images) if gt_features is None else torch.as_tensor(gt_features)
+            sims = nn.functional.cosine_similarity(gt, self.get_features(gen_images), dim=1)
+            return [(sim.item() + 1) / 2 for sim in sims]
+
+    parser = argparse.ArgumentParser(description="Throughput of concurrent scoring with and without micro-batching")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent callers")
+    parser.add_argument("--pairs", type=int, default=4, help="pairs per call")
+    parser.add_argument("--calls", type=int, default=30, help="calls per client")
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--max_wait", type=float, default=0.005)
+    parser.add_argument("--image_size", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 255, (args.image_size, args.image_size, 3), dtype=np.uint8))
+              for _ in range(2 * args.pairs)]
+    scorer = StandInScorer(args.image_size)
+
+    def run_clients(target) -> float:
+        def client():
+            for _ in range(args.calls):
+                target.calculate_batch_scores(images[:args.pairs], images[args.pairs:])
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    total = args.clients * args.calls * args.pairs
+    direct = run_clients(scorer)
+    batcher = ScoreBatcher(scorer, args.max_batch_size, args.max_wait, name="stand_in")
+    batched = run_clients(batcher)
+    expected = scorer.calculate_batch_scores(images[:args.pairs], images[args.pairs:])
+    assert np.allclose(batcher.calculate_batch_scores(images[:args.pairs], images[args.pairs:]), expected, atol=1e-5)
+    print(f"{args.clients} clients x {args.calls} calls x {args.pairs} pairs, torch threads {torch.get_num_threads()}")
+    print(f"direct:  {direct:6.2f}s  {total / direct:8.0f} pairs/s")
+    print(f"batched: {batched:6.2f}s  {total / batched:8.0f} pairs/s")
+    for key, value in batcher.stats().items():
+        print(f"  {key}: {value:.3f}")
+    batcher.close()
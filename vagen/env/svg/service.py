@@ -1,5 +1,6 @@
 from typing import Dict, List, Tuple, Optional, Any, Union
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import torch
 from vagen.env.base.base_service import BaseService
 from vagen.env.svg.env import SVGEnv
@@ -10,11 +11,16 @@ from vagen.env.svg.svg_utils import process_and_rasterize_svg, is_valid_svg
 from vagen.env.utils.context_utils import parse_llm_raw_response, convert_numpy_to_PIL
 from .service_config import SVGServiceConfig
 from vagen.env.svg.svg_utils import (process_and_rasterize_svg, is_valid_svg, load_svg_dataset)
+from vagen.env.svg.gt_cache import GTFeatureCache, gt_cache_path
 import os
 
 class SVGService(BaseService):
     """Service class for SVG environments with centralized model management."""
     
+    # Concurrent steps (of different rollouts) rasterize and score in parallel, and with
+    # score_batching their DINO / DreamSim pairs share forward passes
+    CONCURRENT_METHODS = ("step_batch",)
+    
     def __init__(self, config: SVGServiceConfig):
         self.config = config
         self.max_workers = self.config.max_workers
@@ -23,6 +29,7 @@ class SVGService(BaseService):
         self.cache = {}
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         self.dataset = {}
+        self.gt_caches = {}
         
         # Store device configuration
         self.devices = {
@@ -39,6 +46,10 @@ class SVGService(BaseService):
         # Initialize model parameters
         self.model_size = self.config.model_size
         self._models = {}
+        self._scorers = {}
+        self._raster_pool = None
+        # Guards the lazily created models, scorers and raster pool against concurrent steps
+        self._lock = threading.Lock()
         
         # Pre-initialize models if configured
         if getattr(self.config, "preload_models", False):
@@ -63,24 +74,67 @@ class SVGService(BaseService):
             )
             print(f"Initialized DreamSim model on {self.devices['dreamsim']}")
     
-    def get_dino_model(self):
-        """Get the DINO model instance, initializing if necessary"""
-        if "dino" not in self._models:
-            from vagen.env.svg.dino import DINOScoreCalculator
-            self._models["dino"] = DINOScoreCalculator(
-                model_size=self.model_size, 
-                device=self.devices["dino"]
-            )
-        return self._models["dino"]
+    def get_dino_model(self, backend="torch"):
+        """Get the DINO model instance of a score backend, initializing if necessary"""
+        key = "dino" if backend == "torch" else f"dino-{backend}"
+        with self._lock:
+            if key not in self._models:
+                from vagen.env.svg.dino import DINOScoreCalculator
+                self._models[key] = DINOScoreCalculator(
+                    model_size=self.model_size, 
+                    device=self.devices["dino"],
+                    backend=backend,
+                    num_threads=self.config.get("score_threads", None)
+                )
+        return self._batched_scorer(key)
     
-    def get_dreamsim_model(self):
-        """Get the DreamSim model instance, initializing if necessary"""
-        if "dreamsim" not in self._models:
-            from vagen.env.svg.dreamsim import DreamSimScoreCalculator
-            self._models["dreamsim"] = DreamSimScoreCalculator(
-                device=self.devices["dreamsim"]
-            )
-        return self._models["dreamsim"]
+    def get_dreamsim_model(self, backend="torch"):
+        """Get the DreamSim model instance of a score backend, initializing if necessary"""
+        key = "dreamsim" if backend == "torch" else f"dreamsim-{backend}"
+        with self._lock:
+            if key not in self._models:
+                from vagen.env.svg.dreamsim import DreamSimScoreCalculator
+                self._models[key] = DreamSimScoreCalculator(
+                    device=self.devices["dreamsim"],
+                    backend=backend,
+                    num_threads=self.config.get("score_threads", None)
+                )
+        return self._batched_scorer(key)
+
+    def _batched_scorer(self, name):
+        """The model, or with score_batching its ScoreBatcher shared by concurrent step_batch calls"""
+        if not self.config.get("score_batching", False):
+            return self._models[name]
+        with self._lock:
+            if name not in self._scorers:
+                from vagen.env.svg.score_batcher import ScoreBatcher
+                self._scorers[name] = ScoreBatcher(
+                    self._models[name],
+                    max_batch_size=self.config.get("score_max_batch_size", 64),
+                    max_wait=self.config.get("score_max_wait", 0.005),
+                    name=f"{name}_scorer"
+                )
+            return self._scorers[name]
+
+    def get_stats(self) -> Dict[str, float]:
+        """Scoring and ground-truth cache counters, reported by the server's /health"""
+        stats = {}
+        for scorer in list(self._scorers.values()):
+            stats.update(scorer.stats())
+        for dataset_id, cache in self.gt_caches.items():
+            stats.update({f"gt_cache/{dataset_id}/{k}": v for k, v in cache.stats().items()})
+        return stats
+
+    def get_raster_pool(self):
+        """Get the SVG rasterization process pool, starting its workers if necessary"""
+        with self._lock:
+            if self._raster_pool is None:
+                from vagen.env.svg.raster_pool import RasterPool
+                self._raster_pool = RasterPool(
+                    num_workers=self.config.get("raster_workers", 0),
+                    timeout=self.config.get("raster_timeout", 10.0)
+                )
+            return self._raster_pool
     
     def _config_to_env_config(self, config):
         env_config_dict = config.get('env_config', {})
@@ -105,15 +159,23 @@ class SVGService(BaseService):
                     dataset_name=env_config.dataset_name,
                     split=env_config.get("split", "train")
                 )
+                if self.config.get("use_gt_cache", False):
+                    cache_dir = self.config.get("gt_cache_dir", None)
+                    if cache_dir is not None:
+                        cache_dir = gt_cache_path(cache_dir, env_config.dataset_name, env_config.get("split", "train"))
+                    self.gt_caches[dataset_id] = GTFeatureCache(
+                        cache_dir=cache_dir,
+                        max_entries=self.config.get("gt_cache_size", 1024)
+                    )
             id_to_env_config[env_id] = (env_config, dataset_id)
                 
-        def create_single_env(env_id, env_config, dataset):
-            env = SVGEnv(env_config, dataset)
+        def create_single_env(env_id, env_config, dataset, gt_cache):
+            env = SVGEnv(env_config, dataset, gt_cache=gt_cache)
             return env_id, (env, env_config), None
         
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             futures = {
-                executor.submit(create_single_env, k, v[0], self.dataset[v[1]]): env_id 
+                executor.submit(create_single_env, k, v[0], self.dataset[v[1]], self.gt_caches.get(v[1])): env_id 
                 for k, v in id_to_env_config.items()
             }
             
@@ -181,6 +243,8 @@ class SVGService(BaseService):
         gt_codes = []
         gen_codes = []
         score_configs = []
+        gt_caches = []
+        gt_indices = []
         
         for env_id, result in env_processing_results.items():
             if result["valid"] and result["gen_image"] is not None and result["metrics"]["turn_metrics"]["svg_is_valid"]:
@@ -190,17 +254,26 @@ class SVGService(BaseService):
                 gt_codes.append(result["env"].gt_svg_code)
                 gen_codes.append(result["gen_svg_code"])
                 score_configs.append(result["env"].config.get_score_config())
+                gt_caches.append(result["env"].gt_cache)
+                gt_indices.append(result["env"].gt_index)
         
         if valid_env_ids:
-            # Get models from service
-            dino_model = self.get_dino_model()
-            dreamsim_model = self.get_dreamsim_model()
-
-            # Calculate all scores at once
-            batch_results = calculate_total_score_batch(
-                gt_images, gen_images, gt_codes, gen_codes, score_configs,
-                dino_model=dino_model, dreamsim_model=dreamsim_model
-            )
+            # Calculate all scores at once per score backend
+            batch_results = [None] * len(valid_env_ids)
+            backends = {}
+            for i, score_config in enumerate(score_configs):
+                backends.setdefault(score_config.get("score_backend", "torch"), []).append(i)
+            for backend, positions in backends.items():
+                scores = calculate_total_score_batch(
+                    [gt_images[i] for i in positions], [gen_images[i] for i in positions],
+                    [gt_codes[i] for i in positions], [gen_codes[i] for i in positions],
+                    [score_configs[i] for i in positions],
+                    dino_model=self.get_dino_model(backend),
+                    dreamsim_model=self.get_dreamsim_model(backend),
+                    gt_caches=[gt_caches[i] for i in positions], gt_indices=[gt_indices[i] for i in positions]
+                )
+                for i, score in zip(positions, scores):
+                    batch_results[i] = score
             
             # Process results and update environments
             for i, env_id in enumerate(valid_env_ids):
@@ -436,6 +509,18 @@ class SVGService(BaseService):
                 env.gen_svg_code = rst['actions'][0]
                 env.valid_actions = rst['actions']
                 
+                if self.config.get("raster_workers", 0) > 0:
+                    # rasterized below in one batch on the raster pool
+                    return env_id, {
+                        "env": env,
+                        "gen_image": None,
+                        "gen_svg_code": env.gen_svg_code,
+                        "rst": rst,
+                        "metrics": metrics,
+                        "valid": True,
+                        "done": False
+                    }, None
+
                 try:
                     _, env.gen_image = process_and_rasterize_svg(env.gen_svg_code)
                     
@@ -474,5 +559,25 @@ class SVGService(BaseService):
                     error_results[env_id] = ({}, 0.0, False, {"error": error})
                 else:
                     env_processing_results[env_id] = result
+
+        if self.config.get("raster_workers", 0) > 0:
+            self._rasterize_batch(env_processing_results)
         
-        return env_processing_results, error_results
\ No newline at end of file
+        return env_processing_results, error_results
+
+    def _rasterize_batch(self, env_processing_results):
+        """Rasterize the valid SVGs of a step on the raster pool, failed or timed out ones become invalid"""
+        env_ids = [env_id for env_id, result in env_processing_results.items() if result["valid"]]
+        if not env_ids:
+            return
+        rasterized = self.get_raster_pool().rasterize_batch(
+            [env_processing_results[env_id]["gen_svg_code"] for env_id in env_ids]
+        )
+        for env_id, (_, gen_image, error) in zip(env_ids, rasterized):
+            result = env_processing_results[env_id]
+            env = result["env"]
+            env.gen_image = gen_image
+            result["gen_image"] = gen_image
+            if gen_image is None:
+                env.valid_actions = []
+                result["valid"] = False
\ No newline at end of file
@@ -1,6 +1,6 @@
 from vagen.env.base.base_service_config import BaseServiceConfig
 from dataclasses import dataclass, fields, field
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 @dataclass
 class SVGServiceConfig(BaseServiceConfig):
@@ -10,4 +10,20 @@ class SVGServiceConfig(BaseServiceConfig):
     preload_models: bool = False
     # Configuration for different model devices
     device: Dict[str, Any] = field(default_factory=lambda: {"dino": 0, "dreamsim": 0})
-    use_state_reward: bool = False
\ No newline at end of file
+    use_state_reward: bool = False
+    # Processes rasterizing generated SVGs with a hard per-SVG timeout (seconds), 0 rasterizes in the step threads
+    raster_workers: int = 4
+    raster_timeout: float = 10.0
+    # Ground-truth rasters, embeddings and edge maps cached per dataset index (see gt_cache.py),
+    # persisted under gt_cache_dir when set
+    use_gt_cache: bool = True
+    gt_cache_dir: Optional[str] = None
+    gt_cache_size: int = 1024
+    # Score pairs of concurrent step_batch calls in shared DINO / DreamSim batches (see score_batcher.py).
+    # BatchEnvServer runs SVG steps of concurrent requests in parallel, so their pairs are merged;
+    # a lone caller waits score_max_wait per model
+    score_batching: bool = True
+    score_max_batch_size: int = 64
+    score_max_wait: float = 0.005
+    # Intra-op threads of the CPU score backends (torch's thread pool is process-wide), None keeps torch's default
+    score_threads: Optional[int] = None
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Deferred state rewards: judge calls that run in the background while the rollout continues.
+
+With `async_state_reward` in the service config, the service_state_reward_wrapper* decorators
+submit the LLM-judge call of a step_batch to a background thread and return the step results
+at once. Every judged turn gets a ticket in info["pending_state_reward"]; the rollout manager
+collects the rewards of all tickets with collect_state_rewards_batch before it builds the
+update batch, and adds them to the recorded reward of the turn they belong to.
+
+A judge call that fails, or is still running `state_reward_timeout` seconds after it was
+submitted, gives every pending judgment `state_reward_fallback_score` instead. Tickets of
+environments closed before they were collected are dropped by close_batch.
+"""
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# Judge calls are serialized per process by run_llm_judge, a few threads are enough to queue them
+_JUDGE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="state_reward_judge")
+
+
+class DeferredStateRewards:
+    """Judge calls of one service that have not been collected yet"""
+
+    def __init__(self):
+        self.pending = {}  # env_id -> list of (ticket, batch, item indices of the env in the batch)
+        self.lock = threading.Lock()
+
+    def submit(self, step_batch_results: Dict, input_to_llm: List[Dict], judge_func: Callable,
+               score_func: Callable) -> Dict:
+        """
+        Start judging input_to_llm in the background and give every judged turn a ticket.
+
+        Args:
+            step_batch_results: Results of step_batch, info of judged turns gets "pending_state_reward"
+            input_to_llm: Judge inputs, each with the env "id" it belongs to
+            judge_func: Called with input_to_llm, returns one result per input
+            score_func: Called as score_func(item, result) -> score in [0, 1] when collected
+
+        Returns:
+            step_batch_results
+        """
+        batch = {
+            "future": _JUDGE_EXECUTOR.submit(judge_func, input_to_llm),
+            "submitted_at": time.time(),
+            "items": input_to_llm,
+            "score_func": score_func,
+        }
+        indices = {}
+        for i, item in enumerate(input_to_llm):
+            indices.setdefault(item["id"], []).append(i)
+        with self.lock:
+            for env_id, item_indices in indices.items():
+                ticket = uuid.uuid4().hex
+                step_batch_results[env_id][3]["pending_state_reward"] = ticket
+                self.pending.setdefault(env_id, []).append((ticket, batch, item_indices))
+        return step_batch_results
+
+    def collect(self, env_configs: Dict[str, Any], env_ids: List[str], timeout: float,
+                fallback_score: float) -> Dict[str, Dict[str, Dict]]:
+        """
+        Wait for the judge calls of env_ids (each at most until its timeout) and score them.
+
+        Returns:
+            {env_id: {ticket: {"reward": weighted state reward of the turn, "turn_metrics": {...}}}}
+        """
+        with self.lock:
+            collected = {env_id: self.pending.pop(env_id) for env_id in env_ids if env_id in self.pending}
+        results = {}
+        for env_id, tickets in collected.items():
+            # the env may be closed while its judge calls are awaited
+            env_config = env_configs.get(env_id, {})
+            for ticket, batch, item_indices in tickets:
+                try:
+                    remaining = batch["submitted_at"] + timeout - time.time()
+                    judged = batch["future"].result(timeout=max(remaining, 0))
+                except Exception as e:
+                    print(f"[StateReward] Judge call failed or timed out, using fallback score: {type(e).__name__}: {e}")
+                    judged = None
+                entry = {"reward": 0.0, "turn_metrics": {"state_reward_fallback": float(judged is None)}}
+                for i in item_indices:
+                    item = batch["items"][i]
+                    score = fallback_score if judged is None else batch["score_func"](item, judged[i])
+                    weighted = score * env_config.get(f"{item['type']}_reward_weight", 0.5)
+                    entry["turn_metrics"][f"{item['type']}_reward"] = weighted
+                    entry["reward"] += weighted
+                results.setdefault(env_id, {})[ticket] = entry
+        return results
+
+    def discard(self, env_ids: List[str]) -> None:
+        """Drop the uncollected tickets of env_ids (closed environments)"""
+        with self.lock:
+            for env_id in env_ids:
+                self.pending.pop(env_id, None)
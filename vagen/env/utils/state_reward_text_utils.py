@@ -16,6 +16,13 @@ import asyncio
 import time
 from vagen.server.llm_as_judge import run_llm_judge
 from vagen.server.llm_as_judge_sokoban_frozenlake import run_llm_judge as run_llm_judge_new
+from vagen.env.utils.deferred_state_reward import DeferredStateRewards
+
+def defer_state_rewards(service, step_batch_results, input_to_llm, judge_func, score_func):
+    """Judge in the background, the rewards are collected later with collect_state_rewards_batch"""
+    if getattr(service, "deferred_state_rewards", None) is None:
+        service.deferred_state_rewards = DeferredStateRewards()
+    return service.deferred_state_rewards.submit(step_batch_results, input_to_llm, judge_func, score_func)
 
 def env_state_reward_wrapper(step_func):
     def wrapped_step(self, action_str):
@@ -82,6 +89,9 @@ def service_state_reward_wrapper(step_batch_func):
                         "env_name": env_name,
                     })
                     
+        if len(input_to_llm) > 0 and self.config.get("async_state_reward", False):
+            return defer_state_rewards(self, step_batch_results, input_to_llm, run_llm_judge,
+                                       score_func=lambda item, result: result["score"])
         if len(input_to_llm) > 0:
             # Use synchronous batch processing
             results = run_llm_judge(input_to_llm)
@@ -140,6 +150,10 @@ def service_state_reward_wrapper_v2(step_batch_func):
                         "prompt":prompt
                     })
                     
+        if len(input_to_llm) > 0 and self.config.get("async_state_reward", False):
+            return defer_state_rewards(self, step_batch_results, input_to_llm, run_llm_judge_new,
+                                       score_func=lambda item, result: self.calculate_visual_reasoning_reward(
+                                           response=result["parsed_response"], state=item["state"]))
         if len(input_to_llm) > 0:
             # Use synchronous batch processing
             results = run_llm_judge_new(input_to_llm) # a dict containing a set of metrics
@@ -170,6 +184,29 @@ def service_state_reward_wrapper_v2(step_batch_func):
     return wrapped_step_batch
 
 
+def _track_top_strings(self, input_to_llm):
+    """
+    Count the judged grounding/world-modeling strings for the repetition penalty of v3,
+    returns the top-k strings per type after counting them
+    """
+    grounding_contents= []
+    worldmodeling_contents = []
+    for item in input_to_llm:
+        if item["type"] == "grounding":
+            grounding_contents.append(item["content"])
+        elif item["type"] == "worldmodeling":
+            worldmodeling_contents.append(item["content"])
+    self.top_strings_tracker_grounding.add_strings(grounding_contents)
+    self.top_strings_tracker_worldmodeling.add_strings(worldmodeling_contents)
+    self.top_strings_tracker_grounding.trim_to_m()
+    self.top_strings_tracker_worldmodeling.trim_to_m()
+    # Judged against the trackers as of this step, also when the reward is computed at collect time
+    return {
+        "grounding": self.top_strings_tracker_grounding.get_top_k(self.config.top_strings_k),
+        "worldmodeling": self.top_strings_tracker_worldmodeling.get_top_k(self.config.top_strings_k),
+    }
+
+
 def service_state_reward_wrapper_v3(step_batch_func):
     def wrapped_step_batch(self, ids2actions):
         # Call the original step_batch function
@@ -204,6 +241,13 @@ def service_state_reward_wrapper_v3(step_batch_func):
                         "prompt":prompt
                     })
                     
+        if len(input_to_llm) > 0 and self.config.get("async_state_reward", False):
+            top_k_strings = _track_top_strings(self, input_to_llm)
+            return defer_state_rewards(self, step_batch_results, input_to_llm, run_llm_judge_new,
+                                       score_func=lambda item, result: self.calculate_visual_reasoning_reward(
+                                           response=result["parsed_response"], state=item["state"], content=item["content"],
+                                           r_type=item["type"], env_name=item["env_name"], prompt=item["prompt"],
+                                           top_k_strings=top_k_strings[item["type"]]))
         if len(input_to_llm) > 0:
             # Use synchronous batch processing
             results = run_llm_judge_new(input_to_llm) # a dict containing a set of metrics
@@ -211,17 +255,7 @@ def service_state_reward_wrapper_v3(step_batch_func):
             return step_batch_results
         
         new_step_batch_results = {id: list(result) for id, result in step_batch_results.items()}
-        grounding_contents= []
-        worldmodeling_contents = []
-        for item in input_to_llm:
-            if item["type"] == "grounding":
-                grounding_contents.append(item["content"])
-            elif item["type"] == "worldmodeling":
-                worldmodeling_contents.append(item["content"])
-        self.top_strings_tracker_grounding.add_strings(grounding_contents)
-        self.top_strings_tracker_worldmodeling.add_strings(worldmodeling_contents)
-        self.top_strings_tracker_grounding.trim_to_m()
-        self.top_strings_tracker_worldmodeling.trim_to_m()
+        top_k_strings = _track_top_strings(self, input_to_llm)
         for item, result in zip(input_to_llm, results):
             id = item["id"]
             state=item["state"]
@@ -237,7 +271,8 @@ def service_state_reward_wrapper_v3(step_batch_func):
                 "content": content,
                 "r_type": r_type,
                 "env_name": env_name,
-                "prompt": prompt
+                "prompt": prompt,
+                "top_k_strings": top_k_strings[r_type],
             }
             score=self.calculate_visual_reasoning_reward(**kwargs)
             if item["type"] == "grounding":
@@ -0,0 +1,280 @@
+"""
+Tile-atlas renderer for grid-world vision observations.
+
+Sokoban (gym_sokoban's room_to_rgb) and FrozenLake (gymnasium's pygame renderer) draw every
+cell independently, so a frame is fully determined by one tile id per cell. A TileAtlas holds
+those tiles as one (num_tiles, tile_h, tile_w, 3) array, loaded once per process, and composes
+frames by fancy-indexing the atlas with the grid of tile ids:
+
+    atlas = sokoban_atlas()
+    frame = atlas.render(sokoban_tile_ids(room_state, room_fixed))            # (H*16, W*16, 3)
+    frames = atlas.render_batch(np.stack([...]))                               # (N, H*16, W*16, 3)
+
+TileRenderer additionally keeps the previous frame of one environment and only redraws the
+cells whose tile id changed. Both produce exactly the pixels of the original renderers, see
+the golden-image check in __main__.
+"""
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class TileAtlas:
+    """Tiles of one size, frames are composed by indexing them with a grid of tile ids"""
+
+    def __init__(self, tiles: np.ndarray, frame_size: Optional[Tuple[int, int]] = None):
+        """
+        Args:
+            tiles: (num_tiles, tile_h, tile_w, 3) uint8
+            frame_size: (height, width) of the frame, if larger than the grid of tiles the
+                remaining pixels are black (pygame windows that are not a multiple of the cell size)
+        """
+        self.tiles = np.ascontiguousarray(tiles, dtype=np.uint8)
+        self.tile_size = self.tiles.shape[1:3]
+        self.frame_size = frame_size
+
+    def _frame_shape(self, grid_shape) -> Tuple[int, int]:
+        if self.frame_size is not None:
+            return self.frame_size
+        return grid_shape[0] * self.tile_size[0], grid_shape[1] * self.tile_size[1]
+
+    def render_batch(self, grids: np.ndarray) -> np.ndarray:
+        """
+        Render many grids of the same shape at once.
+
+        Args:
+            grids: (N, H, W) tile ids
+
+        Returns:
+            (N, frame_h, frame_w, 3) uint8 frames
+        """
+        grids = np.asarray(grids)
+        num, height, width = grids.shape
+        tile_h, tile_w = self.tile_size
+        # (N, H, W, th, tw, 3) -> (N, H, th, W, tw, 3) -> (N, H*th, W*tw, 3)
+        frames = self.tiles[grids].transpose(0, 1, 3, 2, 4, 5).reshape(num, height * tile_h, width * tile_w, 3)
+        frame_h, frame_w = self._frame_shape((height, width))
+        if (frame_h, frame_w) == frames.shape[1:3]:
+            return frames
+        padded = np.zeros((num, frame_h, frame_w, 3), dtype=np.uint8)
+        padded[:, :frames.shape[1], :frames.shape[2]] = frames
+        return padded
+
+    def render(self, grid: np.ndarray) -> np.ndarray:
+        """Render one (H, W) grid of tile ids"""
+        return self.render_batch(np.asarray(grid)[None])[0]
+
+
+class TileRenderer:
+    """Renders one environment's frames, redrawing only the cells that changed since the previous frame"""
+
+    def __init__(self, atlas: TileAtlas):
+        self.atlas = atlas
+        self.grid = None
+        self.frame = None
+
+    def reset(self) -> None:
+        self.grid = None
+        self.frame = None
+
+    def render(self, grid: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            grid: (H, W) tile ids
+
+        Returns:
+            A new (frame_h, frame_w, 3) uint8 frame, earlier frames are not modified
+        """
+        grid = np.array(grid)
+        if self.grid is None or self.grid.shape != grid.shape:
+            frame = self.atlas.render(grid)
+        else:
+            frame = self.frame.copy()
+            tile_h, tile_w = self.atlas.tile_size
+            for row, col in zip(*np.nonzero(grid != self.grid)):
+                frame[row * tile_h:(row + 1) * tile_h, col * tile_w:(col + 1) * tile_w] = self.atlas.tiles[grid[row, col]]
+        self.grid, self.frame = grid, frame
+        return frame
+
+
+# ---------------------------------------------------------------------------
+# Sokoban: tile id = gym_sokoban surface id (wall, floor, target, box on target, box, player, player on target)
+# ---------------------------------------------------------------------------
+
+SOKOBAN_SURFACES = ("wall", "floor", "box_target", "box_on_target", "box", "player", "player_on_target")
+
+
+@lru_cache(maxsize=None)
+def sokoban_atlas() -> TileAtlas:
+    """The 16x16 surfaces room_to_rgb draws, loaded once per process"""
+    import imageio
+    import gym_sokoban.envs.render_utils as render_utils
+    surface_dir = os.path.join(os.path.dirname(render_utils.__file__), "surface")
+    tiles = np.stack([imageio.imread(os.path.join(surface_dir, f"{name}.png")) for name in SOKOBAN_SURFACES])
+    return TileAtlas(tiles)
+
+
+def sokoban_tile_ids(room_state: np.ndarray, room_fixed: np.ndarray) -> np.ndarray:
+    """Tile ids of a room, as room_to_rgb(room_state, room_fixed) picks its surfaces"""
+    return np.where((room_state == 5) & (room_fixed == 2), 6, room_state)
+
+
+# ---------------------------------------------------------------------------
+# FrozenLake: tile id = cell kind * 2 + agent on the cell
+# ---------------------------------------------------------------------------
+
+FROZENLAKE_KINDS = ("hole", "ice", "ice_crack_a", "ice_crack_b", "start", "goal")
+_HOLE, _ICE, _CRACK_A, _CRACK_B, _START, _GOAL = range(len(FROZENLAKE_KINDS))
+
+
+def frozenlake_cell_kinds(desc: np.ndarray) -> np.ndarray:
+    """Kind of every cell of a map, frozen cells get gymnasium's position-based crack texture"""
+    desc = np.asarray(desc, dtype="c")
+    rows, cols = np.indices(desc.shape)
+    crack = (cols * 3 + rows * 5) % 7
+    kinds = np.where(crack == 0, _CRACK_A, np.where(crack == 1, _CRACK_B, _ICE))
+    kinds = np.where(desc == b"H", _HOLE, kinds)
+    kinds = np.where(desc == b"S", _START, kinds)
+    return np.where(desc == b"G", _GOAL, kinds)
+
+
+def frozenlake_tile_ids(cell_kinds: np.ndarray, state: int) -> np.ndarray:
+    """Tile ids of a map (cell kinds from frozenlake_cell_kinds) with the agent at state"""
+    tile_ids = cell_kinds * 2
+    row, col = divmod(int(state), cell_kinds.shape[1])
+    tile_ids[row, col] += 1
+    return tile_ids
+
+
+def frozenlake_frame_size(nrow: int, ncol: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """(cell_h, cell_w) and (frame_h, frame_w) of gymnasium's FrozenLake window"""
+    window_w, window_h = min(64 * ncol, 512), min(64 * nrow, 512)
+    return (window_h // nrow, window_w // ncol), (window_h, window_w)
+
+
+@lru_cache(maxsize=None)
+def frozenlake_atlas(nrow: int, ncol: int) -> Optional[TileAtlas]:
+    """
+    Tiles for maps of one shape, cut from frames drawn by gymnasium's own renderer so that
+    scaling and alpha blending are pygame's. Built once per shape and process.
+
+    Returns:
+        The atlas, None if the installed gymnasium draws differently (the caller keeps
+        rendering with gymnasium)
+    """
+    from gymnasium.envs.toy_text.frozen_lake import FrozenLakeEnv as GymFrozenLakeEnv
+    (cell_h, cell_w), frame_size = frozenlake_frame_size(nrow, ncol)
+    # Sides of up to 8 cells all use 64 pixel cells, a sample map of at least 8x8 covers every kind
+    sample_rows, sample_cols = max(nrow, 8), max(ncol, 8)
+    desc = np.full((sample_rows, sample_cols), b"F", dtype="c")
+    desc[0, 0], desc[0, 1], desc[0, 2] = b"S", b"G", b"H"
+    kinds = frozenlake_cell_kinds(desc)
+    # One cell of every kind, the first one in row-major order
+    cells = [np.argwhere(kinds == kind)[0] for kind in range(len(FROZENLAKE_KINDS))]
+
+    gym_env = GymFrozenLakeEnv(desc=desc, is_slippery=False)
+    try:
+        def draw(state):
+            gym_env.s = state
+            return gym_env._render_gui(mode="rgb_array")
+
+        # Agent on a frozen cell that is not one of the sampled cells, so they are drawn without it
+        sampled = {(int(r), int(c)) for r, c in cells}
+        away = next(r * sample_cols + c for r, c in zip(*np.nonzero(desc == b"F")) if (r, c) not in sampled)
+        background = draw(away)
+        tiles = []
+        for row, col in cells:
+            for frame in (background, draw(row * sample_cols + col)):
+                tiles.append(frame[row * cell_h:(row + 1) * cell_h, col * cell_w:(col + 1) * cell_w])
+        atlas = TileAtlas(np.stack(tiles), frame_size=frame_size)
+    finally:
+        gym_env.close()
+
+    # Golden-image check on random maps of the requested shape
+    rng = np.random.RandomState(0)
+    for _ in range(4):
+        desc = rng.choice([b"F", b"H"], size=(nrow, ncol), p=[0.7, 0.3]).astype("c")
+        desc[0, 0], desc[-1, -1] = b"S", b"G"
+        gym_env = GymFrozenLakeEnv(desc=desc, is_slippery=False)
+        try:
+            for state in range(nrow * ncol):
+                gym_env.s, gym_env.lastaction = state, state % 4
+                expected = gym_env._render_gui(mode="rgb_array")
+                if not np.array_equal(atlas.render(frozenlake_tile_ids(frozenlake_cell_kinds(desc), state)), expected):
+                    return None
+        finally:
+            gym_env.close()
+    return atlas
+
+
+if __name__ == "__main__":
+    # Golden-image check against room_to_rgb / gymnasium's rgb_array, and rendering throughput
+    import time
+    from gym_sokoban.envs.render_utils import room_to_rgb
+    from gymnasium.envs.toy_text.frozen_lake import FrozenLakeEnv as GymFrozenLakeEnv
+    from vagen.env.sokoban.utils import generate_room
+    from vagen.env.frozenlake.utils import generate_random_map
+    import random
+
+    rooms = []
+    for seed in range(50):
+        try:
+            room_fixed, room_state, _, _ = generate_room(dim=(6, 6), num_steps=20, num_boxes=1 + seed % 2,
+                                                        rng=random.Random(seed), np_rng=np.random.RandomState(seed))
+            rooms.append((room_fixed, room_state))
+        except (RuntimeError, RuntimeWarning):
+            continue
+    atlas = sokoban_atlas()
+    renderer = TileRenderer(atlas)
+    for room_fixed, room_state in rooms:
+        expected = room_to_rgb(room_state, room_fixed)
+        assert np.array_equal(atlas.render(sokoban_tile_ids(room_state, room_fixed)), expected)
+        assert np.array_equal(renderer.render(sokoban_tile_ids(room_state, room_fixed)), expected)
+    print(f"Sokoban: {len(rooms)} rooms match room_to_rgb")
+
+    for nrow, ncol in ((4, 6), (10, 4), (12, 12)):
+        assert frozenlake_atlas(nrow, ncol) is not None, f"atlas check failed for {nrow}x{ncol}"
+    for size in (3, 4, 6, 8, 10):
+        atlas = frozenlake_atlas(size, size)
+        assert atlas is not None, f"atlas check failed for size {size}"
+        renderer = TileRenderer(atlas)
+        for seed in range(10):
+            desc = np.asarray(generate_random_map(size=size, seed=seed), dtype="c")
+            gym_env = GymFrozenLakeEnv(desc=desc, is_slippery=False)
+            kinds = frozenlake_cell_kinds(desc)
+            for state in range(size * size):
+                gym_env.s = state
+                expected = gym_env._render_gui(mode="rgb_array")
+                assert np.array_equal(renderer.render(frozenlake_tile_ids(kinds, state)), expected), (size, seed, state)
+            gym_env.close()
+    print("FrozenLake: every agent position of 10 maps per size matches gymnasium's rgb_array")
+
+    room_fixed, room_state = rooms[0]
+    atlas = sokoban_atlas()
+    grids = np.stack([sokoban_tile_ids(room_state, room_fixed)] * 256)
+    for name, render in (
+        ("room_to_rgb", lambda: [room_to_rgb(room_state, room_fixed) for _ in range(256)]),
+        ("atlas", lambda: [atlas.render(grid) for grid in grids]),
+        ("atlas batch", lambda: atlas.render_batch(grids)),
+    ):
+        start = time.perf_counter()
+        for _ in range(5):
+            render()
+        print(f"Sokoban {name:>12}: {5 * 256 / (time.perf_counter() - start):10.0f} frames/s")
+
+    desc = np.asarray(generate_random_map(size=4, seed=0), dtype="c")
+    gym_env = GymFrozenLakeEnv(desc=desc, is_slippery=False)
+    atlas, kinds = frozenlake_atlas(4, 4), frozenlake_cell_kinds(desc)
+    renderer = TileRenderer(atlas)
+    for name, render in (
+        ("gymnasium", lambda state: gym_env._render_gui(mode="rgb_array")),
+        ("atlas", lambda state: atlas.render(frozenlake_tile_ids(kinds, state))),
+        ("incremental", lambda state: renderer.render(frozenlake_tile_ids(kinds, state))),
+    ):
+        start = time.perf_counter()
+        for i in range(1000):
+            gym_env.s = i % 16
+            render(i % 16)
+        print(f"FrozenLake {name:>12}: {1000 / (time.perf_counter() - start):10.0f} frames/s")
@@ -1,28 +1,68 @@
 import heapq
 from collections import defaultdict
-from typing import List, Set
+from typing import List, Optional, Set
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: approximate counts of any number of strings in depth x width counters.
+    Estimates never undercount; they overcount by at most 2 * total / width with
+    probability 1 - 0.5 ** depth.
+    """
+
+    def __init__(self, width: int = 16384, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = [[0] * width for _ in range(depth)]
+
+    def _cells(self, string: str):
+        # double hashing: row i uses h1 + i * h2
+        h1 = hash(string)
+        h2 = hash((string, 1)) | 1
+        return [(row, (h1 + row * h2) % self.width) for row in range(self.depth)]
+
+    def add(self, string: str, count: int = 1) -> int:
+        """Add count to a string and return its new estimate"""
+        estimate = None
+        for row, col in self._cells(string):
+            self.table[row][col] += count
+            value = self.table[row][col]
+            estimate = value if estimate is None or value < estimate else estimate
+        return estimate
+
+    def estimate(self, string: str) -> int:
+        return min(self.table[row][col] for row, col in self._cells(string))
+
 
 class TopKStringTracker:
     """
-    Efficient Top-K string tracking data structure
+    Bounded-memory Top-K string tracking (Space-Saving heavy hitters)
     
     Core ideas:
-    1. Use hash table to record string counts
-    2. Use min-heap to maintain top-m strings (heap root is the m-th largest element)
-    3. Lazy cleanup: avoid frequent heap operations
+    1. Monitor at most m strings, each with a counter that never undercounts its string
+    2. Keep the monitored counters in an indexed min-heap, so an update is O(log m)
+    3. A new string replaces the minimum counter and inherits its count (the possible
+       overcount is kept in self.error); any string occurring more than total / m times
+       is guaranteed to be monitored
+    4. Optional count-min sketch: strings entering the heap start from their sketch
+       estimate instead, and unmonitored strings get frequency estimates
     """
     
-    def __init__(self, m: int):
+    def __init__(self, m: int, sketch_width: int = 0, sketch_depth: int = 4):
         """
         Initialize the data structure
         
         Args:
             m: Maximum number of strings to retain
+            sketch_width: Counters per row of the count-min sketch, 0 disables the sketch
+            sketch_depth: Rows of the count-min sketch
         """
         self.m = m
-        self.count = defaultdict(int)  # string -> occurrence count
-        self.heap = []  # min-heap: (count, string)
-        self.in_heap = set()  # track strings in heap to avoid duplicates
+        self.heap = []  # min-heap of [count, string]
+        self.position = {}  # string -> index in heap
+        self.error = {}  # string -> maximum overcount of its counter
+        self.total = 0
+        self.sketch: Optional[CountMinSketch] = CountMinSketch(sketch_width, sketch_depth) if sketch_width > 0 else None
         
     def add_strings(self, strings: List[str]) -> None:
         """
@@ -46,55 +86,59 @@ class TopKStringTracker:
         Args:
             string_counts: Dictionary mapping strings to their occurrence counts
         """
-        # Update counts from dictionary
         for string, count in string_counts.items():
             if count <= 0:  # Skip invalid counts
                 continue
-                
-            self.count[string] += count
+            self.total += count
+            estimate = self.sketch.add(string, count) if self.sketch is not None else None
             
-            # If string is already in heap, we don't immediately update heap
-            # Instead, we perform lazy update when needed
-            if string in self.in_heap:
-                continue
-                
-            # If heap is not full, add directly
-            if len(self.heap) < self.m:
-                heapq.heappush(self.heap, (self.count[string], string))
-                self.in_heap.add(string)
+            index = self.position.get(string)
+            if index is not None:
+                self.heap[index][0] += count
+                self._sift_down(index)
+            elif len(self.heap) < self.m:
+                self.heap.append([count, string])
+                self.position[string] = len(self.heap) - 1
+                self.error[string] = 0
+                self._sift_up(len(self.heap) - 1)
             else:
-                # Heap is full, check if we need to replace the heap root
+                # Replace the minimum counter. Without a sketch the newcomer inherits the minimum
+                # (which bounds the count of every unmonitored string), with one it gets the
+                # sketch estimate, usually much tighter and likewise never an undercount
                 min_count, min_string = self.heap[0]
-                if self.count[string] > min_count:
-                    # Remove heap root
-                    heapq.heappop(self.heap)
-                    self.in_heap.remove(min_string)
-                    # Add new element
-                    heapq.heappush(self.heap, (self.count[string], string))
-                    self.in_heap.add(string)
-        
-        # Cleanup and rebuild heap (handle count update cases)
-        self._cleanup_heap()
+                new_count = min_count + count if estimate is None else estimate
+                del self.position[min_string]
+                del self.error[min_string]
+                self.heap[0] = [new_count, string]
+                self.position[string] = 0
+                self.error[string] = new_count - count
+                self._sift_down(0)
     
-    def _cleanup_heap(self) -> None:
-        """
-        Clean up outdated counts in heap and rebuild heap structure
-        """
-        # Collect current counts of all strings in heap
-        current_items = []
-        for count, string in self.heap:
-            if string in self.count:  # String still exists
-                current_items.append((self.count[string], string))
-        
-        # Rebuild heap
-        self.heap = []
-        self.in_heap = set()
-        
-        # Sort by count and take top m
-        current_items.sort(reverse=True)
-        for count, string in current_items[:self.m]:
-            heapq.heappush(self.heap, (count, string))
-            self.in_heap.add(string)
+    def _swap(self, i: int, j: int) -> None:
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i][1]] = i
+        self.position[heap[j][1]] = j
+    
+    def _sift_up(self, index: int) -> None:
+        while index > 0:
+            parent = (index - 1) // 2
+            if self.heap[index][0] >= self.heap[parent][0]:
+                break
+            self._swap(index, parent)
+            index = parent
+    
+    def _sift_down(self, index: int) -> None:
+        heap, size = self.heap, len(self.heap)
+        while True:
+            smallest = index
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
     
     def get_top_k(self, k: int) -> Set[str]:
         """
@@ -106,46 +150,28 @@ class TopKStringTracker:
         Returns:
             Set containing the top-k strings
         """
-        # Get all strings with their counts
-        all_items = [(count, string) for string, count in self.count.items()]
-        
-        # Sort and take top k
-        all_items.sort(reverse=True, key=lambda x: x[0])
-        
-        return {string for _, string in all_items[:k]}
+        return {string for _, string in heapq.nlargest(k, self.heap, key=lambda item: item[0])}
     
     def trim_to_m(self) -> None:
         """
         Keep only the top-m strings by occurrence count, delete others
+        (always the case, kept for compatibility)
         """
-        if len(self.count) <= self.m:
-            return
-        
-        # Get all strings with their counts, sort by count
-        all_items = [(count, string) for string, count in self.count.items()]
-        all_items.sort(reverse=True, key=lambda x: x[0])
-        
-        # Keep top m
-        top_m_strings = {string for _, string in all_items[:self.m]}
-        
-        # FIX: Preserve defaultdict behavior when rebuilding count dictionary
-        new_count = defaultdict(int)
-        for s in top_m_strings:
-            new_count[s] = self.count[s]
-        self.count = new_count
-        
-        # Rebuild heap
-        self.heap = [(self.count[s], s) for s in top_m_strings]
-        heapq.heapify(self.heap)
-        self.in_heap = set(top_m_strings)
+        return
     
     def size(self) -> int:
         """Return the number of strings currently stored"""
-        return len(self.count)
+        return len(self.heap)
     
     def get_count(self, string: str) -> int:
-        """Get the occurrence count of a specific string"""
-        return self.count.get(string, 0)
+        """
+        Get the (estimated) occurrence count of a specific string; monitored strings
+        are never undercounted, other strings are estimated by the sketch (0 without one)
+        """
+        index = self.position.get(string)
+        if index is not None:
+            return self.heap[index][0]
+        return self.sketch.estimate(string) if self.sketch is not None else 0
 
 
 # Enhanced test code with edge cases
@@ -209,5 +235,68 @@ def test_topk_tracker():
     print("\n=== Test Complete ===")
 
 
+def _zipf_batches(num_strings: int, batch_size: int, exponent: float, seed: int = 0):
+    """Batches of Zipf-distributed strings, standing in for judged grounding texts"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_strings, batch_size):
+        ranks = rng.zipf(exponent, size=min(batch_size, num_strings - start))
+        yield [f"The box is above and to the left of the player ({rank})." for rank in ranks]
+
+
+def test_topk_accuracy(num_strings: int = 200000, m: int = 1000, k: int = 5):
+    """Compare the tracker against exact counts on Zipfian inputs"""
+    from collections import Counter
+    print(f"\n=== TopK Accuracy Test ({num_strings} strings, m={m}) ===")
+    for exponent in (1.1, 1.5, 2.0):
+        for sketch_width in (0, 16384):
+            exact = Counter()
+            tracker = TopKStringTracker(m, sketch_width=sketch_width)
+            for batch in _zipf_batches(num_strings, 256, exponent):
+                exact.update(batch)
+                tracker.add_strings(batch)
+            true_top = {string for string, _ in exact.most_common(k)}
+            true_top_m = {string for string, _ in exact.most_common(m // 10)}
+            recall = len(tracker.get_top_k(m // 10) & true_top_m) / len(true_top_m)
+            # monitored counters never undercount and overcount by at most their error
+            for count, string in tracker.heap:
+                assert exact[string] <= count <= exact[string] + tracker.error[string]
+            max_error = max(count - exact[string] for count, string in tracker.heap)
+            assert tracker.get_top_k(k) == true_top, (tracker.get_top_k(k), true_top)
+            print(f"zipf {exponent}, sketch {sketch_width:>5}: top-{k} exact, top-{m // 10} recall {recall:.3f}, "
+                  f"max overcount {max_error} of {exact.most_common(1)[0][1]} (unique strings {len(exact)})")
+    print("✓ Top-k matches exact counts")
+
+
+def benchmark_topk_tracker(num_strings: int = 2000000, m: int = 1000, k: int = 5, batch_size: int = 256,
+                           query_every: int = 100):
+    """Throughput and memory against exact counting with a full sort per get_top_k"""
+    import time
+    from collections import Counter
+    print(f"\n=== TopK Benchmark ({num_strings} strings, batches of {batch_size}, top-{k} every {query_every}) ===")
+    batches = list(_zipf_batches(num_strings, batch_size, 1.1, seed=1))
+    
+    start = time.perf_counter()
+    exact = Counter()
+    for i, batch in enumerate(batches):
+        exact.update(batch)
+        if i % query_every == 0:
+            sorted(exact.items(), key=lambda item: item[1], reverse=True)[:k]  # old get_top_k
+    exact_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    tracker = TopKStringTracker(m)
+    for i, batch in enumerate(batches):
+        tracker.add_strings(batch)
+        if i % query_every == 0:
+            tracker.get_top_k(k)
+    tracker_time = time.perf_counter() - start
+    
+    print(f"exact counts:   {exact_time:6.2f}s, {len(exact)} strings stored")
+    print(f"space-saving:   {tracker_time:6.2f}s, {tracker.size()} strings stored")
+
+
 if __name__ == "__main__":
-    test_topk_tracker()
\ No newline at end of file
+    test_topk_tracker()
+    test_topk_accuracy()
+    benchmark_topk_tracker()
\ No newline at end of file
@@ -4,7 +4,9 @@ Defines the minimal standard interface that all model implementations must follo
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any
+
+from vagen.utils.rate_limiter import get_rate_limiter
 
 class BaseModelInterface(ABC):
     """
@@ -20,6 +22,28 @@ class BaseModelInterface(ABC):
             config: Configuration dictionary containing model parameters
         """
         self.config = config
+        self.rate_limiter = None
+        if config.get("requests_per_minute") or config.get("tokens_per_minute") or config.get("max_concurrency"):
+            self.rate_limiter = get_rate_limiter(
+                f"{config.get('provider', type(self).__name__)}:{config.get('model_name')}",
+                requests_per_minute=config.get("requests_per_minute"),
+                tokens_per_minute=config.get("tokens_per_minute"),
+                max_concurrency=config.get("max_concurrency") or 64,
+            )
+    
+    def _rate_limited(self, call: Callable[..., Dict[str, Any]], *args, **kwargs) -> Dict[str, Any]:
+        """
+        Run a single API call under the configured rate limits.
+        
+        The token bucket is charged with max_tokens up front and corrected with the
+        usage["total_tokens"] of the result.
+        """
+        if self.rate_limiter is None:
+            return call(*args, **kwargs)
+        with self.rate_limiter.limit(kwargs.get("max_tokens", self.config.get("max_tokens", 0))) as permit:
+            result = call(*args, **kwargs)
+            permit.used_tokens = result.get("usage", {}).get("total_tokens")
+        return result
         
     @abstractmethod
     def generate(self, prompts: List[Any], **kwargs) -> List[Dict[str, Any]]:
@@ -12,6 +12,12 @@ class BaseModelConfig(ABC):
     temperature: float = 0.7
     seed: Optional[int] = None
     
+    # Client-side rate limits, shared by all interfaces of a provider and model in a process
+    # (see vagen/utils/rate_limiter.py). None for no limit.
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    max_concurrency: Optional[int] = None  # upper bound of the adaptive (AIMD) concurrency window
+    
     @abstractmethod
     def config_id(self) -> str:
         """Generate a unique identifier for this configuration."""
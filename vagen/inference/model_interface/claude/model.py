@@ -64,6 +64,7 @@ class ClaudeModelInterface(BaseModelInterface):
         futures = []
         for messages, system_prompt in formatted_requests:
             future = self.executor.submit(
+                self._rate_limited,
                 self._single_api_call,
                 messages,
                 system_prompt,
@@ -42,6 +42,7 @@ class GeminiModelInterface(BaseModelInterface):
         futures = []
         for prompt in prompts:
             future = self.executor.submit(
+                self._rate_limited,
                 self._process_single_prompt,
                 prompt,
                 **kwargs
@@ -45,6 +45,7 @@ class OpenAIModelInterface(BaseModelInterface):
         futures = []
         for messages in formatted_requests:
             future = self.executor.submit(
+                self._rate_limited,
                 self._single_api_call,
                 messages,
                 **kwargs
@@ -42,6 +42,7 @@ class RouterAPIModelInterface(BaseModelInterface):
         futures = []
         for messages in formatted_requests:
             future = self.executor.submit(
+                self._rate_limited,
                 self._single_api_call,
                 messages,
                 **kwargs
@@ -48,6 +48,7 @@ class TogetherModelInterface(BaseModelInterface):
         for prompt in prompts:
             # Keep original Qwen format for processing
             future = self.executor.submit(
+                self._rate_limited,
                 self._single_api_call,
                 prompt,
                 **kwargs
@@ -0,0 +1,106 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict
+import torch
+import PIL
+
+
+class ImageProcessorCache:
+    """
+    Content-addressed cache of `processor.image_processor` outputs for single images.
+
+    Frames recur across the update batch (every trajectory of a GRPO group starts from
+    the same observation, and the same frames are re-processed whenever a trajectory is
+    rebuilt), so each distinct frame is preprocessed once per rollout. Entries are keyed by
+    a hash of the image bytes, evicted least-recently-used beyond `max_bytes`, and the
+    cache is cleared when the rollout manager resets.
+
+    Only image processors returning per-image `pixel_values` rows and `image_grid_thw`
+    (Qwen2-VL style) are cached; anything else is passed through uncached.
+    """
+
+    def __init__(self, image_processor, max_bytes: int = 2 * 1024 ** 3):
+        """
+        Args:
+            image_processor: processor.image_processor
+            max_bytes: Memory budget for cached pixel tensors
+        """
+        self.image_processor = image_processor
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (pixel_values, image_grid_thw)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        """Drop all entries, called when a new rollout starts"""
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since creation"""
+        total = self.hits + self.misses
+        return {
+            "image_cache/hits": self.hits,
+            "image_cache/misses": self.misses,
+            "image_cache/hit_rate": self.hits / total if total else 0.0,
+            "image_cache/bytes": self.current_bytes,
+        }
+
+    @staticmethod
+    def _key(image: PIL.Image.Image) -> str:
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(f"{image.mode}{image.size}".encode())
+        return digest.hexdigest()
+
+    def _insert(self, key: str, pixel_values: torch.Tensor, image_grid_thw: torch.Tensor) -> None:
+        size = pixel_values.element_size() * pixel_values.nelement()
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (pixel_values, image_grid_thw)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted.element_size() * evicted.nelement()
+
+    def __call__(self, images: List[PIL.Image.Image]) -> Dict[str, torch.Tensor]:
+        """
+        Drop-in replacement for `image_processor(images, return_tensors='pt')`.
+
+        Args:
+            images: Images of one trajectory
+
+        Returns:
+            Dictionary with pixel_values (concatenated over images) and image_grid_thw
+        """
+        keys = [self._key(image) for image in images]
+        # Entries of this call, kept locally since inserting the misses may evict cached hits
+        found = {}
+        missing = {}
+        for key, image in zip(keys, images):
+            if key in found:
+                self.hits += 1
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+                found[key] = self.entries[key]
+                self.hits += 1
+            elif key not in missing:
+                missing[key] = image
+                self.misses += 1
+
+        if missing:
+            image_inputs = self.image_processor(list(missing.values()), return_tensors='pt')
+            if set(image_inputs.keys()) != {"pixel_values", "image_grid_thw"}:
+                # Unknown output layout, cannot split per image
+                return self.image_processor(images, return_tensors='pt')
+            rows = image_inputs["image_grid_thw"].prod(-1).tolist()
+            pixel_values = torch.split(image_inputs["pixel_values"], rows, dim=0)
+            for i, key in enumerate(missing):
+                found[key] = (pixel_values[i], image_inputs["image_grid_thw"][i])
+                self._insert(key, pixel_values[i], image_inputs["image_grid_thw"][i])
+
+        parts = [found[key] for key in keys]
+        return {
+            "pixel_values": torch.cat([part[0] for part in parts], dim=0),
+            "image_grid_thw": torch.stack([part[1] for part in parts], dim=0),
+        }
@@ -0,0 +1,216 @@
+import torch
+
+
+@torch.no_grad()
+def compute_loss_mask_reference(input_ids, attention_mask, sptk_b, sptk_e, pad_token_id):
+    """
+    Row-by-row reference implementation of compute_loss_mask.
+    Used for rows the vectorized path does not cover and to check equivalence.
+
+    Args:
+        input_ids: (batch_size, seq_len)
+        attention_mask: (batch_size, seq_len)
+        sptk_b: token id marking the beginning of a response
+        sptk_e: token id marking the end of a response
+        pad_token_id: pad token id
+
+    Returns:
+        input_ids, attention_mask, loss_mask, end_of_response_position_mask: (batch_size, seq_len)
+    """
+    batch_size = input_ids.shape[0]
+    seq_len = input_ids.shape[1]
+
+    # Initialize output tensors with same shape as inputs
+    new_input_ids = input_ids.clone()
+    new_attention_mask = attention_mask.clone()
+    loss_mask = torch.zeros_like(new_attention_mask)
+    new_loss_mask = torch.zeros_like(new_attention_mask)
+    end_of_response_position_mask = torch.zeros_like(new_attention_mask)
+    new_end_of_response_position_mask = torch.zeros_like(new_attention_mask)
+    # Process each example in the batch
+    for b in range(batch_size):
+        # Count right padding tokens using attention mask
+        right_pad_tokens = (new_input_ids[b] == pad_token_id).sum().item()
+
+        # Assert that initial padding tokens have attention mask of 0
+        if not torch.all(attention_mask[b, -right_pad_tokens:] == 0):
+            print("[DEBUG]: right padding tokens must have attention mask of 0")
+
+        # Find special token indices
+        sptk_b_indices = (input_ids[b] == sptk_b).nonzero().flatten()
+        sptk_e_indices = (input_ids[b] == sptk_e).nonzero().flatten()
+
+        # Create a mask for tokens that should compute loss
+        hole_pos=[] # initialize holes position list with last padding token position
+        for start_pos, end_pos in zip(sptk_b_indices, sptk_e_indices):
+            loss_mask[b][start_pos+1:end_pos] = 1
+            end_of_response_position_mask[b][end_pos-1] = 1
+            hole_pos.append(start_pos.item())
+            hole_pos.append(end_pos.item())
+        hole_pos.append(seq_len-right_pad_tokens)
+        # assert new_input_ids[b][seq_len-right_pad_tokens]==pad_token_id
+        if not torch.all(new_input_ids[b][seq_len-right_pad_tokens:] == pad_token_id):
+            print("[DEBUG]: right padding tokens must be pad token")
+
+        # shift right to fill the wholes
+        holes_to_fill=1
+        for i in range(0,len(hole_pos)-1):
+            start_pos = hole_pos[i]
+            end_pos = hole_pos[i+1]
+            new_loss_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=loss_mask[b,start_pos+1:end_pos]
+            new_end_of_response_position_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=end_of_response_position_mask[b,start_pos+1:end_pos]
+            new_input_ids[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=input_ids[b,start_pos+1:end_pos]
+            new_attention_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=attention_mask[b,start_pos+1:end_pos]
+            holes_to_fill+=1
+
+        valid_tokens = seq_len-right_pad_tokens-len(hole_pos)+1 # the number of non-special tokens and non-padding tokens
+        new_loss_mask[b][valid_tokens:]=0
+        new_input_ids[b][valid_tokens:]=pad_token_id
+        new_attention_mask[b][valid_tokens:]=0
+
+    return new_input_ids, new_attention_mask, new_loss_mask, new_end_of_response_position_mask
+
+
+@torch.no_grad()
+def compute_loss_mask(input_ids, attention_mask, sptk_b, sptk_e, pad_token_id):
+    """
+    Vectorized loss mask computation over the whole batch, bit-identical to
+    compute_loss_mask_reference.
+
+    Every matched (sptk_b, sptk_e) pair wraps one response: tokens strictly inside get
+    loss_mask 1, the token before sptk_e gets end_of_response_position_mask 1. The special
+    tokens ("holes") are then removed by compacting each row to the left:
+    a kept token at position p moves to cumsum(keep)[p] - 1, and the freed tail is filled
+    with pad tokens and zero masks.
+
+    Rows whose special tokens are not well-formed alternating pairs (pairs nested or out of
+    order) or whose pad tokens are not all at the right end are delegated to the reference
+    implementation, whose slice-shifting semantics differ from plain compaction there.
+
+    Args:
+        input_ids: (batch_size, seq_len)
+        attention_mask: (batch_size, seq_len)
+        sptk_b: token id marking the beginning of a response
+        sptk_e: token id marking the end of a response
+        pad_token_id: pad token id
+
+    Returns:
+        input_ids, attention_mask, loss_mask, end_of_response_position_mask: (batch_size, seq_len)
+    """
+    batch_size, seq_len = input_ids.shape
+    device = input_ids.device
+
+    is_b = input_ids == sptk_b
+    is_e = input_ids == sptk_e
+    is_pad = input_ids == pad_token_id
+
+    # Content ends where the right padding starts
+    content_len = seq_len - is_pad.sum(-1, keepdim=True)
+    positions = torch.arange(seq_len, device=device).unsqueeze(0).expand(batch_size, -1)
+    in_content = positions < content_len
+
+    # zip() in the reference pairs the i-th begin token with the i-th end token and
+    # ignores the surplus (e.g. a begin token whose end was truncated away)
+    n_pairs = torch.minimum(is_b.sum(-1, keepdim=True), is_e.sum(-1, keepdim=True))
+    valid_b = is_b & (torch.cumsum(is_b, -1) <= n_pairs)
+    valid_e = is_e & (torch.cumsum(is_e, -1) <= n_pairs)
+    depth = torch.cumsum(valid_b, -1) - torch.cumsum(valid_e, -1)
+    holes = valid_b | valid_e
+
+    irregular = (
+        ((depth < 0) | (depth > 1)).any(-1)
+        | (is_pad == in_content).any(-1)
+        | (holes & ~in_content).any(-1)
+    )
+
+    mask_dtype = attention_mask.dtype
+    loss_mask = ((depth == 1) & ~valid_b).to(mask_dtype)
+    end_of_response_position_mask = torch.zeros_like(attention_mask)
+    end_of_response_position_mask[:, :-1] = valid_e[:, 1:].to(mask_dtype)
+
+    # For every output position, the input position it is copied from (seq_len: none, i.e. padding).
+    # Dropped tokens are all scattered to the extra column seq_len, which is discarded.
+    keep = in_content & ~holes
+    dest = torch.where(keep, torch.cumsum(keep, -1) - 1, seq_len)
+    src_index = torch.full((batch_size, seq_len + 1), seq_len, dtype=torch.long, device=device)
+    src_index.scatter_(1, dest, positions)
+    src_index = src_index[:, :seq_len]
+
+    def compact(values, fill_value):
+        padded = torch.cat([values, values.new_full((batch_size, 1), fill_value)], dim=-1)
+        return torch.gather(padded, 1, src_index)
+
+    new_input_ids = compact(input_ids, pad_token_id)
+    new_attention_mask = compact(attention_mask, 0)
+    new_loss_mask = compact(loss_mask, 0)
+    new_end_of_response_position_mask = compact(end_of_response_position_mask, 0)
+
+    if irregular.any():
+        idx = irregular.nonzero().flatten()
+        ref = compute_loss_mask_reference(input_ids[idx], attention_mask[idx], sptk_b, sptk_e, pad_token_id)
+        for out, ref_out in zip((new_input_ids, new_attention_mask, new_loss_mask, new_end_of_response_position_mask), ref):
+            out[idx] = ref_out
+
+    return new_input_ids, new_attention_mask, new_loss_mask, new_end_of_response_position_mask
+
+
+if __name__ == "__main__":
+    # Equivalence check on randomized inputs and micro-benchmark against the reference
+    import time
+
+    SPTK_B, SPTK_E, PAD = 1, 2, 0
+
+    def random_row(seq_len, generator, irregular=True):
+        """Random trajectory: text, responses wrapped in special tokens, right padding"""
+        row = []
+        while len(row) < seq_len:
+            row += torch.randint(3, 100, (int(torch.randint(0, 40, (1,), generator=generator)),), generator=generator).tolist()
+            response = torch.randint(3, 100, (int(torch.randint(0, 40, (1,), generator=generator)),), generator=generator).tolist()
+            row += [SPTK_B] + response + [SPTK_E]
+            if torch.rand(1, generator=generator).item() < 0.2:
+                break
+        if irregular and torch.rand(1, generator=generator).item() < 0.1:
+            # Irregular rows: stray or shuffled special tokens
+            for _ in range(3):
+                row.insert(int(torch.randint(0, len(row) + 1, (1,), generator=generator)), int(torch.randint(1, 3, (1,), generator=generator)))
+        row = row[:seq_len - int(torch.randint(0, seq_len // 4, (1,), generator=generator))]  # truncation
+        return row + [PAD] * (seq_len - len(row))
+
+    def reference_accepts(row):
+        """Irregular rows can make the reference itself fail, those are not valid inputs"""
+        try:
+            compute_loss_mask_reference(torch.tensor([row]), torch.tensor([row]).ne(PAD).long(), SPTK_B, SPTK_E, PAD)
+            return True
+        except RuntimeError:
+            return False
+
+    generator = torch.Generator().manual_seed(0)
+    for trial in range(20):
+        seq_len = int(torch.randint(8, 512, (1,), generator=generator))
+        rows = [random_row(seq_len, generator) for _ in range(16)]
+        input_ids = torch.tensor([row for row in rows if reference_accepts(row)])
+        attention_mask = (input_ids != PAD).long()
+        expected = compute_loss_mask_reference(input_ids, attention_mask, SPTK_B, SPTK_E, PAD)
+        actual = compute_loss_mask(input_ids, attention_mask, SPTK_B, SPTK_E, PAD)
+        for name, e, a in zip(("input_ids", "attention_mask", "loss_mask", "end_of_response_position_mask"), expected, actual):
+            assert torch.equal(e, a) and e.dtype == a.dtype, f"trial {trial}: {name} differs"
+    print("Vectorized loss mask matches the reference on randomized inputs")
+
+    # Full-length trajectories, reference called row by row as the rollout managers used to
+    batch_size, seq_len = 256, 8192
+    input_ids = torch.randint(3, 100, (batch_size, seq_len), generator=generator)
+    for b in range(batch_size):
+        content_len = int(torch.randint(seq_len // 2, seq_len, (1,), generator=generator))
+        input_ids[b, content_len:] = PAD
+        special_positions = torch.randperm(content_len, generator=generator)[:20].sort().values
+        input_ids[b, special_positions[0::2]] = SPTK_B
+        input_ids[b, special_positions[1::2]] = SPTK_E
+    attention_mask = (input_ids != PAD).long()
+
+    start = time.perf_counter()
+    for b in range(batch_size):
+        compute_loss_mask_reference(input_ids[b:b + 1], attention_mask[b:b + 1], SPTK_B, SPTK_E, PAD)
+    print(f"reference  (per row) {time.perf_counter() - start:8.3f}s for {batch_size} x {seq_len}")
+    start = time.perf_counter()
+    compute_loss_mask(input_ids, attention_mask, SPTK_B, SPTK_E, PAD)
+    print(f"vectorized (batched) {time.perf_counter() - start:8.3f}s for {batch_size} x {seq_len}")
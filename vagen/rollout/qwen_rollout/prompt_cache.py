@@ -0,0 +1,159 @@
+from typing import List, Dict, Optional
+from transformers import PreTrainedTokenizer
+
+VLLM_IMAGE_TOKENS = '<|vision_start|><|image_pad|><|vision_end|>'
+
+
+class PromptTokenCache:
+    """
+    Incremental per-environment cache of rollout prompt token ids.
+
+    The rollout prompt of a turn is the chat template rendered over a window of the
+    recording, followed by the generation prompt. Instead of re-rendering and re-tokenizing
+    the whole window every turn, every message is rendered and tokenized once and the
+    prompt is assembled by concatenating cached token segments:
+
+        system | user_s | assistant_{s+1} user_{s+1} | ... | generation prompt
+
+    This relies on three properties that are checked at runtime:
+        - the chat template renders a conversation as the concatenation of its messages
+          (rendering [system, message] extends rendering [system])
+        - every rendered message starts with a special token, so tokenizing the
+          concatenation equals concatenating the tokenizations
+        - a message renders the same wherever it is in the conversation (templates that
+          e.g. strip <think> from assistant turns before the last user query do not). Callers
+          compare the cached ids with the full rendering through check() until a window of
+          two or more turns matched
+    If any does not hold the cache reports itself as unsupported and callers fall
+    back to full rendering. Windows sliding forward just skip the segments that left
+    the window, nothing has to be invalidated.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizer, special_token_for_loss_mask: List[str]):
+        self.tokenizer = tokenizer
+        self.special_token_for_loss_mask = special_token_for_loss_mask
+        self.special_tokens = sorted(
+            set(tokenizer.all_special_tokens) | set(tokenizer.get_added_vocab().keys()),
+            key=len, reverse=True,
+        )
+        self.supported = True
+        self.verified = False  # a prompt of two or more turns matched the full rendering
+        self.hits = 0
+        self.misses = 0
+        self.envs = {}
+
+    def check(self, ids: List[int], expected_ids: List[int], num_turns: int) -> bool:
+        """
+        Compare cached prompt ids with the fully rendered ones, a mismatch disables the cache.
+
+        Args:
+            ids: Ids from get_prompt_ids
+            expected_ids: Ids of the full rendering of the same window
+            num_turns: Records in the window, a match of two or more marks the cache verified
+
+        Returns:
+            Whether the cached ids can be used
+        """
+        if ids != expected_ids:
+            self.supported = False
+            print("[PromptTokenCache] Cached prompt differs from the chat template rendering, "
+                  "falling back to full rendering")
+            return False
+        if num_turns >= 2:
+            self.verified = True
+        return True
+
+    def clear(self) -> None:
+        """Drop all cached environments, called when environments are reset"""
+        self.envs = {}
+
+    def _render(self, chat: List[Dict], add_generation_prompt: bool = False) -> str:
+        return self.tokenizer.apply_chat_template(chat, add_generation_prompt=add_generation_prompt, tokenize=False)
+
+    def _to_raw(self, text: str) -> str:
+        """Apply the same post-processing as the full rendering path (rollout, not final)"""
+        text = text.replace(
+            f'{self.special_token_for_loss_mask[1]}{self.tokenizer.eos_token}',
+            f'{self.tokenizer.eos_token}{self.special_token_for_loss_mask[1]}')
+        return text.replace('<image>', VLLM_IMAGE_TOKENS)
+
+    def _encode_segment(self, text: str) -> Optional[List[int]]:
+        """Tokenize a segment that will be concatenated, None if it is not safe to do so"""
+        if not any(text.startswith(token) for token in self.special_tokens):
+            self.supported = False
+            return None
+        return self.tokenizer.encode(self._to_raw(text), add_special_tokens=False)
+
+    def _env_entry(self, env_id: str, system_prompt: str) -> Optional[Dict]:
+        entry = self.envs.get(env_id)
+        if entry is not None:
+            return entry
+        system_chat = [{"role": "system", "content": system_prompt}]
+        system_text = self._render(system_chat)
+        generation_text = self._render(system_chat, add_generation_prompt=True)
+        if not generation_text.startswith(system_text):
+            self.supported = False
+            return None
+        generation_ids = self._encode_segment(generation_text[len(system_text):])
+        if generation_ids is None:
+            return None
+        entry = {
+            "system_chat": system_chat,
+            "system_text": system_text,
+            "system_ids": self.tokenizer.encode(self._to_raw(system_text), add_special_tokens=False),
+            "generation_ids": generation_ids,
+            "user": {},
+            "assistant": {},
+        }
+        self.envs[env_id] = entry
+        return entry
+
+    def _message_ids(self, entry: Dict, role: str, step: int, content: str) -> Optional[List[int]]:
+        segments = entry[role]
+        if step in segments:
+            self.hits += 1
+            return segments[step]
+        self.misses += 1
+        text = self._render(entry["system_chat"] + [{"role": role, "content": content}])
+        if not text.startswith(entry["system_text"]):
+            self.supported = False
+            return None
+        ids = self._encode_segment(text[len(entry["system_text"]):])
+        if ids is not None:
+            segments[step] = ids
+        return ids
+
+    def get_prompt_ids(self, env_id: str, system_prompt: str, history: List[Dict], start_step: int,
+                       assistant_contents: List[str]) -> Optional[List[int]]:
+        """
+        Build the rollout prompt token ids of one environment.
+
+        Args:
+            env_id: Environment ID
+            system_prompt: System prompt of the environment
+            history: Records of the window, history[i] is the record of step start_step + i
+            start_step: Step of the first record of the window
+            assistant_contents: Filtered LLM responses, assistant_contents[i] belongs to history[i + 1]
+
+        Returns:
+            Token ids identical to tokenizing the fully rendered prompt, None if unsupported
+        """
+        if not self.supported:
+            return None
+        entry = self._env_entry(env_id, system_prompt)
+        if entry is None:
+            return None
+        ids = list(entry["system_ids"])
+        for i, record in enumerate(history):
+            step = start_step + i
+            if i > 0:
+                segment = self._message_ids(entry, "assistant", step, assistant_contents[i - 1])
+                if segment is None:
+                    return None
+                ids.extend(segment)
+            segment = self._message_ids(entry, "user", step, record['obs_str'])
+            if segment is None:
+                return None
+            ids.extend(segment)
+        ids.extend(entry["generation_ids"])
+        return ids
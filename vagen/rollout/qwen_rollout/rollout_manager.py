@@ -15,6 +15,7 @@ import verl.utils.torch_functional as verl_F
 from verl.utils.dataset.rl_dataset import process_image, collate_fn
 import vagen.env
 from vagen.env import REGISTERED_ENV
+from vagen.rollout.qwen_rollout.loss_mask import compute_loss_mask
 
     
 class QwenVLRolloutManager():
@@ -124,59 +125,8 @@ class QwenVLRolloutManager():
         sptk_b = self.tokenizer.convert_tokens_to_ids(self.config.special_token_for_loss_mask[0])
         sptk_e = self.tokenizer.convert_tokens_to_ids(self.config.special_token_for_loss_mask[1])
         pad_token_id = self.tokenizer.pad_token_id
-
-        batch_size = input_ids.shape[0]
-        seq_len = input_ids.shape[1]
-        
-        # Initialize output tensors with same shape as inputs
-        new_input_ids = input_ids.clone()
-        new_attention_mask = attention_mask.clone()
-        loss_mask = torch.zeros_like(new_attention_mask)
-        new_loss_mask = torch.zeros_like(new_attention_mask)
-        end_of_response_position_mask = torch.zeros_like(new_attention_mask)
-        new_end_of_response_position_mask = torch.zeros_like(new_attention_mask)
-        # Process each example in the batch
-        for b in range(batch_size):
-            # Count right padding tokens using attention mask
-            right_pad_tokens = (new_input_ids[b] == pad_token_id).sum().item()
-            
-            # Assert that initial padding tokens have attention mask of 0
-            if not torch.all(attention_mask[b, -right_pad_tokens:] == 0):
-                print("[DEBUG]: right padding tokens must have attention mask of 0")
-            
-            # Find special token indices
-            sptk_b_indices = (input_ids[b] == sptk_b).nonzero().flatten()
-            sptk_e_indices = (input_ids[b] == sptk_e).nonzero().flatten()
-            
-            # Create a mask for tokens that should compute loss
-            hole_pos=[] # initialize holes position list with last padding token position
-            for start_pos, end_pos in zip(sptk_b_indices, sptk_e_indices):
-                loss_mask[b][start_pos+1:end_pos] = 1
-                end_of_response_position_mask[b][end_pos-1] = 1
-                hole_pos.append(start_pos.item())
-                hole_pos.append(end_pos.item())
-            hole_pos.append(seq_len-right_pad_tokens)
-            # assert new_input_ids[b][seq_len-right_pad_tokens]==pad_token_id
-            if not torch.all(new_input_ids[b][seq_len-right_pad_tokens:] == pad_token_id):
-                print("[DEBUG]: right padding tokens must be pad token")
-            
-            # shift right to fill the wholes
-            holes_to_fill=1
-            for i in range(0,len(hole_pos)-1):
-                start_pos = hole_pos[i]
-                end_pos = hole_pos[i+1]
-                new_loss_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=loss_mask[b,start_pos+1:end_pos]
-                new_end_of_response_position_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=end_of_response_position_mask[b,start_pos+1:end_pos]
-                new_input_ids[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=input_ids[b,start_pos+1:end_pos]
-                new_attention_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=attention_mask[b,start_pos+1:end_pos]
-                holes_to_fill+=1
-
-            valid_tokens = seq_len-right_pad_tokens-len(hole_pos)+1 # the number of non-special tokens and non-padding tokens
-            new_loss_mask[b][valid_tokens:]=0
-            new_input_ids[b][valid_tokens:]=pad_token_id
-            new_attention_mask[b][valid_tokens:]=0
-        
-        return new_input_ids, new_attention_mask, new_loss_mask, new_end_of_response_position_mask
+        # Vectorized over the whole batch, see vagen/rollout/qwen_rollout/loss_mask.py
+        return compute_loss_mask(input_ids, attention_mask, sptk_b, sptk_e, pad_token_id)
     
     @torch.no_grad()
     def reset(self, env_configs):
@@ -404,14 +354,15 @@ class QwenVLRolloutManager():
 
 
     @torch.no_grad()
-    def _generate_input_for_uptate(
+    def _tokenize_for_update(
             self, 
             recording: List[Dict], 
             step: int, 
             window_size: int = None,
         ):
         """
-        Given a recording, generate the final input for MLLM
+        Given a recording, render and tokenize the final trajectory for update.
+        The loss mask is computed afterwards for the whole batch at once, see _finalize_input_for_update.
         
         Args:
             recording: List of dictionaries containing recorded environment interactions
@@ -419,14 +370,7 @@ class QwenVLRolloutManager():
             window_size: Number of past steps to include in the context
         
         Returns:
-            Dictionary containing properly formatted inputs for the MLLM
-            - prompts: task instruction
-            - responses: responses generated from prompts
-            - input_ids, attention_mask, position_ids: prompts and responses generated from prompts
-            - position_ids: 
-                - position_ids for prompts: rope
-                - rest postion_ids: refer to vllm_rollout_spmd.py to check how to compute
-
+            Dictionary with the tokenized response (1, seq_len), prompt and multi-modal data
         """
 
 
@@ -460,22 +404,55 @@ class QwenVLRolloutManager():
                                                                          left_pad=True,
                                                                          truncation=self.config.truncation)
         attention_mask_prompt=torch.zeros_like(input_ids_prompt) # All prompt will be masked
+        return {
+            "row_dict": row_dict,
+            "rewards": rewards,
+            "has_images": has_images,
+            "image_grid_thw": image_grid_thw if has_images else None,
+            "input_ids_response": input_ids_response,
+            "attention_mask_response": attention_mask_response,
+            "input_ids_prompt": input_ids_prompt,
+            "attention_mask_prompt": attention_mask_prompt,
+        }
+
+    @torch.no_grad()
+    def _finalize_input_for_update(
+            self,
+            tokenized: Dict,
+            input_ids_response: torch.Tensor,
+            attention_mask_response: torch.Tensor,
+            loss_mask_response: torch.Tensor,
+            end_of_response_position_mask_response: torch.Tensor,
+        ):
+        """
+        Build the final input for MLLM from a tokenized trajectory and its loss mask
         
+        Args:
+            tokenized: Output of _tokenize_for_update
+            input_ids_response, attention_mask_response, loss_mask_response, end_of_response_position_mask_response:
+                (seq_len,) outputs of _compute_loss_mask for this trajectory
         
-        input_ids_response, attention_mask_response, loss_mask_response,end_of_response_position_mask_response = self._compute_loss_mask(input_ids_response, attention_mask_response)
+        Returns:
+            Dictionary containing properly formatted inputs for the MLLM
+            - prompts: task instruction
+            - responses: responses generated from prompts
+            - input_ids, attention_mask, position_ids: prompts and responses generated from prompts
+            - position_ids: 
+                - position_ids for prompts: rope
+                - rest postion_ids: refer to vllm_rollout_spmd.py to check how to compute
+        """
+        row_dict = tokenized["row_dict"]
+        rewards = tokenized["rewards"]
+        has_images = tokenized["has_images"]
+        image_grid_thw = tokenized["image_grid_thw"]
+        input_ids_prompt = tokenized["input_ids_prompt"]
+        attention_mask_prompt = tokenized["attention_mask_prompt"]
         
         input_ids_prompt=input_ids_prompt[0]
         attention_mask_prompt=attention_mask_prompt[0]
         loss_mask_prompt = torch.zeros_like(attention_mask_prompt)
         end_of_response_position_mask_prompt = torch.zeros_like(attention_mask_prompt)
         
-        input_ids_response=input_ids_response[0]
-        attention_mask_response=attention_mask_response[0]
-        loss_mask_response=loss_mask_response[0]
-        end_of_response_position_mask_response=end_of_response_position_mask_response[0]
-        
-    
-        
         loss_mask = torch.cat([loss_mask_prompt, loss_mask_response], dim=-1)
         end_of_response_position_mask = torch.cat([end_of_response_position_mask_prompt, end_of_response_position_mask_response], dim=-1)
         input_ids = torch.cat([input_ids_prompt, input_ids_response], dim=-1)
@@ -523,6 +500,35 @@ class QwenVLRolloutManager():
         row_dict["step_reward_sum"] = sum(rewards)
         return row_dict
 
+    @torch.no_grad()
+    def _generate_input_for_uptate(
+            self, 
+            recording: List[Dict], 
+            step: int, 
+            window_size: int = None,
+        ):
+        """
+        Given a recording, generate the final input for MLLM (single trajectory)
+        
+        Args:
+            recording: List of dictionaries containing recorded environment interactions
+            step: Current step to generate input for
+            window_size: Number of past steps to include in the context
+        
+        Returns:
+            Dictionary containing properly formatted inputs for the MLLM, see _finalize_input_for_update
+        """
+        tokenized = self._tokenize_for_update(recording, step, window_size)
+        input_ids_response, attention_mask_response, loss_mask_response, end_of_response_position_mask_response = self._compute_loss_mask(
+            tokenized["input_ids_response"], tokenized["attention_mask_response"])
+        return self._finalize_input_for_update(
+            tokenized,
+            input_ids_response[0],
+            attention_mask_response[0],
+            loss_mask_response[0],
+            end_of_response_position_mask_response[0],
+        )
+
     @torch.no_grad()
     def generate_batch_for_rollout(self, step, window_size):
         """
@@ -619,12 +625,22 @@ class QwenVLRolloutManager():
             batch (DataProto): batch of final trajectory of all environments
         """
         batch_list = []
-        for env_id in self.envs.keys():
-            row_dict = self._generate_input_for_uptate(
+        env_ids = list(self.envs.keys())
+        tokenized_list = [
+            self._tokenize_for_update(
                 recording=self.recorder[env_id],
                 step=self.env_states[env_id]['step'],
                 window_size=None,
             )
+            for env_id in env_ids
+        ]
+        # Loss masks of all trajectories in one vectorized call (responses share the same padded length)
+        loss_mask_rst = self._compute_loss_mask(
+            torch.cat([tokenized["input_ids_response"] for tokenized in tokenized_list], dim=0),
+            torch.cat([tokenized["attention_mask_response"] for tokenized in tokenized_list], dim=0),
+        ) if tokenized_list else None
+        for i, env_id in enumerate(env_ids):
+            row_dict = self._finalize_input_for_update(tokenized_list[i], *(tensor[i] for tensor in loss_mask_rst))
             step_reward_sum= row_dict['step_reward_sum']
             last_reward=self.envs[env_id].compute_reward()
             row_dict['reward_model'] = {"style": "given", "ground_truth": {"reward": last_reward+step_reward_sum}}
@@ -1,6 +1,8 @@
 
 from typing import List, Union, Optional, Dict
 import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 import torch
 import numpy as np
@@ -15,7 +17,10 @@ import verl.utils.torch_functional as verl_F
 from verl.utils.dataset.rl_dataset import process_image, collate_fn
 import vagen.env
 from vagen.env import REGISTERED_ENV
-from vagen.server.client import BatchEnvClient
+from vagen.rollout.qwen_rollout.loss_mask import compute_loss_mask
+from vagen.server.cluster_client import make_env_client
+from vagen.rollout.qwen_rollout.prompt_cache import PromptTokenCache
+from vagen.rollout.qwen_rollout.image_cache import ImageProcessorCache
     
 class QwenVLRolloutManagerService():
     def __init__(self,
@@ -35,7 +40,29 @@ class QwenVLRolloutManagerService():
         self.system_prompts = None # dict env_id:str
         self.env_states = None # dict
         self.batch_idx_to_env_id = None # dict
-        self.env_client = BatchEnvClient(base_url=self.config.base_url,timeout=self.config.timeout,max_workers=self.config.max_workers)
+        # base_url may be a list of servers, environments are then sharded across them
+        self.env_client = make_env_client(
+            base_url=self.config.base_url,
+            timeout=self.config.timeout,
+            max_workers=self.config.max_workers,
+            wire_format=self.config.get("wire_format", "json"),
+            placement=self.config.get("env_placement", "latency"),
+            rebalance_tolerance=self.config.get("env_rebalance_tolerance", 0.25),
+        )
+        # State rewards still being judged on the server (async_state_reward): ticket -> (env_id, record index)
+        self.pending_state_rewards = {}
+        # Rollout timings of the last rollout_loop, in seconds, merged into the trainer's timing_raw
+        self.timing_raw = {}
+        self.step_executor = None
+        # Per-env cache of rollout prompt token ids, so each turn only tokenizes the new messages
+        self.prompt_cache = PromptTokenCache(tokenizer, config.special_token_for_loss_mask) if config.get('use_prompt_cache', True) else None
+        # Content-hash cache of image_processor outputs, so each distinct frame is preprocessed once per rollout
+        self.image_cache = None
+        if processor is not None and config.get('use_image_cache', True):
+            self.image_cache = ImageProcessorCache(
+                processor.image_processor,
+                max_bytes=int(config.get('image_cache_max_mb', 2048) * 1024 ** 2),
+            )
 
     @torch.no_grad()
     def _handle_special_tokens(self, llm_raw_response: str, prep_for_loss_mask: bool) -> str:
@@ -72,7 +99,10 @@ class QwenVLRolloutManagerService():
         row_dict['multi_modal_data'] = {'image': image_data}
         image_grid_thw = None
         if do_embedding:
-            image_inputs = self.processor.image_processor(image_data, return_tensors='pt')
+            if self.image_cache is not None:
+                image_inputs = self.image_cache(image_data)
+            else:
+                image_inputs = self.processor.image_processor(image_data, return_tensors='pt')
             image_grid_thw = image_inputs['image_grid_thw']
             row_dict['multi_modal_inputs'] = {key: val for key, val in image_inputs.items()}
             # print(f"[DEBUG] number of image_data in rollout: {len(image_data)}")
@@ -128,59 +158,8 @@ class QwenVLRolloutManagerService():
         sptk_b = self.tokenizer.convert_tokens_to_ids(self.config.special_token_for_loss_mask[0])
         sptk_e = self.tokenizer.convert_tokens_to_ids(self.config.special_token_for_loss_mask[1])
         pad_token_id = self.tokenizer.pad_token_id
-
-        batch_size = input_ids.shape[0]
-        seq_len = input_ids.shape[1]
-        
-        # Initialize output tensors with same shape as inputs
-        new_input_ids = input_ids.clone()
-        new_attention_mask = attention_mask.clone()
-        loss_mask = torch.zeros_like(new_attention_mask)
-        new_loss_mask = torch.zeros_like(new_attention_mask)
-        end_of_response_position_mask = torch.zeros_like(new_attention_mask)
-        new_end_of_response_position_mask = torch.zeros_like(new_attention_mask)
-        # Process each example in the batch
-        for b in range(batch_size):
-            # Count right padding tokens using attention mask
-            right_pad_tokens = (new_input_ids[b] == pad_token_id).sum().item()
-            
-            # Assert that initial padding tokens have attention mask of 0
-            if not torch.all(attention_mask[b, -right_pad_tokens:] == 0):
-                print("[DEBUG]: right padding tokens must have attention mask of 0")
-            
-            # Find special token indices
-            sptk_b_indices = (input_ids[b] == sptk_b).nonzero().flatten()
-            sptk_e_indices = (input_ids[b] == sptk_e).nonzero().flatten()
-            
-            # Create a mask for tokens that should compute loss
-            hole_pos=[] # initialize holes position list with last padding token position
-            for start_pos, end_pos in zip(sptk_b_indices, sptk_e_indices):
-                loss_mask[b][start_pos+1:end_pos] = 1
-                end_of_response_position_mask[b][end_pos-1] = 1
-                hole_pos.append(start_pos.item())
-                hole_pos.append(end_pos.item())
-            hole_pos.append(seq_len-right_pad_tokens)
-            # assert new_input_ids[b][seq_len-right_pad_tokens]==pad_token_id
-            if not torch.all(new_input_ids[b][seq_len-right_pad_tokens:] == pad_token_id):
-                print("[DEBUG]: right padding tokens must be pad token")
-            
-            # shift right to fill the wholes
-            holes_to_fill=1
-            for i in range(0,len(hole_pos)-1):
-                start_pos = hole_pos[i]
-                end_pos = hole_pos[i+1]
-                new_loss_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=loss_mask[b,start_pos+1:end_pos]
-                new_end_of_response_position_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=end_of_response_position_mask[b,start_pos+1:end_pos]
-                new_input_ids[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=input_ids[b,start_pos+1:end_pos]
-                new_attention_mask[b,start_pos+1-holes_to_fill:end_pos-holes_to_fill]=attention_mask[b,start_pos+1:end_pos]
-                holes_to_fill+=1
-
-            valid_tokens = seq_len-right_pad_tokens-len(hole_pos)+1 # the number of non-special tokens and non-padding tokens
-            new_loss_mask[b][valid_tokens:]=0
-            new_input_ids[b][valid_tokens:]=pad_token_id
-            new_attention_mask[b][valid_tokens:]=0
-        
-        return new_input_ids, new_attention_mask, new_loss_mask, new_end_of_response_position_mask
+        # Vectorized over the whole batch, see vagen/rollout/qwen_rollout/loss_mask.py
+        return compute_loss_mask(input_ids, attention_mask, sptk_b, sptk_e, pad_token_id)
     
     @torch.no_grad()
     def reset(self, env_configs):
@@ -258,6 +237,11 @@ class QwenVLRolloutManagerService():
         if self.recorder is not None:
             del self.recorder
         self.recorder = defaultdict(list)
+        self.pending_state_rewards = {}
+        if self.prompt_cache is not None:
+            self.prompt_cache.clear()
+        if self.image_cache is not None:
+            self.image_cache.clear()
         initial_obs = {}
         initial_info = {}
         
@@ -388,21 +372,26 @@ class QwenVLRolloutManagerService():
                 - position_ids for prompts: rope
                 - rest postion_ids: refer to vllm_rollout_spmd.py to check how to compute
         """
-        rst=self._single_recording_to_prompt(recording, step, window_size, is_final=False, prep_for_loss_mask=False)
-        prompt_with_chat_template=rst['prompt']
-        image_data=rst['image_data']        
-        has_images = len(image_data) > 0        
-
         row_dict = {}
-        if has_images:  # expand image token
-            prompt_with_chat_template, row_dict, _, raw_prompt = self._handle_multi_modal_data(
-                prompt_with_chat_template, row_dict, image_data, do_embedding=False)
-        else:
-            raw_prompt = prompt_with_chat_template
+        raw_prompt_ids = None
+        if self.prompt_cache is not None:
+            raw_prompt_ids, image_data = self._cached_prompt_ids_for_rollout(recording, step, window_size)
+            if raw_prompt_ids is not None and (not self.prompt_cache.verified or self.config.get('verify_prompt_cache', False)):
+                # Checked against the full rendering until a multi-turn window matched once
+                expected_ids = self._full_prompt_ids_for_rollout(recording, step, window_size, {})
+                if self.config.get('verify_prompt_cache', False):
+                    assert raw_prompt_ids == expected_ids, "Prompt cache produced different raw_prompt_ids"
+                start_step = max(0, step - window_size) if window_size is not None else 0
+                if not self.prompt_cache.check(raw_prompt_ids, expected_ids, step + 1 - start_step):
+                    raw_prompt_ids = None
+            if raw_prompt_ids is not None and image_data:
+                row_dict['multi_modal_data'] = {'image': image_data}
+        if raw_prompt_ids is None:
+            raw_prompt_ids = self._full_prompt_ids_for_rollout(recording, step, window_size, row_dict)
 
         # use random input_ids and attention_mask for vllm only takes raw_prompt_ids as input when generating sequences
         # TODO check if this is correct
-        row_dict['raw_prompt_ids'] = self.tokenizer.encode(raw_prompt, add_special_tokens=False)
+        row_dict['raw_prompt_ids'] = raw_prompt_ids
         row_dict['input_ids'] = torch.tensor([0], dtype=torch.long)
         row_dict['attention_mask'] = torch.tensor([0], dtype=torch.long)
         row_dict['position_ids'] = torch.tensor([0], dtype=torch.long)
@@ -414,15 +403,50 @@ class QwenVLRolloutManagerService():
         return row_dict
 
 
+    def _full_prompt_ids_for_rollout(self, recording, step, window_size, row_dict):
+        """Render and tokenize the whole rollout prompt, filling multi_modal_data in row_dict"""
+        rst=self._single_recording_to_prompt(recording, step, window_size, is_final=False, prep_for_loss_mask=False)
+        prompt_with_chat_template=rst['prompt']
+        image_data=rst['image_data']        
+        has_images = len(image_data) > 0        
+
+        if has_images:  # expand image token
+            prompt_with_chat_template, row_dict, _, raw_prompt = self._handle_multi_modal_data(
+                prompt_with_chat_template, row_dict, image_data, do_embedding=False)
+        else:
+            raw_prompt = prompt_with_chat_template
+        return self.tokenizer.encode(raw_prompt, add_special_tokens=False)
+
+    def _cached_prompt_ids_for_rollout(self, recording, step, window_size):
+        """
+        Build the rollout prompt token ids from the prompt cache.
+        
+        Returns:
+            (raw_prompt_ids, image_data), raw_prompt_ids is None if the cache cannot be used
+        """
+        start_step = max(0, step - window_size) if window_size is not None else 0
+        assert len(recording) >= step + 1, 'History length is not enough'
+        history = recording[start_step: step + 1]
+        env_id = history[0]['env_id']
+        assistant_contents = [
+            self._handle_special_tokens(record['info']['llm_raw_response'], prep_for_loss_mask=False)
+            for record in history[1:]
+        ]
+        raw_prompt_ids = self.prompt_cache.get_prompt_ids(
+            env_id, self.system_prompts[env_id], history, start_step, assistant_contents)
+        image_data = [img for record in history for img in record.get('image_data', [])]
+        return raw_prompt_ids, image_data
+
     @torch.no_grad()
-    def _generate_input_for_uptate(
+    def _tokenize_for_update(
             self, 
             recording: List[Dict], 
             step: int, 
             window_size: int = None,
         ):
         """
-        Given a recording, generate the final input for MLLM
+        Given a recording, render and tokenize the final trajectory for update.
+        The loss mask is computed afterwards for the whole batch at once, see _finalize_input_for_update.
         
         Args:
             recording: List of dictionaries containing recorded environment interactions
@@ -430,14 +454,7 @@ class QwenVLRolloutManagerService():
             window_size: Number of past steps to include in the context
         
         Returns:
-            Dictionary containing properly formatted inputs for the MLLM
-            - prompts: task instruction
-            - responses: responses generated from prompts
-            - input_ids, attention_mask, position_ids: prompts and responses generated from prompts
-            - position_ids: 
-                - position_ids for prompts: rope
-                - rest postion_ids: refer to vllm_rollout_spmd.py to check how to compute
-
+            Dictionary with the tokenized response (1, seq_len), prompt and multi-modal data
         """
 
 
@@ -471,22 +488,55 @@ class QwenVLRolloutManagerService():
                                                                          left_pad=True,
                                                                          truncation=self.config.truncation)
         attention_mask_prompt=torch.zeros_like(input_ids_prompt) # All prompt will be masked
+        return {
+            "row_dict": row_dict,
+            "rewards": rewards,
+            "has_images": has_images,
+            "image_grid_thw": image_grid_thw if has_images else None,
+            "input_ids_response": input_ids_response,
+            "attention_mask_response": attention_mask_response,
+            "input_ids_prompt": input_ids_prompt,
+            "attention_mask_prompt": attention_mask_prompt,
+        }
+
+    @torch.no_grad()
+    def _finalize_input_for_update(
+            self,
+            tokenized: Dict,
+            input_ids_response: torch.Tensor,
+            attention_mask_response: torch.Tensor,
+            loss_mask_response: torch.Tensor,
+            end_of_response_position_mask_response: torch.Tensor,
+        ):
+        """
+        Build the final input for MLLM from a tokenized trajectory and its loss mask
         
+        Args:
+            tokenized: Output of _tokenize_for_update
+            input_ids_response, attention_mask_response, loss_mask_response, end_of_response_position_mask_response:
+                (seq_len,) outputs of _compute_loss_mask for this trajectory
         
-        input_ids_response, attention_mask_response, loss_mask_response,end_of_response_position_mask_response = self._compute_loss_mask(input_ids_response, attention_mask_response)
+        Returns:
+            Dictionary containing properly formatted inputs for the MLLM
+            - prompts: task instruction
+            - responses: responses generated from prompts
+            - input_ids, attention_mask, position_ids: prompts and responses generated from prompts
+            - position_ids: 
+                - position_ids for prompts: rope
+                - rest postion_ids: refer to vllm_rollout_spmd.py to check how to compute
+        """
+        row_dict = tokenized["row_dict"]
+        rewards = tokenized["rewards"]
+        has_images = tokenized["has_images"]
+        image_grid_thw = tokenized["image_grid_thw"]
+        input_ids_prompt = tokenized["input_ids_prompt"]
+        attention_mask_prompt = tokenized["attention_mask_prompt"]
         
         input_ids_prompt=input_ids_prompt[0]
         attention_mask_prompt=attention_mask_prompt[0]
         loss_mask_prompt = torch.zeros_like(attention_mask_prompt)
         end_of_response_position_mask_prompt = torch.zeros_like(attention_mask_prompt)
         
-        input_ids_response=input_ids_response[0]
-        attention_mask_response=attention_mask_response[0]
-        loss_mask_response=loss_mask_response[0]
-        end_of_response_position_mask_response=end_of_response_position_mask_response[0]
-        
-    
-        
         loss_mask = torch.cat([loss_mask_prompt, loss_mask_response], dim=-1)
         end_of_response_position_mask = torch.cat([end_of_response_position_mask_prompt, end_of_response_position_mask_response], dim=-1)
         input_ids = torch.cat([input_ids_prompt, input_ids_response], dim=-1)
@@ -536,13 +586,43 @@ class QwenVLRolloutManagerService():
         return row_dict
 
     @torch.no_grad()
-    def generate_batch_for_rollout(self, step, window_size):
+    def _generate_input_for_uptate(
+            self, 
+            recording: List[Dict], 
+            step: int, 
+            window_size: int = None,
+        ):
+        """
+        Given a recording, generate the final input for MLLM (single trajectory)
+        
+        Args:
+            recording: List of dictionaries containing recorded environment interactions
+            step: Current step to generate input for
+            window_size: Number of past steps to include in the context
+        
+        Returns:
+            Dictionary containing properly formatted inputs for the MLLM, see _finalize_input_for_update
+        """
+        tokenized = self._tokenize_for_update(recording, step, window_size)
+        input_ids_response, attention_mask_response, loss_mask_response, end_of_response_position_mask_response = self._compute_loss_mask(
+            tokenized["input_ids_response"], tokenized["attention_mask_response"])
+        return self._finalize_input_for_update(
+            tokenized,
+            input_ids_response[0],
+            attention_mask_response[0],
+            loss_mask_response[0],
+            end_of_response_position_mask_response[0],
+        )
+
+    @torch.no_grad()
+    def generate_batch_for_rollout(self, step, window_size, env_ids=None):
         """
         Generate a batch of data for the current step
         
         Args:
             step: Current step to generate input for
             window_size: Number of past steps to include in the context
+            env_ids: Environments to include (default: all environments)
         
         Returns:
             Dictionary containing properly formatted inputs for the MLLM
@@ -551,7 +631,7 @@ class QwenVLRolloutManagerService():
         batch = []
         self.batch_idx_to_env_id = {}
         batch_idx = 0
-        for env_id in self.envs.keys():
+        for env_id in (env_ids if env_ids is not None else self.envs.keys()):
             if self.env_states[env_id]['done']:
                 continue
 
@@ -568,64 +648,155 @@ class QwenVLRolloutManagerService():
         return collate_fn(batch)
     
     @torch.no_grad()
-    def rollout_loop(self):
+    def _generate_actions(self, step, env_ids=None):
         """
-        Step the environment and record the results
+        Generate the next LLM responses for the active environments
+        
+        Args:
+            step: Current step
+            env_ids: Environments to generate for (default: all environments)
         
         Returns:
-            Dictionary containing the results of the step
+            Dictionary mapping environment IDs to actions, None if all environments are done
         """
-        for step in range(self.config.max_turns):
-            input_batch_dict = self.generate_batch_for_rollout(step, self.config.window_size)
-            if input_batch_dict is None:
-                break
-            input_batch = DataProto.from_single_dict(input_batch_dict)
-            if 'multi_modal_data' in input_batch.non_tensor_batch.keys():
-                gen_batch = input_batch.pop(
-                    batch_keys=['input_ids', 'attention_mask', 'position_ids'],
-                    non_tensor_batch_keys=['raw_prompt_ids', 'multi_modal_data'],
-                )
-            else:
-                gen_batch = input_batch.pop(
-                    batch_keys=['input_ids', 'attention_mask', 'position_ids'],
-                    non_tensor_batch_keys=['raw_prompt_ids'],
-                )
+        input_batch_dict = self.generate_batch_for_rollout(step, self.config.window_size, env_ids)
+        if input_batch_dict is None:
+            return None
+        input_batch = DataProto.from_single_dict(input_batch_dict)
+        if 'multi_modal_data' in input_batch.non_tensor_batch.keys():
+            gen_batch = input_batch.pop(
+                batch_keys=['input_ids', 'attention_mask', 'position_ids'],
+                non_tensor_batch_keys=['raw_prompt_ids', 'multi_modal_data'],
+            )
+        else:
+            gen_batch = input_batch.pop(
+                batch_keys=['input_ids', 'attention_mask', 'position_ids'],
+                non_tensor_batch_keys=['raw_prompt_ids'],
+            )
 
-            # transform raw_prompt_ids to list instead of numpy array
-            # The reason is that when constructing raw_prompt_ids, if the all the list share the same length
-            # Numpy array will automatically transfer list to numpy array.
-            raw_prompt_ids = gen_batch.non_tensor_batch['raw_prompt_ids']
-            raw_prompt_ids_array = np.ndarray(shape=(len(raw_prompt_ids),), dtype=object)
-            for i in range(len(raw_prompt_ids)):
-                if isinstance(raw_prompt_ids[i],list):
-                    raw_prompt_ids_array[i] = raw_prompt_ids[i]
-                else:
-                    raw_prompt_ids_array[i] = raw_prompt_ids[i].tolist()
-            gen_batch.non_tensor_batch['raw_prompt_ids'] = raw_prompt_ids_array
-            
-            output_batch = self.actor_rollout_wg.generate_sequences(gen_batch)
-            
-            
-            
-            responses_str = self.tokenizer.batch_decode(
-                output_batch.batch['responses'], 
-                skip_special_tokens=True
-            ) # seems here will remove special token like "<|im_end|>"
-            
-            ids2actions = {}
-            for batch_idx, env_id in self.batch_idx_to_env_id.items(): 
-                ids2actions[env_id] = responses_str[batch_idx]
+        # transform raw_prompt_ids to list instead of numpy array
+        # The reason is that when constructing raw_prompt_ids, if the all the list share the same length
+        # Numpy array will automatically transfer list to numpy array.
+        raw_prompt_ids = gen_batch.non_tensor_batch['raw_prompt_ids']
+        raw_prompt_ids_array = np.ndarray(shape=(len(raw_prompt_ids),), dtype=object)
+        for i in range(len(raw_prompt_ids)):
+            if isinstance(raw_prompt_ids[i],list):
+                raw_prompt_ids_array[i] = raw_prompt_ids[i]
+            else:
+                raw_prompt_ids_array[i] = raw_prompt_ids[i].tolist()
+        gen_batch.non_tensor_batch['raw_prompt_ids'] = raw_prompt_ids_array
+        
+        gen_start = time.perf_counter()
+        output_batch = self.actor_rollout_wg.generate_sequences(gen_batch)
+        self.timing_raw['rollout_gen'] += time.perf_counter() - gen_start
+        
+        responses_str = self.tokenizer.batch_decode(
+            output_batch.batch['responses'], 
+            skip_special_tokens=True
+        ) # seems here will remove special token like "<|im_end|>"
+        
+        ids2actions = {}
+        for batch_idx, env_id in self.batch_idx_to_env_id.items(): 
+            ids2actions[env_id] = responses_str[batch_idx]
+        return ids2actions
+    
+    def _timed_step_batch(self, ids2actions):
+        """Step environments on the server, returning the results and the time spent"""
+        start = time.perf_counter()
+        step_results = self.env_client.step_batch(ids2actions)
+        return step_results, time.perf_counter() - start
+    
+    @torch.no_grad()
+    def _record_step_results(self, step_results):
+        """Update env states and record the results of a step_batch call"""
+        for env_id, rst in step_results.items():
+            obs, reward, done, info = rst
+            self.env_states[env_id]['step'] += 1
+            self.env_states[env_id]['done'] = done
+            self.env_states[env_id]['metrics']['traj_metrics'] = info['metrics'].get('traj_metrics', {})
+            for k,v in info['metrics']['turn_metrics'].items():
+                self.env_states[env_id]['metrics']['turn_metrics'][k].append(v)
             
-            step_results = self.env_client.step_batch(ids2actions)
-            for env_id, rst in step_results.items():
-                obs, reward, done, info = rst
-                self.env_states[env_id]['step'] += 1
-                self.env_states[env_id]['done'] = done
-                self.env_states[env_id]['metrics']['traj_metrics'] = info['metrics'].get('traj_metrics', {})
-                for k,v in info['metrics']['turn_metrics'].items():
+            self.record(env_id, obs, reward, done, info)
+            if info.get('pending_state_reward') is not None:
+                self.pending_state_rewards[info['pending_state_reward']] = (env_id, len(self.recorder[env_id]) - 1)
+    
+    def _resolve_state_rewards(self):
+        """
+        Add the state rewards judged in the background to the recorded reward and turn metrics
+        of the steps they belong to. Called before rewards are read from the recordings.
+        """
+        if not self.pending_state_rewards:
+            return
+        env_ids = sorted({env_id for env_id, _ in self.pending_state_rewards.values()})
+        state_rewards = self.env_client.collect_state_rewards_batch(env_ids)
+        for env_id, tickets in state_rewards.items():
+            for ticket, state_reward in tickets.items():
+                if ticket not in self.pending_state_rewards:
+                    continue  # from an earlier rollout of this env
+                _, record_idx = self.pending_state_rewards[ticket]
+                self.recorder[env_id][record_idx]['reward'] += state_reward['reward']
+                for k, v in state_reward['turn_metrics'].items():
                     self.env_states[env_id]['metrics']['turn_metrics'][k].append(v)
-                
-                self.record(env_id, obs, reward, done, info)
+        self.pending_state_rewards = {}
+    
+    @torch.no_grad()
+    def rollout_loop(self):
+        """
+        Step the environment and record the results
+        
+        With rollout_manager.pipeline_groups > 1 the environments are split into that many
+        micro-groups: while one group generates, the previous groups' actions are stepped
+        on the server in the background, so generation and env stepping overlap.
+        
+        Timings are stored in self.timing_raw:
+            - rollout_gen: time spent in generate_sequences
+            - rollout_env_step: time the server spent stepping environments
+            - rollout_env_wait: time generation was blocked waiting for env steps (GPU idle)
+            - rollout_overlap: env stepping hidden behind generation
+        """
+        self.timing_raw = {'rollout_gen': 0.0, 'rollout_env_step': 0.0, 'rollout_env_wait': 0.0, 'rollout_overlap': 0.0}
+        num_groups = min(self.config.get('pipeline_groups', 1), len(self.envs))
+        if num_groups <= 1:
+            for step in range(self.config.max_turns):
+                ids2actions = self._generate_actions(step)
+                if ids2actions is None:
+                    break
+                step_results, step_time = self._timed_step_batch(ids2actions)
+                self.timing_raw['rollout_env_step'] += step_time
+                self.timing_raw['rollout_env_wait'] += step_time
+                self._record_step_results(step_results)
+            return
+        
+        # Groups are fixed for the whole rollout: group g at step t only depends on group g at step t-1
+        env_ids = list(self.envs.keys())
+        groups = [env_ids[g::num_groups] for g in range(num_groups)]
+        if self.step_executor is None:
+            self.step_executor = ThreadPoolExecutor(max_workers=num_groups, thread_name_prefix="env_step")
+        pending = {}
+        
+        def collect(g):
+            wait_start = time.perf_counter()
+            step_results, step_time = pending.pop(g).result()
+            self.timing_raw['rollout_env_wait'] += time.perf_counter() - wait_start
+            self.timing_raw['rollout_env_step'] += step_time
+            self._record_step_results(step_results)
+        
+        for step in range(self.config.max_turns):
+            any_active = False
+            for g, group in enumerate(groups):
+                if g in pending:
+                    collect(g)
+                ids2actions = self._generate_actions(step, group)
+                if ids2actions is None:
+                    continue
+                any_active = True
+                pending[g] = self.step_executor.submit(self._timed_step_batch, ids2actions)
+            if not any_active:
+                break
+        for g in list(pending.keys()):
+            collect(g)
+        self.timing_raw['rollout_overlap'] = self.timing_raw['rollout_env_step'] - self.timing_raw['rollout_env_wait']
         
     @torch.no_grad()
     def generate_batch_for_update(self) -> DataProto:
@@ -636,13 +807,24 @@ class QwenVLRolloutManagerService():
             batch (DataProto): batch of final trajectory of all environments
         """
         batch_list = []
+        self._resolve_state_rewards()
         reward_rst=self.env_client.compute_reward_batch(list(self.envs.keys()))
-        for env_id in self.envs.keys():
-            row_dict = self._generate_input_for_uptate(
+        env_ids = list(self.envs.keys())
+        tokenized_list = [
+            self._tokenize_for_update(
                 recording=self.recorder[env_id],
                 step=self.env_states[env_id]['step'],
                 window_size=None,
             )
+            for env_id in env_ids
+        ]
+        # Loss masks of all trajectories in one vectorized call (responses share the same padded length)
+        loss_mask_rst = self._compute_loss_mask(
+            torch.cat([tokenized["input_ids_response"] for tokenized in tokenized_list], dim=0),
+            torch.cat([tokenized["attention_mask_response"] for tokenized in tokenized_list], dim=0),
+        ) if tokenized_list else None
+        for i, env_id in enumerate(env_ids):
+            row_dict = self._finalize_input_for_update(tokenized_list[i], *(tensor[i] for tensor in loss_mask_rst))
             step_reward_sum= row_dict['step_reward_sum']
     
             row_dict['reward_model'] = {"style": "given", "ground_truth": {"reward": reward_rst[env_id]+step_reward_sum}}
@@ -665,6 +847,7 @@ class QwenVLRolloutManagerService():
             Dictionary containing the recording of all environments
         """
         env_info = []
+        self._resolve_state_rewards()
         reward_rst=self.env_client.compute_reward_batch(list(self.envs.keys()))
         for env_id, record in self.recorder.items():
             config_id = self.envs[env_id].config_id()
@@ -696,4 +879,18 @@ class QwenVLRolloutManagerService():
             })
         return env_info
             
-            
\ No newline at end of file
+            
+    def cache_metrics(self) -> Dict[str, float]:
+        """
+        Hit/miss counters of the rollout caches since the manager was created
+
+        Returns:
+            Dictionary of metric name to value, prefixed with rollout_cache/
+        """
+        metrics = {}
+        if self.prompt_cache is not None:
+            metrics["rollout_cache/prompt_cache/hits"] = self.prompt_cache.hits
+            metrics["rollout_cache/prompt_cache/misses"] = self.prompt_cache.misses
+        if self.image_cache is not None:
+            metrics.update({f"rollout_cache/{k}": v for k, v in self.image_cache.stats().items()})
+        return metrics
@@ -1,7 +1,14 @@
 from typing import Dict, List, Tuple, Optional, Any, Union
 import requests
 import time
-from vagen.server.serial import deserialize_observation, deserialize_step_result
+from vagen.server.serial import (
+    deserialize_observation,
+    deserialize_step_result,
+    MSGPACK_CONTENT_TYPE,
+    JSON_CONTENT_TYPE,
+    msgpack_available,
+    unpack_message,
+)
 
 class BatchEnvClient:
     """
@@ -9,7 +16,8 @@ class BatchEnvClient:
     Uses dictionary-based interface to match the server API and service interface.
     """
     
-    def __init__(self, base_url: str, timeout: int = 600, max_workers: int = 10):
+    def __init__(self, base_url: str, timeout: int = 600, max_workers: int = 10, wire_format: str = "json",
+                 allow_partial_results: bool = False):
         """
         Initialize the BatchEnvClient.
         
@@ -17,13 +25,24 @@ class BatchEnvClient:
             base_url: Base URL of the environment server
             timeout: Timeout for HTTP requests in seconds
             max_workers: Maximum number of worker threads for parallel processing
+            wire_format: "json" or "msgpack". With "msgpack" the client asks the server for
+                binary reset/step responses (raw image buffers) and falls back to JSON
+                if msgpack is not installed or the server answers with JSON
+            allow_partial_results: If a service of the server fails or times out during
+                reset_batch/step_batch, return the results of the other services (the failed
+                environments are missing) instead of raising
         """
+        if wire_format not in ("json", "msgpack"):
+            raise ValueError(f"Unknown wire format: {wire_format}")
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
         self.max_workers = max_workers
+        self.wire_format = wire_format if msgpack_available() else "json"
+        self.allow_partial_results = allow_partial_results
         self.env_configs = {}  # Store configs for each environment for reference
+        self.max_retries_on_busy = 10
         
-    def _make_request(self, endpoint: str, method: str = "POST", data: Any = None) -> Any:
+    def _make_request(self, endpoint: str, method: str = "POST", data: Any = None, binary: bool = False) -> Any:
         """
         Make an HTTP request to the environment server.
         
@@ -31,6 +50,7 @@ class BatchEnvClient:
             endpoint: API endpoint to call
             method: HTTP method (GET, POST, etc.)
             data: Data to send with the request
+            binary: Whether the endpoint may answer in the binary wire format
             
         Returns:
             Response data from the server
@@ -39,25 +59,52 @@ class BatchEnvClient:
             ConnectionError: If the request fails
         """
         url = f"{self.base_url}/{endpoint}"
-        headers = {"Content-Type": "application/json"}
+        headers = {"Content-Type": JSON_CONTENT_TYPE}
+        if binary and self.wire_format == "msgpack":
+            headers["Accept"] = f"{MSGPACK_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.5"
         
         try:
-            if method.upper() == "GET":
-                response = requests.get(url, headers=headers, timeout=self.timeout)
-            elif method.upper() == "POST":
-                response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
-            elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=headers, json=data, timeout=self.timeout)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
+            for _ in range(self.max_retries_on_busy + 1):
+                if method.upper() == "GET":
+                    response = requests.get(url, headers=headers, timeout=self.timeout)
+                elif method.upper() == "POST":
+                    response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
+                elif method.upper() == "DELETE":
+                    response = requests.delete(url, headers=headers, json=data, timeout=self.timeout)
+                else:
+                    raise ValueError(f"Unsupported HTTP method: {method}")
+                # Server applies backpressure: wait as instructed and retry
+                if response.status_code != 503 or "Retry-After" not in response.headers:
+                    break
+                time.sleep(float(response.headers["Retry-After"]))
                 
             response.raise_for_status()  # Raise an exception for 4XX/5XX responses
+            if response.headers.get("Content-Type", "").startswith(MSGPACK_CONTENT_TYPE):
+                return unpack_message(response.content)
             return response.json()
             
         except Exception as e:
             print(f"Exception in _make_request: {str(e)}")
             raise
     
+    def _report_errors(self, response: Dict[str, Any]) -> None:
+        """
+        Handle services that failed or timed out in a partially successful batch request.
+        Raises unless allow_partial_results is set, then environments of those services are
+        missing from the results.
+        
+        Args:
+            response: Response data from the server
+            
+        Raises:
+            RuntimeError: If any service failed and allow_partial_results is not set
+        """
+        errors = response.get("errors", {})
+        for env_name, error in errors.items():
+            print(f"Service {env_name} failed for {len(error['env_ids'])} environments: {error['error']}")
+        if errors and not self.allow_partial_results:
+            raise RuntimeError(f"Batch request failed for services: {sorted(errors)}")
+    
     def check_server_health(self) -> Dict[str, Any]:
         """
         Check the health of the server.
@@ -122,8 +169,9 @@ class BatchEnvClient:
         Returns:
             Dictionary mapping environment IDs to (observation, info) tuples
         """
-        response = self._make_request("batch/reset", "POST", {"ids2seeds": ids2seeds})
+        response = self._make_request("batch/reset", "POST", {"ids2seeds": ids2seeds}, binary=True)
         results = response.get("results", {})
+        self._report_errors(response)
         
         # Deserialize observations
         deserialized_results = {}
@@ -142,8 +190,9 @@ class BatchEnvClient:
         Returns:
             Dictionary mapping environment IDs to (observation, reward, done, info) tuples
         """
-        response = self._make_request("batch/step", "POST", {"ids2actions": ids2actions})
+        response = self._make_request("batch/step", "POST", {"ids2actions": ids2actions}, binary=True)
         results = response.get("results", {})
+        self._report_errors(response)
         
         # Deserialize observations
         deserialized_results = {}
@@ -165,6 +214,19 @@ class BatchEnvClient:
         response = self._make_request("batch/reward", "POST", {"env_ids": env_ids})
         return response.get("rewards", {})
     
+    def collect_state_rewards_batch(self, env_ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        Collect state rewards that were judged in the background (async_state_reward).
+        
+        Args:
+            env_ids: List of environment IDs
+            
+        Returns:
+            Dictionary mapping environment IDs to {ticket: {"reward", "turn_metrics"}}
+        """
+        response = self._make_request("batch/state_reward", "POST", {"env_ids": env_ids})
+        return response.get("state_rewards", {})
+    
     def get_system_prompts_batch(self, env_ids: List[str]) -> Dict[str, str]:
         """
         Get system prompts for multiple environments in batch.
@@ -0,0 +1,382 @@
+from typing import Dict, List, Tuple, Optional, Any, Union
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from vagen.server.client import BatchEnvClient
+
+
+class BatchEnvClusterClient:
+    """
+    Client for a cluster of environment servers, with the same interface as BatchEnvClient.
+    Each environment lives on exactly one server (shard). New environments are placed on the
+    least loaded shard when they are created, batch calls are split per shard, sent to all
+    shards in parallel and merged.
+
+    Load is either the number of environments on a shard ("count"), or the number of
+    environments weighted by the shard's measured step latency per environment ("latency"),
+    which moves new environments away from slow or overloaded hosts.
+
+    create_environments_batch also rebalances: a shard holding more than its fair share of
+    all environments (by speed with "latency") plus rebalance_tolerance has its surplus
+    environments closed and created again on the least loaded shards. A moved environment
+    starts fresh, so it has to be reset before it is stepped again (the rollout manager
+    resets every environment after creating new ones).
+    """
+
+    def __init__(self, base_urls: List[str], timeout: int = 600, max_workers: int = 10,
+                 wire_format: str = "json", placement: str = "latency", latency_ema: float = 0.2,
+                 rebalance_tolerance: Optional[float] = 0.25, allow_partial_results: bool = False):
+        """
+        Initialize the BatchEnvClusterClient.
+
+        Args:
+            base_urls: Base URLs of the environment servers
+            timeout: Timeout for HTTP requests in seconds
+            max_workers: Maximum number of worker threads per shard client
+            wire_format: Wire format used with every shard, see BatchEnvClient
+            placement: "count" or "latency"
+            latency_ema: Smoothing factor of the per-environment step latency estimate
+            rebalance_tolerance: Fraction above its fair share a shard may hold before
+                create_environments_batch moves environments off it, None never moves environments
+            allow_partial_results: Passed to every shard's BatchEnvClient
+        """
+        if placement not in ("count", "latency"):
+            raise ValueError(f"Unknown placement policy: {placement}")
+        self.shards = [
+            BatchEnvClient(base_url=url, timeout=timeout, max_workers=max_workers, wire_format=wire_format,
+                           allow_partial_results=allow_partial_results)
+            for url in base_urls
+        ]
+        self.placement = placement
+        self.latency_ema = latency_ema
+        self.rebalance_tolerance = rebalance_tolerance
+        self.env_to_shard = {}
+        self.shard_env_counts = [0] * len(self.shards)
+        # Seconds per environment per step_batch call, None until measured
+        self.shard_step_latency = [None] * len(self.shards)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="env_shard")
+
+    @property
+    def env_configs(self) -> Dict[str, Any]:
+        """Configs of all environments across shards"""
+        env_configs = {}
+        for shard in self.shards:
+            env_configs.update(shard.env_configs)
+        return env_configs
+
+    def _shard_cost(self, shard_idx: int) -> float:
+        """Expected load of a shard after adding one more environment"""
+        count = self.shard_env_counts[shard_idx] + 1
+        if self.placement == "count":
+            return count
+        latencies = [lat for lat in self.shard_step_latency if lat is not None]
+        # Unmeasured shards are assumed to be as fast as the average measured one
+        default = sum(latencies) / len(latencies) if latencies else 1.0
+        latency = self.shard_step_latency[shard_idx]
+        return count * (latency if latency is not None else default)
+
+    def _place(self, env_ids: List[str]) -> None:
+        """Assign new environments to shards greedily by expected load"""
+        with self.lock:
+            for env_id in env_ids:
+                if env_id in self.env_to_shard:
+                    continue
+                shard_idx = min(range(len(self.shards)), key=self._shard_cost)
+                self.env_to_shard[env_id] = shard_idx
+                self.shard_env_counts[shard_idx] += 1
+
+    def _plan_moves(self, keep: Dict[Any, Any]) -> Dict[str, int]:
+        """
+        Reassign surplus environments of shards above their fair share (plus the tolerance)
+        to the least loaded shards. Environments in keep (being created now) stay put.
+
+        Returns:
+            Dictionary mapping moved environment IDs to their previous shard
+        """
+        moves = {}
+        if self.rebalance_tolerance is None or len(self.shards) < 2:
+            return moves
+        with self.lock:
+            if self.placement == "latency":
+                latencies = [lat for lat in self.shard_step_latency if lat is not None]
+                default = sum(latencies) / len(latencies) if latencies else 1.0
+                speeds = [1.0 / (lat if lat is not None else default) for lat in self.shard_step_latency]
+            else:
+                speeds = [1.0] * len(self.shards)
+            total = sum(self.shard_env_counts)
+            for shard_idx in range(len(self.shards)):
+                allowed = math.ceil(total * speeds[shard_idx] / sum(speeds) * (1 + self.rebalance_tolerance))
+                surplus = self.shard_env_counts[shard_idx] - allowed
+                candidates = [env_id for env_id, idx in self.env_to_shard.items()
+                              if idx == shard_idx and env_id not in keep and env_id not in moves]
+                for env_id in candidates[:max(surplus, 0)]:
+                    self.shard_env_counts[shard_idx] -= 1
+                    target = min(range(len(self.shards)), key=self._shard_cost)
+                    if target == shard_idx:
+                        self.shard_env_counts[shard_idx] += 1
+                        break
+                    self.env_to_shard[env_id] = target
+                    self.shard_env_counts[target] += 1
+                    moves[env_id] = shard_idx
+        return moves
+
+    def _release(self, env_ids: List[str]) -> None:
+        """Forget the placement of closed environments"""
+        with self.lock:
+            for env_id in env_ids:
+                shard_idx = self.env_to_shard.pop(env_id, None)
+                if shard_idx is not None:
+                    self.shard_env_counts[shard_idx] -= 1
+
+    def _split(self, env_ids_or_dict: Union[Dict[str, Any], List[str]]) -> Dict[int, Any]:
+        """Split a dict keyed by env id (or a list of env ids) per shard"""
+        groups = {}
+        if isinstance(env_ids_or_dict, dict):
+            for env_id, value in env_ids_or_dict.items():
+                groups.setdefault(self.env_to_shard[env_id], {})[env_id] = value
+        else:
+            for env_id in env_ids_or_dict:
+                groups.setdefault(self.env_to_shard[env_id], []).append(env_id)
+        return groups
+
+    def _call_shards(self, method_name: str, groups: Dict[int, Any],
+                     errors: Optional[Dict[int, Exception]] = None) -> Dict[int, Any]:
+        """
+        Call a batch method on every shard in parallel.
+        If errors is given, shards that raised are recorded there instead of raising.
+        """
+        if len(groups) == 1:
+            shard_idx, arg = next(iter(groups.items()))
+            try:
+                return {shard_idx: getattr(self.shards[shard_idx], method_name)(arg)}
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[shard_idx] = e
+                return {}
+        futures = {
+            shard_idx: self.executor.submit(getattr(self.shards[shard_idx], method_name), arg)
+            for shard_idx, arg in groups.items()
+        }
+        results = {}
+        for shard_idx, future in futures.items():
+            try:
+                results[shard_idx] = future.result()
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[shard_idx] = e
+        return results
+
+    def _merge(self, method_name: str, groups: Dict[int, Any]) -> Dict[str, Any]:
+        """Call a batch method on every shard in parallel and merge the result dicts"""
+        results = {}
+        for shard_results in self._call_shards(method_name, groups).values():
+            results.update(shard_results)
+        return results
+
+    def _timed_step(self, shard_idx: int, ids2actions: Dict[str, str]) -> Dict[str, Tuple[Dict, float, bool, Dict]]:
+        """Step the environments of one shard and update its latency estimate"""
+        start = time.perf_counter()
+        results = self.shards[shard_idx].step_batch(ids2actions)
+        per_env = (time.perf_counter() - start) / max(len(ids2actions), 1)
+        with self.lock:
+            previous = self.shard_step_latency[shard_idx]
+            self.shard_step_latency[shard_idx] = per_env if previous is None else (
+                (1 - self.latency_ema) * previous + self.latency_ema * per_env
+            )
+        return results
+
+    def check_server_health(self) -> Dict[str, Any]:
+        """
+        Check the health of every shard.
+
+        Returns:
+            Aggregated health status, "ok" only if every shard is ok
+        """
+        shards = [shard.check_server_health() for shard in self.shards]
+        status = "ok" if all(s.get("status") == "ok" for s in shards) else "error"
+        return {"status": status, "shards": shards}
+
+    def wait_for_server(self, max_retries: int = 10, retry_delay: float = 1.0) -> bool:
+        """
+        Wait for every shard to become available.
+
+        Returns:
+            True if all shards are available, False otherwise
+        """
+        return all(shard.wait_for_server(max_retries, retry_delay) for shard in self.shards)
+
+    def create_environments_batch(self, ids2configs: Dict[Any, Any]) -> None:
+        """
+        Place new environments on the least loaded shards and create them there, moving
+        environments off shards above their fair share (see the class docstring).
+
+        Args:
+            ids2configs: Dictionary mapping environment IDs to their configurations
+        """
+        if not ids2configs:
+            return
+        new_env_ids = [env_id for env_id in ids2configs if env_id not in self.env_to_shard]
+        self._place(new_env_ids)
+        moves = self._plan_moves(ids2configs)
+        ids2configs = dict(ids2configs)
+        if moves:
+            close_groups = {}
+            for env_id, shard_idx in moves.items():
+                close_groups.setdefault(shard_idx, []).append(env_id)
+            configs = {env_id: self.shards[shard_idx].env_configs.get(env_id) for env_id, shard_idx in moves.items()}
+            close_errors = {}
+            self._call_shards("close_batch", close_groups, errors=close_errors)
+            with self.lock:
+                for env_id, shard_idx in moves.items():
+                    if shard_idx in close_errors or configs[env_id] is None:
+                        # still on its old shard (or its config is unknown), leave it there
+                        self.shard_env_counts[self.env_to_shard[env_id]] -= 1
+                        self.env_to_shard[env_id] = shard_idx
+                        self.shard_env_counts[shard_idx] += 1
+                    else:
+                        ids2configs[env_id] = configs[env_id]
+            for shard_idx, error in close_errors.items():
+                print(f"[BatchEnvClusterClient] Not rebalancing shard {shard_idx}, closing failed: {error}")
+
+        groups = self._split(ids2configs)
+        errors = {}
+        self._call_shards("create_environments_batch", groups, errors=errors)
+        if errors:
+            # Forget environments that do not exist: new or moved ones on the failed shards
+            failed = [env_id for shard_idx in errors for env_id in groups[shard_idx]
+                      if env_id in moves or env_id in new_env_ids]
+            self._release(failed)
+            raise RuntimeError(f"create_environments_batch failed on shards "
+                               f"{ {shard_idx: f'{type(e).__name__}: {e}' for shard_idx, e in errors.items()} }")
+
+    def reset_batch(self, ids2seeds: Dict[str, Any]) -> Dict[str, Tuple[Dict, Dict]]:
+        """
+        Reset multiple environments in batch.
+
+        Args:
+            ids2seeds: Dictionary mapping environment IDs to seeds
+
+        Returns:
+            Dictionary mapping environment IDs to (observation, info) tuples
+        """
+        return self._merge("reset_batch", self._split(ids2seeds))
+
+    def step_batch(self, ids2actions: Dict[str, str]) -> Dict[str, Tuple[Dict, float, bool, Dict]]:
+        """
+        Step multiple environments in batch.
+
+        Args:
+            ids2actions: Dictionary mapping environment IDs to actions
+
+        Returns:
+            Dictionary mapping environment IDs to (observation, reward, done, info) tuples
+        """
+        groups = self._split(ids2actions)
+        futures = [self.executor.submit(self._timed_step, shard_idx, group) for shard_idx, group in groups.items()]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def compute_reward_batch(self, env_ids: List[str]) -> Dict[str, float]:
+        """
+        Compute rewards for multiple environments in batch.
+
+        Args:
+            env_ids: List of environment IDs
+
+        Returns:
+            Dictionary mapping environment IDs to reward values
+        """
+        return self._merge("compute_reward_batch", self._split(env_ids))
+
+    def collect_state_rewards_batch(self, env_ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        Collect state rewards that were judged in the background (async_state_reward).
+
+        Args:
+            env_ids: List of environment IDs
+
+        Returns:
+            Dictionary mapping environment IDs to {ticket: {"reward", "turn_metrics"}}
+        """
+        return self._merge("collect_state_rewards_batch", self._split(env_ids))
+
+    def get_system_prompts_batch(self, env_ids: List[str]) -> Dict[str, str]:
+        """
+        Get system prompts for multiple environments in batch.
+
+        Args:
+            env_ids: List of environment IDs
+
+        Returns:
+            Dictionary mapping environment IDs to system prompt strings
+        """
+        return self._merge("get_system_prompts_batch", self._split(env_ids))
+
+    def close_batch(self, env_ids: Optional[List[str]] = None) -> None:
+        """
+        Close multiple environments and clean up resources.
+
+        Args:
+            env_ids: Optional list of environment IDs to close. If None, close all environments.
+        """
+        if env_ids is None:
+            env_ids = list(self.env_to_shard.keys())
+        if not env_ids:
+            return
+        try:
+            self._call_shards("close_batch", self._split(env_ids))
+        finally:
+            self._release(env_ids)
+
+    # Convenience methods for single-environment operations
+
+    def reset(self, env_id: str, seed: Any = None) -> Tuple[Dict, Dict]:
+        """Reset a single environment."""
+        results = self.reset_batch({env_id: seed})
+        return results.get(env_id, ({}, {"error": "Reset failed"}))
+
+    def step(self, env_id: str, action: str) -> Tuple[Dict, float, bool, Dict]:
+        """Take a step in a single environment."""
+        results = self.step_batch({env_id: action})
+        return results.get(env_id, ({}, 0.0, True, {"error": "Step failed"}))
+
+    def compute_reward(self, env_id: str) -> float:
+        """Compute reward for a single environment."""
+        return self.compute_reward_batch([env_id]).get(env_id, 0.0)
+
+    def get_system_prompt(self, env_id: str) -> str:
+        """Get system prompt for a single environment."""
+        return self.get_system_prompts_batch([env_id]).get(env_id, "")
+
+    def close(self, env_id: str) -> None:
+        """Close a single environment."""
+        self.close_batch([env_id])
+
+
+def make_env_client(base_url: Union[str, List[str]], **kwargs) -> Union[BatchEnvClient, BatchEnvClusterClient]:
+    """
+    Create a client for one environment server, or a cluster client for a list of servers.
+
+    Args:
+        base_url: Base URL of a server, or a list of base URLs
+        **kwargs: Forwarded to the client
+
+    Returns:
+        BatchEnvClient or BatchEnvClusterClient
+    """
+    if isinstance(base_url, str):
+        kwargs.pop("placement", None)
+        kwargs.pop("rebalance_tolerance", None)
+        return BatchEnvClient(base_url=base_url, **kwargs)
+    base_urls = list(base_url)
+    if len(base_urls) == 1:
+        kwargs.pop("placement", None)
+        kwargs.pop("rebalance_tolerance", None)
+        return BatchEnvClient(base_url=base_urls[0], **kwargs)
+    return BatchEnvClusterClient(base_urls=base_urls, **kwargs)
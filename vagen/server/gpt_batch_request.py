@@ -1,49 +1,137 @@
+import os
 import asyncio
 import random
-import time
-from typing import List, Dict, Any
-from openai import AsyncOpenAI
-
-class RateLimiter:
-    """Rate limiter for OpenAI GPT API"""
-    def __init__(self, qps_limit=70, rpm_limit=4000, tps_limit=15000):
-        self.qps_limit = qps_limit
-        self.rpm_limit = rpm_limit
-        self.tps_limit = tps_limit
-        self.request_timestamps = []
-        self.token_counts = []
-        self.semaphore = asyncio.Semaphore(qps_limit)
-    
-    async def wait_if_needed(self, estimated_tokens=500):
-        now = time.time()
-        # Clean up old timestamps (older than 60 seconds)
-        self.request_timestamps = [ts for ts in self.request_timestamps if now - ts < 60]
-        self.token_counts = self.token_counts[-len(self.request_timestamps):]
-        
-        # Check RPM limit
-        rpm_current = len(self.request_timestamps)
-        if rpm_current >= self.rpm_limit:
-            oldest = self.request_timestamps[0]
-            wait_time = 60 - (now - oldest)
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-                return await self.wait_if_needed(estimated_tokens)
-        
-        # Check QPS limit (last 1 second)
-        recent_requests = sum(1 for ts in self.request_timestamps if now - ts < 1)
-        if recent_requests >= self.qps_limit:
-            await asyncio.sleep(0.1)
-            return await self.wait_if_needed(estimated_tokens)
-        
-        # Check TPS limit (last 1 second)
-        recent_tokens = sum(tokens for ts, tokens in zip(self.request_timestamps, self.token_counts) if now - ts < 1)
-        if recent_tokens + estimated_tokens >= self.tps_limit:
-            await asyncio.sleep(0.2)
-            return await self.wait_if_needed(estimated_tokens)
-        
-        # Update tracking
-        self.request_timestamps.append(now)
-        self.token_counts.append(estimated_tokens)
+import threading
+from typing import List, Dict, Any, Optional
+
+import httpx
+from openai import AsyncOpenAI, APIStatusError
+
+from vagen.utils.rate_limiter import RateLimiter
+
+class AsyncGPTClient:
+    """
+    Long-lived OpenAI client running on a dedicated background event loop.
+
+    All calls of a process share one AsyncOpenAI client (and its HTTP connection pool) and one
+    rate limiter. Prompts are not processed in lockstep chunks: every prompt is a task, and the
+    limiter's adaptive window keeps at most max_in_flight requests on the wire, so a new request
+    starts as soon as any other one finishes.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, max_in_flight: int = 128,
+                 request_timeout: float = 30, qps_limit: int = 70, rpm_limit: int = 4000, tps_limit: int = 15000):
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        # qps/tps limits are per second, the buckets allow one second of burst
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=min(rpm_limit, qps_limit * 60),
+            tokens_per_minute=tps_limit * 60,
+            max_concurrency=max_in_flight,
+        )
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gpt_client_loop", daemon=True)
+        self.thread.start()
+
+        async def _create():
+            # Created on the background loop, so the connection pool belongs to it
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+                timeout=httpx.Timeout(request_timeout),
+            )
+            client_kwargs = {"http_client": http_client, "max_retries": 0}  # retries are done per request below
+            if base_url:
+                client_kwargs["base_url"] = base_url
+            if api_key:
+                client_kwargs["api_key"] = api_key
+            self.client = AsyncOpenAI(**client_kwargs)
+
+        asyncio.run_coroutine_threadsafe(_create(), self.loop).result()
+
+    def run(self, prompts: List[str], config) -> List[Dict[str, Any]]:
+        """Process all prompts on the background loop and wait for the results"""
+        return asyncio.run_coroutine_threadsafe(self._run_all(prompts, config), self.loop).result()
+
+    async def _run_all(self, prompts: List[str], config) -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(self._process_prompt(prompt, config) for prompt in prompts))
+
+    async def _process_prompt(self, prompt: str, config) -> Dict[str, Any]:
+        max_retries = config.get("max_retries", 3)
+        # Estimate tokens (1 token ≈ 4 chars)
+        max_tokens = config.get("max_tokens", 500)
+        estimated_tokens = len(prompt) // 4 + max_tokens
+        retries = 0
+        while True:
+            try:
+                async with self.rate_limiter.limit_async(estimated_tokens) as permit:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=config.get("name", "gpt-4.1-nano-2025-04-14"),
+                            messages=[{"role": "user", "content": prompt}],
+                            temperature=config.get("temperature", 0.1),
+                            max_tokens=max_tokens,
+                        ),
+                        timeout=config.get("request_timeout", self.request_timeout),
+                    )
+                    if response.usage is not None:
+                        permit.used_tokens = response.usage.total_tokens
+                return {
+                    "response": response.choices[0].message.content,
+                    "success": True,
+                    "retries": retries,
+                    "error": None,
+                }
+            except Exception as e:
+                if retries >= max_retries or not _is_retryable(e):
+                    return {
+                        "response": f"Error after {retries + 1} attempts",
+                        "success": False,
+                        "retries": retries,
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                retries += 1
+                # Exponential backoff with full jitter, outside the in-flight window
+                backoff = min(config.get("retry_delay", 1) * (2 ** (retries - 1)), config.get("max_retry_delay", 30))
+                await asyncio.sleep(random.uniform(0, backoff))
+
+    def close(self) -> None:
+        async def _close():
+            await self.client.close()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors, rate limits and server errors are retried, other API errors are not"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return True
+
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_gpt_client(config) -> AsyncGPTClient:
+    """
+    The client of this process for the config's endpoint, created on first use.
+    A forked process gets its own client (event loops and sockets do not survive a fork).
+    """
+    key = (os.getpid(), config.get("base_url", None), config.get("api_key", None), config.get("max_in_flight", 128))
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = AsyncGPTClient(
+                base_url=config.get("base_url", None),
+                api_key=config.get("api_key", None),
+                max_in_flight=config.get("max_in_flight", 128),
+                request_timeout=config.get("request_timeout", 30),
+                qps_limit=config.get("qps_limit", 70),
+                rpm_limit=config.get("rpm_limit", 4000),
+                tps_limit=config.get("tps_limit", 15000),
+            )
+        return _CLIENTS[key]
+
 
 def run_gpt_request(prompts: List[str], config) -> List[Dict[str, Any]]:
     """
@@ -52,119 +140,20 @@ def run_gpt_request(prompts: List[str], config) -> List[Dict[str, Any]]:
     Args:
         prompts: List of prompt strings to process
         config: Config object that supports config.get() method
+            - name, temperature, max_tokens: completion parameters
+            - base_url, api_key: endpoint, default to the OpenAI client's defaults (OPENAI_* env vars)
+            - max_in_flight: requests on the wire at the same time
+            - max_retries, retry_delay, max_retry_delay: per-request retries with jittered backoff
+            - request_timeout: seconds per request attempt
+            - qps_limit, rpm_limit, tps_limit: client-side rate limits
     
     Returns:
         List of dictionaries with results for each prompt
     """
-    # Process in batches if needed
-    batch_size = config.get("batch_size", 20)
-    if len(prompts) <= batch_size:
-        return _process_batch(prompts, config)
-    
-    # For larger sets, process in batches
-    all_results = []
-    batches = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
-    
-    for i, batch in enumerate(batches):
-        if len(batches) > 1:
-            print(f"Processing batch {i+1}/{len(batches)} ({len(batch)} prompts)")
-        batch_results = _process_batch(batch, config)
-        all_results.extend(batch_results)
-        if i < len(batches) - 1:
-            time.sleep(0.5)
-    
-    return all_results
-
-def _process_batch(prompts: List[str], config) -> List[Dict[str, Any]]:
-    """Process a single batch with rate limiting"""
-    async def _async_batch_completions():
-        async_client = AsyncOpenAI()
-        rate_limiter = RateLimiter(
-            qps_limit=config.get("qps_limit", 70),
-            rpm_limit=config.get("rpm_limit", 4000),
-            tps_limit=config.get("tps_limit", 15000)
-        )
-        
-        results = [{"response": "", "success": False, "retries": 0, "error": None} for _ in prompts]
-        
-        async def process_prompt(prompt: str, index: int) -> None:
-            retries = 0
-            # Estimate tokens (1 token ≈ 4 chars)
-            estimated_prompt_tokens = len(prompt) // 4
-            estimated_completion_tokens = config.get("max_tokens", 500)
-            total_estimated_tokens = estimated_prompt_tokens + estimated_completion_tokens
-            
-            while retries <= config.get("max_retries", 3):
-                try:
-                    async with rate_limiter.semaphore:
-                        await rate_limiter.wait_if_needed(total_estimated_tokens)
-                        
-                        response = await async_client.chat.completions.create(
-                            model=config.get("name", "gpt-4.1-nano-2025-04-14"),
-                            messages=[
-                                {"role": "user", "content": prompt}
-                            ],
-                            temperature=config.get("temperature", 0.1),
-                            max_tokens=estimated_completion_tokens
-                        )
-                        
-                        results[index] = {
-                            "response": response.choices[0].message.content,
-                            "success": True,
-                            "retries": retries,
-                            "error": None
-                        }
-                        return
-                except Exception as e:
-                    error_str = str(e)
-                    retries += 1
-                    
-                    # Exponential backoff for rate limit errors
-                    if "rate_limit" in error_str.lower():
-                        backoff_time = config.get("retry_delay", 1) * (2 ** (retries - 1))
-                        backoff_time += random.uniform(0, 1)  # Add jitter
-                        backoff_time = min(backoff_time, 30)  # Cap at 30s
-                        await asyncio.sleep(backoff_time)
-                    elif retries <= config.get("max_retries", 3):
-                        await asyncio.sleep(config.get("retry_delay", 1))
-                    else:
-                        results[index] = {
-                            "response": f"Error after {retries} attempts",
-                            "success": False,
-                            "retries": retries,
-                            "error": error_str
-                        }
-                        return
-        
-        tasks = [process_prompt(prompt, i) for i, prompt in enumerate(prompts)]
-        
-        try:
-            await asyncio.wait_for(
-                asyncio.gather(*tasks, return_exceptions=True), 
-                timeout=config.get("request_timeout", 120)
-            )
-        except asyncio.TimeoutError:
-            pass
-        
-        return results
-    
+    if not prompts:
+        return []
     try:
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                results = loop.run_until_complete(_async_batch_completions())
-                loop.close()
-            else:
-                results = loop.run_until_complete(_async_batch_completions())
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            results = loop.run_until_complete(_async_batch_completions())
-            loop.close()
+        return get_gpt_client(config).run(prompts, config)
     except Exception as e:
         return [{"response": f"Global error: {str(e)}", "success": False, "retries": 0, "error": str(e)} 
                 for _ in prompts]
-    
-    return results
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Content-addressed cache of LLM-as-judge verdicts.
+
+Grounding and world-modeling descriptions repeat heavily across environments and steps, so
+the same judge prompt is sent over and over. JudgeCache keys every verdict by a hash of
+(judgment type, env name, rendered prompt, judge model) and keeps it in two tiers:
+
+    - an in-memory LRU, shared by all services of a server process
+    - an optional SQLite file, so verdicts survive restarts and can be shared between runs
+
+Only successful judge calls are cached. Configured in the `cache` section of
+config/llm_as_judge.yaml.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class JudgeCache:
+    """Two-tier (LRU + SQLite) verdict cache, safe to use from several threads"""
+
+    def __init__(self, max_entries: int = 100000, db_path: Optional[str] = None):
+        """
+        Args:
+            max_entries: Verdicts kept in memory
+            db_path: SQLite file for the on-disk tier, None to keep verdicts in memory only
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if db_path:
+            db_path = os.path.expanduser(db_path)
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def key(judgment_type: str, env_name: str, prompt: str, model: str) -> str:
+        payload = json.dumps([judgment_type, env_name, prompt, model], ensure_ascii=False)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached verdict of a key, None on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM verdicts WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a verdict, value must be JSON serializable"""
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO verdicts (key, value) VALUES (?, ?)",
+                                (key, json.dumps(value, ensure_ascii=False)))
+
+    def stats(self) -> Dict[str, float]:
+        """Cumulative counters since the cache was created"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "judge_cache/hits": self.hits,
+                "judge_cache/disk_hits": self.disk_hits,
+                "judge_cache/misses": self.misses,
+                "judge_cache/hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "judge_cache/entries": len(self.entries),
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+_JUDGE_CACHE = None
+_JUDGE_CACHE_LOCK = threading.Lock()
+
+
+def get_judge_cache(cache_config) -> Optional[JudgeCache]:
+    """
+    The process-wide cache, created on first use from the `cache` config section.
+
+    Returns:
+        None if caching is disabled
+    """
+    global _JUDGE_CACHE
+    if cache_config is None or not cache_config.get("enabled", False):
+        return None
+    with _JUDGE_CACHE_LOCK:
+        if _JUDGE_CACHE is None:
+            _JUDGE_CACHE = JudgeCache(
+                max_entries=cache_config.get("max_entries", 100000),
+                db_path=cache_config.get("db_path", None),
+            )
+        return _JUDGE_CACHE
@@ -17,6 +17,7 @@ import random
 from contextlib import contextmanager
 from vagen.server.together_batch_request import run_together_request
 from vagen.server.gpt_batch_request import run_gpt_request
+from vagen.server.serving import wandb_run_kwargs
 # Global variables for wandb tracking per process
 _WANDB_INITIALIZED = {}  # Track initialization status per process
 _GLOBAL_STEPS = {}  # Track global step count per process
@@ -125,7 +126,7 @@ def run_llm_judge(input_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             run_id = str(uuid.uuid4())[:8]
             wandb.init(
                 project=config.wandb.project,
-                name=f"{config.wandb.run_name}_{run_id}",
+                **wandb_run_kwargs(config.wandb.run_name, run_id),
                 config=OmegaConf.to_container(config, resolve=True),
             )
             
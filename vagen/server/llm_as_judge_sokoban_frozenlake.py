@@ -17,6 +17,8 @@ import random
 from contextlib import contextmanager
 from vagen.server.together_batch_request import run_together_request
 from vagen.server.gpt_batch_request import run_gpt_request
+from vagen.server.serving import wandb_run_kwargs
+from vagen.server.judge_cache import JudgeCache, get_judge_cache
 from vagen.env.utils.parse_json_utils import parse_llm_json_response_flexible
 
 # Global variables for wandb tracking per process
@@ -204,6 +206,9 @@ def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, float]:
         if worldmodeling_results else 0
     )
     
+    # Verdicts served from the cache, without an API call
+    cached_requests = sum(1 for r in results if r.get("cached", False))
+    
     # Calculate parse success rate
     parse_successes = sum(1 for r in results if r["parse_success"] and r["success"])
     parse_success_rate = parse_successes / completed_requests if completed_requests > 0 else 0
@@ -218,6 +223,8 @@ def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, float]:
         "grounding_accuracy": grounding_accuracy,
         "worldmodeling_accuracy": worldmodeling_accuracy,
         "parse_success_rate": parse_success_rate,
+        "cached_requests": cached_requests,
+        "cache_hit_rate": cached_requests / total_requests if total_requests > 0 else 0,
     }
 
 def filter_results_by_category(results: List[Dict[str, Any]], data_categories: Dict[str, Dict[str, Any]]) -> None:
@@ -286,7 +293,7 @@ def initialize_wandb_for_process(config: DictConfig) -> None:
     run_id = str(uuid.uuid4())[:8]
     wandb.init(
         project=config.wandb.project,
-        name=f"{config.wandb.run_name}_{run_id}",
+        **wandb_run_kwargs(config.wandb.run_name, run_id),
         config=OmegaConf.to_container(config, resolve=True),
     )
 
@@ -350,6 +357,11 @@ def run_llm_judge(input_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         # Calculate metrics
         metrics = calculate_metrics(results)
         
+        # Cumulative cache counters of this process
+        cache = get_judge_cache(config.get("cache", None))
+        if cache is not None:
+            metrics.update(cache.stats())
+        
         # Log scalar metrics to wandb with step to ensure proper plotting
         wandb.log({
             "global_step": global_step,
@@ -392,42 +404,58 @@ def process_llm_judgments(input_data: List[Dict[str, Any]], config: Optional[Dic
         pid = os.getpid()
         config = _get_hydra_config(pid, _HYDRA_LOCKS, _HYDRA_INITIALIZED, _PID_CONFIG)
     
-    # Create prompts for each input
-    prompts = []
-    metadata = []  # Store additional info we'll need after getting responses
+    # Verdicts of prompts judged before are served from the cache, only the rest is requested
+    cache = get_judge_cache(config.get("cache", None))
+    keys = [
+        JudgeCache.key(item["type"], item["env_name"], item["prompt"], config.api.name) if cache is not None else None
+        for item in input_data
+    ]
+    verdicts = [cache.get(key) if cache is not None else None for key in keys]
     
-    for item in input_data:
-        prompts.append(item["prompt"])
-        metadata.append({
-            "id": item["id"],
-            "type": item["type"],
-            "env_name": item["env_name"]
-        })
+    # Unique prompts that still need a request
+    pending = {}  # key (or index without cache) -> index of the prompt in the request
+    prompts = []
+    for i, (item, verdict) in enumerate(zip(input_data, verdicts)):
+        if verdict is not None:
+            continue
+        request_key = keys[i] if cache is not None else i
+        if request_key not in pending:
+            pending[request_key] = len(prompts)
+            prompts.append(item["prompt"])
     
     # Call the request function to get LLM responses
-    llm_responses = run_gpt_request(prompts, config.api)
+    llm_responses = run_gpt_request(prompts, config.api) if prompts else []
     
     # Process the responses and extract scores
-    results = []
-    for i, response_data in enumerate(llm_responses):
-        # Extract the YES/NO answer
-        score = 0.0  # Default score (NO or failure)
+    requested = []
+    for response_data in llm_responses:
         parsed_response = parse_llm_json_response_flexible(response_data["response"])
-        parse_success = True if parsed_response else False
-        
-        # Create the result dictionary
-        result = {
-            "id": metadata[i]["id"],
-            "type": metadata[i]["type"],
-            "env_name": metadata[i]["env_name"],
-            "prompt": prompts[i],
+        requested.append({
             "response": response_data["response"],
             "success": response_data["success"],
-            "score": score,
+            "score": 0.0,  # Default score (NO or failure)
             "error": response_data["error"],
-            "parse_success": parse_success,
-            "parsed_response": parsed_response
+            "parse_success": True if parsed_response else False,
+            "parsed_response": parsed_response,
+        })
+    if cache is not None:
+        for request_key, index in pending.items():
+            if requested[index]["success"]:
+                cache.put(request_key, requested[index])
+    
+    results = []
+    for i, (item, verdict) in enumerate(zip(input_data, verdicts)):
+        cached = verdict is not None
+        if not cached:
+            verdict = requested[pending[keys[i] if cache is not None else i]]
+        # Create the result dictionary
+        result = {
+            "id": item["id"],
+            "type": item["type"],
+            "env_name": item["env_name"],
+            "prompt": item["prompt"],
+            **verdict,
+            "cached": cached,
         }
-        
         results.append(result)
     return results
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Hermetic stand-in for the OpenAI / Together completion APIs, for offline state-reward runs.
+
+The server speaks the OpenAI protocol (POST /v1/chat/completions, POST /v1/completions,
+GET /v1/models) with configurable latency, injected 500s and 429s, and an optional real
+requests-per-minute limit. Answers are deterministic functions of the prompt:
+
+    - judge prompts asking for YES/NO get <answer>YES</answer> or <answer>NO</answer>,
+      YES for a yes_rate fraction of prompts (chosen by prompt hash)
+    - visual-reasoning parser prompts ("Input Text to Parse: ... Objects to Look For: ...")
+      get a JSON array of object/player relations extracted from the text by keyword rules
+    - anything else gets a fixed reply carrying the prompt hash
+
+Clients point at it through their base_url:
+
+    - LLM judge (config/llm_as_judge.yaml): api.base_url: http://127.0.0.1:8765/v1 and
+      api.api_key: mock, or OPENAI_BASE_URL / OPENAI_API_KEY in the environment
+    - Together judge: base_url (Together SDK) in the api config
+    - model_interface backends: OpenAIModelConfig / RouterAPIModelConfig base_url
+      http://127.0.0.1:8765/v1, TogetherModelConfig base_url http://127.0.0.1:8765
+
+Start it with `python -m vagen.server.mock_llm_server port=8765 latency.mean=0.3`
+(config/mock_llm_server.yaml), or in-process with start_mock_llm_server(config).
+"""
+import re
+import json
+import math
+import logging
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+import hydra
+from flask import Flask, jsonify, request
+from omegaconf import DictConfig, OmegaConf
+
+from vagen.server.serving import InflightLimiter, HTTPServerThread
+from vagen.utils.rate_limiter import TokenBucket
+
+_OBJECT_PATTERNS = {
+    "target": r"\b(?:targets?|goals?|gifts?)\b",
+    "box": r"\bbox\w*\b",
+    "hole": r"\b(?:holes?|pits?)\b",
+}
+_VERTICAL_WORDS = {
+    "above": r"\b(?:above|up|upper|top|north)\b",
+    "below": r"\b(?:below|down|lower|bottom|beneath|under|south)\b",
+}
+_HORIZONTAL_WORDS = {
+    "left": r"\b(?:left|west)\b",
+    "right": r"\b(?:right|east)\b",
+}
+_SAME_PATTERN = r"\bsame (?:position|spot|place|location|cell)\b|\bon top of\b|\breach(?:ed|es)? the\b"
+
+
+def prompt_hash(prompt: str) -> int:
+    return int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _match_relation(patterns: Dict[str, str], text: str) -> Optional[str]:
+    found = [relation for relation, pattern in patterns.items() if re.search(pattern, text)]
+    return found[0] if len(found) == 1 else None
+
+
+def extract_relations(text: str, objects: List[str]) -> List[Dict[str, Any]]:
+    """
+    Keyword-rule version of the visual-reasoning parser prompt: relation of each mentioned object to the player.
+    Directions in a clause without an object belong to the last object of the same sentence.
+    """
+    relations = []
+    for sentence in re.split(r"[.;\n]+", text.lower()):
+        current = None
+        for clause in re.split(r",|\band\b|\bwhile\b|\bbut\b", sentence):
+            mentioned = [obj for obj in objects if obj in _OBJECT_PATTERNS and re.search(_OBJECT_PATTERNS[obj], clause)]
+            if mentioned:
+                current = {"object_id": mentioned[0], "vertical_relation": None, "horizontal_relation": None}
+                relations.append(current)
+            if current is None:
+                continue
+            if re.search(_SAME_PATTERN, clause):
+                current["vertical_relation"] = current["vertical_relation"] or "same"
+                current["horizontal_relation"] = current["horizontal_relation"] or "same"
+            if re.search(r"\bsame row\b", clause):
+                current["vertical_relation"] = current["vertical_relation"] or "same"
+            if re.search(r"\bsame column\b", clause):
+                current["horizontal_relation"] = current["horizontal_relation"] or "same"
+            current["vertical_relation"] = current["vertical_relation"] or _match_relation(_VERTICAL_WORDS, clause)
+            current["horizontal_relation"] = current["horizontal_relation"] or _match_relation(_HORIZONTAL_WORDS, clause)
+    unique = []
+    for relation in relations:
+        if (relation["vertical_relation"] or relation["horizontal_relation"]) and relation not in unique:
+            unique.append(relation)
+    return unique
+
+
+def mock_answer(prompt: str, yes_rate: float = 0.5) -> str:
+    """Deterministic reply to a prompt"""
+    if "Input Text to Parse:" in prompt:
+        section = prompt.rsplit("Input Text to Parse:", 1)[1]
+        text, _, objects_line = section.partition("Objects to Look For:")
+        objects = [obj.strip() for obj in objects_line.split("\n")[0].split("#")[0].split(",") if obj.strip()]
+        return "```json\n" + json.dumps(extract_relations(text, objects), indent=2) + "\n```"
+    digest = prompt_hash(prompt)
+    if "YES" in prompt and "NO" in prompt:
+        answer = "YES" if (digest % 10000) / 10000 < yes_rate else "NO"
+        return f"<think>Mock judgment {digest % 10000:04d}.</think><answer>{answer}</answer>"
+    return f"<think>Mock response {digest:016x}.</think><answer></answer>"
+
+
+class MockLLMServer:
+    """Flask app answering completion requests with mock_answer after a sampled latency"""
+
+    def __init__(self, config):
+        self.config = config
+        self.host = config.get("host", "127.0.0.1")
+        self.port = config.get("port", 8765)
+        latency = config.get("latency", {}) or {}
+        self.latency_distribution = latency.get("distribution", "fixed")
+        self.latency_mean = latency.get("mean", 0.0)
+        self.latency_std = latency.get("std", 0.0)
+        self.latency_per_token = latency.get("per_output_token", 0.0)
+        errors = config.get("errors", {}) or {}
+        self.error_rate = errors.get("error_rate", 0.0)
+        self.rate_limit_rate = errors.get("rate_limit_rate", 0.0)
+        requests_per_minute = errors.get("requests_per_minute", None)
+        self.request_bucket = TokenBucket(requests_per_minute, max(1.0, requests_per_minute / 60.0), time.monotonic()) \
+            if requests_per_minute else None
+        self.yes_rate = (config.get("answers", {}) or {}).get("yes_rate", 0.5)
+        self.rng = random.Random(config.get("seed", 0))
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "completed": 0, "errors": 0, "rate_limited": 0, "in_flight": 0}
+
+        self.app = Flask(__name__)
+        if not config.get("log_requests", False):
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self.inflight_limiter = InflightLimiter(config.get("max_inflight_requests", None))
+        self.inflight_limiter.install(self.app)
+        self._setup_routes()
+        self.http_server = None
+
+    def _sample_latency(self, completion_tokens: int) -> float:
+        with self.lock:
+            if self.latency_distribution == "uniform":
+                latency = self.rng.uniform(self.latency_mean - self.latency_std, self.latency_mean + self.latency_std)
+            elif self.latency_distribution == "exponential":
+                latency = self.rng.expovariate(1.0 / self.latency_mean) if self.latency_mean > 0 else 0.0
+            elif self.latency_distribution == "lognormal" and self.latency_mean > 0:
+                # parameters of the underlying normal for the requested mean and std
+                sigma = math.sqrt(math.log(1 + (self.latency_std / self.latency_mean) ** 2))
+                latency = self.rng.lognormvariate(math.log(self.latency_mean) - sigma ** 2 / 2, sigma)
+            else:
+                latency = self.latency_mean
+        return max(0.0, latency) + self.latency_per_token * completion_tokens
+
+    def _admit(self) -> Optional[tuple]:
+        """Injected or rate-limit failure of a request, None if it is answered"""
+        with self.lock:
+            self.counters["requests"] += 1
+            if self.request_bucket is not None:
+                now = time.monotonic()
+                if self.request_bucket.earliest(now, 1) > now:
+                    self.counters["rate_limited"] += 1
+                    return 429, "Rate limit reached for requests"
+                self.request_bucket.reserve(1, now)
+            draw = self.rng.random()
+            if draw < self.rate_limit_rate:
+                self.counters["rate_limited"] += 1
+                return 429, "Rate limit reached for requests (injected)"
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.counters["errors"] += 1
+                return 500, "The server had an error while processing your request (injected)"
+        return None
+
+    def _complete(self, prompt: str):
+        failure = self._admit()
+        if failure is not None:
+            status, message = failure
+            response = jsonify({"error": {"message": message, "type": "mock_error", "code": status}})
+            if status == 429:
+                response.headers["Retry-After"] = "1"
+            return None, (response, status)
+        text = mock_answer(prompt, self.yes_rate)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self.lock:
+            self.counters["in_flight"] += 1
+        time.sleep(self._sample_latency(usage["completion_tokens"]))
+        with self.lock:
+            self.counters["in_flight"] -= 1
+            self.counters["completed"] += 1
+        return (text, usage), None
+
+    def _setup_routes(self):
+        @self.app.route("/health", methods=["GET"])
+        def health():
+            return jsonify({"status": "ok"})
+
+        @self.app.route("/stats", methods=["GET"])
+        def stats():
+            with self.lock:
+                return jsonify(dict(self.counters))
+
+        @self.app.route("/v1/models", methods=["GET"])
+        def models():
+            return jsonify({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+        @self.app.route("/v1/chat/completions", methods=["POST"])
+        def chat_completions():
+            body = request.get_json(force=True)
+            prompt = "\n".join(_message_text(message.get("content")) for message in body.get("messages", []))
+            result, error = self._complete(prompt)
+            if error is not None:
+                return error
+            text, usage = result
+            return jsonify({
+                "id": f"chatcmpl-mock-{prompt_hash(prompt):016x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        @self.app.route("/v1/completions", methods=["POST"])
+        def completions():
+            body = request.get_json(force=True)
+            prompt = body.get("prompt", "")
+            prompt = "\n".join(prompt) if isinstance(prompt, list) else prompt
+            result, error = self._complete(prompt)
+            if error is not None:
+                return error
+            text, usage = result
+            return jsonify({
+                "id": f"cmpl-mock-{prompt_hash(prompt):016x}",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "text": text, "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            })
+
+    def start(self, background: bool = True) -> None:
+        self.http_server = HTTPServerThread(self.app, self.host, self.port)
+        self.port = self.http_server.server.server_port  # resolves port 0
+        print(f"Mock LLM server listening on http://{self.host}:{self.port}/v1")
+        if background:
+            self.http_server.start()
+        else:
+            self.http_server.serve_forever()
+
+    def shutdown(self) -> None:
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+
+def _message_text(content: Any) -> str:
+    """Text of an OpenAI message content (string or list of parts, images are skipped)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    return ""
+
+
+def start_mock_llm_server(config=None) -> MockLLMServer:
+    """Start a mock server in a background thread (port 0 picks a free port)"""
+    server = MockLLMServer(config if config is not None else {})
+    server.start(background=True)
+    return server
+
+
+@hydra.main(version_base=None, config_path="config", config_name="mock_llm_server")
+def main(cfg: DictConfig):
+    print(OmegaConf.to_yaml(cfg))
+    MockLLMServer(cfg).start(background=False)
+
+
+if __name__ == "__main__":
+    main()
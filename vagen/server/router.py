@@ -0,0 +1,389 @@
+import os
+import uuid
+import threading
+import signal
+import time
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional, Any
+import requests
+from flask import Flask, Response, request, jsonify
+from omegaconf import DictConfig, OmegaConf
+from vagen.server.serial import (
+    MSGPACK_CONTENT_TYPE,
+    JSON_CONTENT_TYPE,
+    msgpack_available,
+    pack_message,
+    unpack_message,
+    to_json_compatible,
+)
+from vagen.server.serving import InflightLimiter, HTTPServerThread, WORKER_INDEX_ENV, WORKER_GROUP_ENV
+
+
+def run_worker(config_dict: Dict[str, Any], port: int, worker_idx: int = 0, group: str = "") -> None:
+    """
+    Entry point of a worker process: a regular BatchEnvServer on a private port.
+
+    Args:
+        config_dict: Server configuration as a plain container
+        port: Port the worker listens on
+        worker_idx: Index of the worker, tags its LLM-judge wandb run
+        group: Id of the server launch, groups the wandb runs of its workers
+    """
+    os.environ[WORKER_INDEX_ENV] = str(worker_idx)
+    os.environ[WORKER_GROUP_ENV] = group
+    from vagen.server.server import BatchEnvServer
+    cfg = OmegaConf.create(config_dict)
+    cfg.server.host = "127.0.0.1"
+    cfg.server.port = port
+    cfg.server.workers = 1
+    server = BatchEnvServer(cfg)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.stop, daemon=True).start())
+    server.start(background=False)
+
+
+class WorkerRouter:
+    """
+    Front server of a multi-worker deployment.
+    Exposes the same HTTP API as BatchEnvServer and forwards every request to the
+    worker processes that own the environments involved. An environment is pinned
+    to one worker when it is created (the worker with the fewest environments), and
+    batch requests are split per worker and forwarded concurrently.
+    """
+
+    def __init__(self, config, worker_urls: List[str]):
+        """
+        Initialize the WorkerRouter.
+
+        Args:
+            config: Server configuration
+            worker_urls: Base URLs of the worker servers
+        """
+        self.host = config.server.host
+        self.port = config.server.port
+        self.config = config
+        self.worker_urls = worker_urls
+        self.timeout = config.server.get("worker_timeout", 600)
+
+        # Sticky routing table
+        self.env_to_worker = {}
+        self.worker_env_counts = [0] * len(worker_urls)
+        self.routing_lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=len(worker_urls), thread_name_prefix="router")
+
+        self.app = Flask(__name__)
+        self.limiter = InflightLimiter(
+            max_inflight=config.server.get("max_inflight_requests", None),
+            queue_timeout=config.server.get("queue_timeout", 30.0),
+        )
+        self.limiter.install(self.app)
+        self._setup_routes()
+
+        self.http_server = None
+        self.is_running = False
+        self.stop_lock = threading.Lock()
+
+    def _forward(self, worker_idx: int, endpoint: str, method: str = "POST", data: Any = None) -> Any:
+        """
+        Send a request to one worker, preferring the binary wire format.
+
+        Args:
+            worker_idx: Index of the worker
+            endpoint: API endpoint to call
+            method: HTTP method
+            data: JSON body
+
+        Returns:
+            Decoded response data
+        """
+        headers = {"Content-Type": JSON_CONTENT_TYPE}
+        if msgpack_available():
+            headers["Accept"] = f"{MSGPACK_CONTENT_TYPE}, {JSON_CONTENT_TYPE};q=0.5"
+        response = requests.request(
+            method, f"{self.worker_urls[worker_idx]}/{endpoint}",
+            headers=headers, json=data, timeout=self.timeout,
+        )
+        response.raise_for_status()
+        if response.headers.get("Content-Type", "").startswith(MSGPACK_CONTENT_TYPE):
+            return unpack_message(response.content)
+        return response.json()
+
+    def _make_response(self, payload: Dict[str, Any]):
+        """Build a response in the wire format negotiated through the Accept header"""
+        if msgpack_available() and MSGPACK_CONTENT_TYPE in request.headers.get("Accept", ""):
+            return Response(pack_message(payload), status=200, mimetype=MSGPACK_CONTENT_TYPE)
+        return jsonify(to_json_compatible(payload)), 200
+
+    def _worker_for_env(self, env_id: str) -> int:
+        """Get the worker that owns an environment"""
+        if env_id not in self.env_to_worker:
+            raise ValueError(f"Environment {env_id} not found")
+        return self.env_to_worker[env_id]
+
+    def _scatter(self, endpoint: str, key: str, worker_groups: Dict[int, Any], errors: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Forward one request per worker concurrently.
+
+        Args:
+            endpoint: API endpoint to call
+            key: Name of the request parameter holding each worker's share
+            worker_groups: Dictionary mapping worker indices to their share of the request
+            errors: If given, failed workers are recorded here instead of raising
+
+        Returns:
+            Responses of the workers that succeeded
+        """
+        futures = {
+            self.executor.submit(self._forward, worker_idx, endpoint, "POST", {key: group}): worker_idx
+            for worker_idx, group in worker_groups.items()
+        }
+        responses = []
+        for future, worker_idx in futures.items():
+            try:
+                response = future.result()
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[f"worker_{worker_idx}"] = {"error": f"{type(e).__name__}: {e}", "env_ids": list(worker_groups[worker_idx])}
+                continue
+            if errors is not None:
+                errors.update(response.get("errors", {}))
+            responses.append(response)
+        return responses
+
+    def _group_by_worker(self, env_ids_or_dict: Any) -> Dict[int, Any]:
+        """Split a dict keyed by env id (or a list of env ids) per owning worker"""
+        groups = {}
+        if isinstance(env_ids_or_dict, dict):
+            for env_id, value in env_ids_or_dict.items():
+                groups.setdefault(self._worker_for_env(env_id), {})[env_id] = value
+        else:
+            for env_id in env_ids_or_dict:
+                groups.setdefault(self._worker_for_env(env_id), []).append(env_id)
+        return groups
+
+    def _setup_routes(self):
+        """Set up HTTP routes mirroring BatchEnvServer"""
+
+        @self.app.route('/health', methods=['GET'])
+        def health_check():
+            """Health check endpoint, aggregated over workers"""
+            workers = []
+            for worker_idx in range(len(self.worker_urls)):
+                try:
+                    workers.append(self._forward(worker_idx, "health", "GET"))
+                except Exception as e:
+                    workers.append({"status": "error", "message": str(e)})
+            status = "ok" if all(w.get("status") == "ok" for w in workers) else "degraded"
+            return jsonify({
+                "status": status,
+                "message": f"Environment router with {len(self.worker_urls)} workers",
+                "active_environments": len(self.env_to_worker),
+                "worker_env_counts": self.worker_env_counts,
+                "wire_formats": ["json", "msgpack"] if msgpack_available() else ["json"],
+                "workers": workers,
+            }), 200
+
+        @self.app.route('/environments', methods=['POST'])
+        def create_environments_batch():
+            """Pin new environments to the least loaded workers and create them there"""
+            data = request.json
+            if not data or 'ids2configs' not in data:
+                return jsonify({"error": "Missing required parameter: ids2configs"}), 400
+
+            worker_groups = {}
+            new_env_ids = set()
+            with self.routing_lock:
+                for env_id, config in data['ids2configs'].items():
+                    if env_id not in self.env_to_worker:
+                        worker_idx = min(range(len(self.worker_urls)), key=lambda i: self.worker_env_counts[i])
+                        self.env_to_worker[env_id] = worker_idx
+                        self.worker_env_counts[worker_idx] += 1
+                        new_env_ids.add(env_id)
+                    worker_groups.setdefault(self.env_to_worker[env_id], {})[env_id] = config
+            errors = {}
+            self._scatter("environments", "ids2configs", worker_groups, errors=errors)
+            if errors:
+                # Release the routes of new environments whose worker failed to create them
+                with self.routing_lock:
+                    for error in errors.values():
+                        for env_id in error["env_ids"]:
+                            if env_id in new_env_ids:
+                                self.worker_env_counts[self.env_to_worker.pop(env_id)] -= 1
+                return jsonify({"error": "Failed to create environments", "errors": errors}), 500
+            return jsonify({"success": True}), 200
+
+        @self.app.route('/batch/reset', methods=['POST'])
+        def reset_batch():
+            """Reset multiple environments endpoint"""
+            data = request.json
+            if not data or 'ids2seeds' not in data:
+                return jsonify({"error": "Missing required parameter: ids2seeds"}), 400
+            return self._partial_results("batch/reset", "ids2seeds", data['ids2seeds'])
+
+        @self.app.route('/batch/step', methods=['POST'])
+        def step_batch():
+            """Step multiple environments endpoint"""
+            data = request.json
+            if not data or 'ids2actions' not in data:
+                return jsonify({"error": "Missing required parameter: ids2actions"}), 400
+            return self._partial_results("batch/step", "ids2actions", data['ids2actions'])
+
+        @self.app.route('/batch/reward', methods=['POST'])
+        def compute_reward_batch():
+            """Compute reward for multiple environments endpoint"""
+            data = request.json
+            if not data or 'env_ids' not in data:
+                return jsonify({"error": "Missing required parameter: env_ids"}), 400
+            rewards = {}
+            for response in self._scatter("batch/reward", "env_ids", self._group_by_worker(data['env_ids'])):
+                rewards.update(response.get("rewards", {}))
+            return jsonify({"rewards": rewards}), 200
+
+        @self.app.route('/batch/state_reward', methods=['POST'])
+        def collect_state_rewards_batch():
+            """Collect state rewards judged in the background endpoint"""
+            data = request.json
+            if not data or 'env_ids' not in data:
+                return jsonify({"error": "Missing required parameter: env_ids"}), 400
+            state_rewards = {}
+            for response in self._scatter("batch/state_reward", "env_ids", self._group_by_worker(data['env_ids'])):
+                state_rewards.update(response.get("state_rewards", {}))
+            return jsonify({"state_rewards": state_rewards}), 200
+
+        @self.app.route('/batch/system_prompt', methods=['POST'])
+        def get_system_prompts_batch():
+            """Get system prompts for multiple environments endpoint"""
+            data = request.json
+            if not data or 'env_ids' not in data:
+                return jsonify({"error": "Missing required parameter: env_ids"}), 400
+            prompts = {}
+            for response in self._scatter("batch/system_prompt", "env_ids", self._group_by_worker(data['env_ids'])):
+                prompts.update(response.get("system_prompts", {}))
+            return jsonify({"system_prompts": prompts}), 200
+
+        @self.app.route('/batch/close', methods=['POST'])
+        def close_batch():
+            """Close multiple environments endpoint"""
+            data = request.json
+            if not data or 'env_ids' not in data:
+                return jsonify({"error": "Missing required parameter: env_ids"}), 400
+            self._close(data['env_ids'])
+            return jsonify({"status": "success"}), 200
+
+        @self.app.route('/shutdown', methods=['POST'])
+        def shutdown():
+            """Gracefully shut down the router and all workers"""
+            threading.Thread(target=self.stop, daemon=True).start()
+            return jsonify({"status": "shutting down"}), 200
+
+        @self.app.route('/<action>/<env_id>', methods=['GET', 'POST', 'DELETE'])
+        def single_environment(action, env_id):
+            """Forward single-environment endpoints to the owning worker"""
+            if env_id not in self.env_to_worker:
+                return jsonify({"error": f"Environment {env_id} not found"}), 404
+            if action == "close":
+                self._close([env_id])
+                return jsonify({"status": "success"}), 200
+            response = self._forward(self.env_to_worker[env_id], f"{action}/{env_id}", request.method, request.get_json(silent=True))
+            return self._make_response(response)
+
+    def _partial_results(self, endpoint: str, key: str, ids2values: Dict[str, Any]):
+        """Forward a reset/step request and merge partial results and errors"""
+        errors = {}
+        results = {}
+        for response in self._scatter(endpoint, key, self._group_by_worker(ids2values), errors=errors):
+            results.update(response.get("results", {}))
+        if errors and not results:
+            return jsonify({"error": "All workers failed", "errors": errors}), 500
+        payload = {"results": results}
+        if errors:
+            payload["errors"] = errors
+        return self._make_response(payload)
+
+    def _close(self, env_ids: List[str]) -> None:
+        """Close environments on their workers and release their routing entries"""
+        worker_groups = self._group_by_worker(env_ids)
+        with self.routing_lock:
+            for env_id in env_ids:
+                worker_idx = self.env_to_worker.pop(env_id)
+                self.worker_env_counts[worker_idx] -= 1
+        self._scatter("batch/close", "env_ids", worker_groups)
+
+    def start(self) -> None:
+        """Serve in the calling thread until stopped"""
+        self.is_running = True
+        self.http_server = HTTPServerThread(self.app, self.host, self.port)
+        self.http_server.serve_forever()
+
+    def stop(self) -> None:
+        """Drain in-flight requests, shut down every worker, then stop serving"""
+        with self.stop_lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        self.limiter.drain(timeout=self.config.server.get("drain_timeout", 60.0))
+        for worker_idx in range(len(self.worker_urls)):
+            try:
+                self._forward(worker_idx, "shutdown")
+            except Exception as e:
+                print(f"Failed to shut down worker {worker_idx}: {e}")
+        self.executor.shutdown(wait=False)
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server = None
+        print("Router stopped")
+
+
+def serve_with_workers(cfg: DictConfig) -> None:
+    """
+    Pre-fork `server.workers` BatchEnvServer processes on consecutive private ports
+    (starting at `server.worker_base_port`, default port + 1) and serve the router
+    on `server.host:server.port` until shutdown.
+
+    Every worker builds its own services: GPU-backed ones (svg scorers, navigation,
+    primitive_skill) load their models on the configured devices once per worker, so
+    their GPU memory grows with the number of workers. With use_state_reward every
+    worker logs the judge to its own wandb run, grouped per launch.
+
+    Args:
+        cfg: Server configuration
+    """
+    num_workers = cfg.server.workers
+    base_port = cfg.server.get("worker_base_port", None) or cfg.server.port + 1
+    config_dict = OmegaConf.to_container(cfg, resolve=True)
+
+    ctx = mp.get_context("spawn")
+    processes = []
+    worker_urls = []
+    group = uuid.uuid4().hex[:8]
+    for worker_idx in range(num_workers):
+        port = base_port + worker_idx
+        process = ctx.Process(target=run_worker, args=(config_dict, port, worker_idx, group), daemon=False)
+        process.start()
+        processes.append(process)
+        worker_urls.append(f"http://127.0.0.1:{port}")
+
+    # Wait for every worker to come up
+    for url in worker_urls:
+        for _ in range(120):
+            try:
+                if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        else:
+            raise RuntimeError(f"Worker at {url} did not start")
+
+    router = WorkerRouter(cfg, worker_urls)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=router.stop, daemon=True).start())
+    print(f"Starting Batch Environment Router on http://{cfg.server.host}:{cfg.server.port} with {num_workers} workers")
+    try:
+        router.start()
+    finally:
+        for process in processes:
+            process.join(timeout=cfg.server.get("drain_timeout", 60.0))
+            if process.is_alive():
+                process.terminate()
@@ -1,8 +1,113 @@
 import io
+import json
+import zlib
 import base64
 import numpy as np
 from typing import Any, Dict, List, Tuple, Optional, Union
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# -------------- wire format --------------
+# Observations can travel between BatchEnvServer and BatchEnvClient either as JSON
+# (images PNG-encoded and base64'd) or as msgpack (images as raw uint8 buffers with
+# shape/dtype headers, optionally compressed by a fast lossless codec).
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+
+IMAGE_CODECS = ("png", "raw", "zlib", "lz4")
+
+# Modes whose pixel buffer alone rebuilds the image, others (palette, CMYK, ...) are sent as RGB/RGBA
+_RAW_MODES = ("RGB", "RGBA", "L", "LA")
+
+# Codec used by serialize_pil_image; "png" keeps the original JSON-safe behaviour
+_image_codec = "png"
+
+def set_image_codec(codec: str) -> None:
+    """
+    Set the codec used to serialize PIL images in this process.
+    
+    Args:
+        codec: One of "png" (base64 PNG, JSON-safe), "raw" (uncompressed uint8 buffer),
+            "zlib" or "lz4" (losslessly compressed uint8 buffer)
+    """
+    global _image_codec
+    if codec not in IMAGE_CODECS:
+        raise ValueError(f"Unknown image codec: {codec}, expected one of {IMAGE_CODECS}")
+    if codec == "lz4" and lz4_frame is None:
+        raise ImportError("lz4 is required for the 'lz4' image codec, install it with `pip install lz4`")
+    _image_codec = codec
+
+def get_image_codec() -> str:
+    """Return the codec currently used to serialize PIL images."""
+    return _image_codec
+
+def msgpack_available() -> bool:
+    """Whether the binary (msgpack) wire format can be used in this process."""
+    return msgpack is not None
+
+def pack_message(payload: Any) -> bytes:
+    """
+    Encode a response payload into a msgpack message.
+    Tuples are sent as lists, matching what JSON does.
+    
+    Args:
+        payload: Payload made of dicts, lists, scalars, strings and bytes
+        
+    Returns:
+        Encoded message
+    """
+    if msgpack is None:
+        raise ImportError("msgpack is required for the binary wire format, install it with `pip install msgpack`")
+    return msgpack.packb(payload, use_bin_type=True, default=_msgpack_default)
+
+def unpack_message(data: bytes) -> Any:
+    """
+    Decode a msgpack message produced by pack_message.
+    
+    Args:
+        data: Encoded message
+        
+    Returns:
+        Decoded payload
+    """
+    if msgpack is None:
+        raise ImportError("msgpack is required for the binary wire format, install it with `pip install msgpack`")
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+def _msgpack_default(obj: Any) -> Any:
+    """Fallback for objects msgpack does not handle natively (NumPy scalars and arrays)."""
+    if hasattr(obj, 'dtype') and hasattr(obj, 'item'):
+        return serialize_dict(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not msgpack serializable")
+
+def to_json_compatible(obj: Any) -> Any:
+    """
+    Recursively convert raw image payloads into base64 PNG payloads so that a
+    response produced for the binary wire format can be sent as JSON.
+    
+    Args:
+        obj: Serialized payload
+        
+    Returns:
+        JSON-compatible payload
+    """
+    if isinstance(obj, dict):
+        if "__raw_image__" in obj:
+            return serialize_pil_image(deserialize_raw_image(obj), codec="png")
+        return {k: to_json_compatible(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [to_json_compatible(x) for x in obj]
+    return obj
+
 # -------------- serialize and deserialize observation --------------
 
 def serialize_observation(observation: Dict[str, Any]) -> Dict[str, Any]:
@@ -55,6 +160,8 @@ def deserialize_observation(serialized_obs: Dict[str, Any]) -> Dict[str, Any]:
                 if isinstance(value, dict):
                     if "__pil_image__" in value:
                         deserialized_values.append(deserialize_pil_image(value))
+                    elif "__raw_image__" in value:
+                        deserialized_values.append(deserialize_raw_image(value))
                     elif "__numpy_array__" in value:
                         deserialized_values.append(deserialize_numpy_array(value))
                     else:
@@ -114,16 +221,21 @@ def deserialize_step_result(serialized_result: Tuple[Dict, float, bool, Dict]) -
 
 # -------------- utils for previous functions --------------
 
-def serialize_pil_image(img) -> str:
+def serialize_pil_image(img, codec: Optional[str] = None) -> Dict[str, Any]:
     """
-    Serialize a PIL Image to a base64 string.
+    Serialize a PIL Image to a base64 string, or to a raw pixel buffer when
+    a binary codec is selected.
     
     Args:
         img: PIL Image object
+        codec: Image codec, defaults to the process-wide codec (see set_image_codec)
         
     Returns:
-        Base64 encoded string of the image
+        Dictionary with "__pil_image__" (base64 PNG) or "__raw_image__" (raw buffer) key
     """
+    codec = codec or _image_codec
+    if codec != "png":
+        return serialize_raw_image(img, codec)
     buffer = io.BytesIO()
     img.save(buffer, format="PNG")
     img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
@@ -143,6 +255,61 @@ def deserialize_pil_image(serialized_data: Dict[str, str]):
     img_data = base64.b64decode(serialized_data["__pil_image__"])
     return Image.open(io.BytesIO(img_data))
 
+def serialize_raw_image(img, codec: str = "raw") -> Dict[str, Any]:
+    """
+    Serialize a PIL Image to its raw uint8 pixel buffer with shape/dtype headers.
+    The buffer is bytes and therefore only fits the binary wire format.
+    
+    Args:
+        img: PIL Image object
+        codec: "raw", "zlib" or "lz4"
+        
+    Returns:
+        Dictionary with "__raw_image__" key
+    """
+    if img.mode not in _RAW_MODES:
+        img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    arr = np.asarray(img)
+    data = arr.tobytes()
+    if codec == "zlib":
+        data = zlib.compress(data, 1)
+    elif codec == "lz4":
+        data = lz4_frame.compress(data)
+    elif codec != "raw":
+        raise ValueError(f"Unknown raw image codec: {codec}")
+    return {
+        "__raw_image__": {
+            "data": data,
+            "shape": list(arr.shape),
+            "dtype": str(arr.dtype),
+            "mode": img.mode,
+            "codec": codec
+        }
+    }
+
+def deserialize_raw_image(serialized_data: Dict[str, Any]):
+    """
+    Deserialize a raw pixel buffer back to a PIL Image.
+    
+    Args:
+        serialized_data: Dictionary with "__raw_image__" key
+        
+    Returns:
+        PIL Image object
+    """
+    from PIL import Image
+    image_data = serialized_data["__raw_image__"]
+    data = image_data["data"]
+    if image_data["codec"] == "zlib":
+        data = zlib.decompress(data)
+    elif image_data["codec"] == "lz4":
+        if lz4_frame is None:
+            raise ImportError("lz4 is required to decode 'lz4' images, install it with `pip install lz4`")
+        data = lz4_frame.decompress(data)
+    arr = np.frombuffer(data, dtype=np.dtype(image_data["dtype"])).reshape(image_data["shape"])
+    # the mode follows from the shape for all of _RAW_MODES
+    return Image.fromarray(arr)
+
 def serialize_numpy_array(arr) -> Dict[str, Any]:
     """
     Serialize a numpy array to a serializable format.
@@ -223,6 +390,8 @@ def deserialize_dict(obj: Any) -> Any:
         if "__pil_image__" in obj:
             # Process PIL images using the existing function.
             return deserialize_pil_image(obj)
+        elif "__raw_image__" in obj:
+            return deserialize_raw_image(obj)
         elif "__numpy_array__" in obj:
             # Process NumPy arrays using the existing function.
             return deserialize_numpy_array(obj)
@@ -232,3 +401,50 @@ def deserialize_dict(obj: Any) -> Any:
         return type(obj)(deserialize_dict(x) for x in obj)
     else:
         return obj
+
+
+
+if __name__ == "__main__":
+    # Benchmark the JSON (PNG + base64) path against the binary (msgpack) path
+    import time
+    from PIL import Image
+
+    num_envs, num_steps = 128, 5
+    rng = np.random.default_rng(0)
+    # Grid-world-like frames: large flat regions, like sokoban/frozenlake renders
+    tiles = rng.integers(0, 255, size=(6, 6, 3), dtype=np.uint8)
+    frames = [Image.fromarray(np.kron(tiles, np.ones((50, 50, 1), dtype=np.uint8))) for _ in range(num_envs)]
+
+    def make_results():
+        return {
+            str(i): (serialize_observation({"obs_str": "<image>", "multi_modal_data": {"<image>": [frame]}}), 0.0, False, {"metrics": {}})
+            for i, frame in enumerate(frames)
+        }
+
+    def run_json():
+        set_image_codec("png")
+        body = json.dumps({"results": make_results()}).encode()
+        results = json.loads(body)["results"]
+        return len(body), {k: deserialize_step_result(v) for k, v in results.items()}
+
+    def run_msgpack(codec):
+        set_image_codec(codec)
+        body = pack_message({"results": make_results()})
+        results = unpack_message(body)["results"]
+        return len(body), {k: deserialize_step_result(v) for k, v in results.items()}
+
+    candidates = [("json/png", run_json)]
+    if msgpack_available():
+        candidates += [("msgpack/raw", lambda: run_msgpack("raw")), ("msgpack/zlib", lambda: run_msgpack("zlib"))]
+        if lz4_frame is not None:
+            candidates.append(("msgpack/lz4", lambda: run_msgpack("lz4")))
+
+    for name, fn in candidates:
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            size, decoded = fn()
+        elapsed = (time.perf_counter() - start) / num_steps
+        first = decoded["0"][0]["multi_modal_data"]["<image>"][0]
+        assert np.array_equal(np.asarray(first), np.asarray(frames[0]))
+        print(f"{name:14s} {elapsed * 1000:8.1f} ms/step  {size / 1e6:7.2f} MB/step  ({num_envs} envs)")
+    set_image_codec("png")
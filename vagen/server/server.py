@@ -1,7 +1,9 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import threading
+import signal
 import time
 import importlib
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, List, Tuple, Optional, Any, Type
 from vagen.env import REGISTERED_ENV
 from vagen.env.base.base_service import BaseService
@@ -9,6 +11,15 @@ from vagen.env.base.base_service_config import BaseServiceConfig
 import hydra
 from omegaconf import DictConfig
 from vagen.server.llm_as_judge import wandb_run_context
+from vagen.server.serial import (
+    MSGPACK_CONTENT_TYPE,
+    set_image_codec,
+    get_image_codec,
+    msgpack_available,
+    pack_message,
+    to_json_compatible,
+)
+from vagen.server.serving import InflightLimiter, HTTPServerThread
 
 class BatchEnvServer:
     """
@@ -17,6 +28,12 @@ class BatchEnvServer:
     Exposes only the standard BaseService interface.
     """
     
+    # Batch methods called without the service lock (in addition to each service's
+    # CONCURRENT_METHODS). collect_state_rewards_batch waits (up to state_reward_timeout) for
+    # judge calls tracked in the thread-safe DeferredStateRewards, and must not block the
+    # steps of other rollouts on the same service meanwhile.
+    UNLOCKED_METHODS = ("collect_state_rewards_batch",)
+    
     def __init__(self, config):
         """
         Initialize the BatchEnvServer.
@@ -32,19 +49,79 @@ class BatchEnvServer:
         self.config=config
         self.wandb_context = None
         
+        # Image codec used by services when serializing observations.
+        # Non-png codecs produce raw buffers, which are sent as msgpack to clients
+        # that accept it and converted back to base64 PNG for JSON clients.
+        set_image_codec(config.server.get("image_codec", "png"))
+        
         # Dictionary to store services by environment type
         self.services = {}
         
         # Dictionary to track which service manages which environment ID
         self.env_to_service = {}
         
+        # Per-service calls of one batch request are fanned out concurrently, so a mixed
+        # batch waits for the slowest service instead of the sum of all services.
+        # A service only ever runs one call at a time (see _call_service).
+        self.service_locks = {}
+        self.service_timeout = config.server.get("service_timeout", None)
+        self.dispatch_executor = ThreadPoolExecutor(
+            max_workers=config.server.get("dispatch_workers", 16),
+            thread_name_prefix="service_dispatch",
+        )
+        
         # Create Flask app
         self.app = Flask(__name__)
+        self.app.debug = self.debug
+        self.limiter = InflightLimiter(
+            max_inflight=config.server.get("max_inflight_requests", None),
+            queue_timeout=config.server.get("queue_timeout", 30.0),
+        )
+        self.limiter.install(self.app)
         self._setup_routes()
         
         # Server state
         self.is_running = False
         self.server_thread = None
+        self.http_server = None
+        self.stop_lock = threading.Lock()
+    
+    def _make_response(self, payload: Dict[str, Any]):
+        """
+        Build a response in the wire format negotiated through the Accept header.
+        Clients that accept msgpack get the binary format, everyone else gets JSON.
+        
+        Args:
+            payload: Response payload
+            
+        Returns:
+            Flask response
+        """
+        if msgpack_available() and MSGPACK_CONTENT_TYPE in request.headers.get("Accept", ""):
+            return Response(pack_message(payload), status=200, mimetype=MSGPACK_CONTENT_TYPE)
+        if get_image_codec() != "png":
+            payload = to_json_compatible(payload)
+        return jsonify(payload), 200
+    
+    def _make_batch_response(self, results: Dict[str, Any], errors: Dict[str, Any]):
+        """
+        Build a batch response that may only cover part of the requested environments.
+        Services that failed or timed out are reported under "errors"; the request only
+        fails as a whole when no service succeeded.
+        
+        Args:
+            results: Results of the services that succeeded
+            errors: Failures by environment type, see _dispatch
+            
+        Returns:
+            Flask response
+        """
+        if errors and not results:
+            return jsonify({"error": "All services failed", "errors": errors}), 500
+        payload = {"results": results}
+        if errors:
+            payload["errors"] = errors
+        return self._make_response(payload)
     
     def _setup_routes(self):
         """Set up HTTP routes for the Flask app"""
@@ -57,7 +134,11 @@ class BatchEnvServer:
                 "message": "Environment server is running",
                 "registered_envs": list(REGISTERED_ENV.keys()),
                 "active_services": list(self.services.keys()),
-                "active_environments": len(self.env_to_service)
+                "active_environments": len(self.env_to_service),
+                "wire_formats": ["json", "msgpack"] if msgpack_available() else ["json"],
+                "image_codec": get_image_codec(),
+                "service_stats": {name: service.get_stats() for name, service in self.services.items()
+                                  if hasattr(service, "get_stats")}
             }), 200
             
         @self.app.route('/environments', methods=['POST'])
@@ -79,8 +160,9 @@ class BatchEnvServer:
                 return jsonify({"error": "Missing required parameter: ids2seeds"}), 400
                 
             ids2seeds = data['ids2seeds']
-            results = self._reset_batch(ids2seeds)
-            return jsonify({"results": results}), 200
+            errors = {}
+            results = self._reset_batch(ids2seeds, errors=errors)
+            return self._make_batch_response(results, errors)
                 
         @self.app.route('/batch/step', methods=['POST'])
         def step_batch():
@@ -90,8 +172,9 @@ class BatchEnvServer:
                 return jsonify({"error": "Missing required parameter: ids2actions"}), 400
                 
             ids2actions = data['ids2actions']
-            results = self._step_batch(ids2actions)
-            return jsonify({"results": results}), 200
+            errors = {}
+            results = self._step_batch(ids2actions, errors=errors)
+            return self._make_batch_response(results, errors)
                 
         @self.app.route('/batch/reward', methods=['POST'])
         def compute_reward_batch():
@@ -104,6 +187,17 @@ class BatchEnvServer:
             rewards = self._compute_reward_batch(env_ids)
             return jsonify({"rewards": rewards}), 200
                 
+        @self.app.route('/batch/state_reward', methods=['POST'])
+        def collect_state_rewards_batch():
+            """Collect state rewards judged in the background endpoint"""
+            data = request.json
+            if not data or 'env_ids' not in data:
+                return jsonify({"error": "Missing required parameter: env_ids"}), 400
+                
+            env_ids = data['env_ids']
+            state_rewards = self._collect_state_rewards_batch(env_ids)
+            return jsonify({"state_rewards": state_rewards}), 200
+                
         @self.app.route('/batch/system_prompt', methods=['POST'])
         def get_system_prompts_batch():
             """Get system prompts for multiple environments endpoint"""
@@ -136,7 +230,7 @@ class BatchEnvServer:
                 return jsonify({"error": f"Environment {env_id} not found"}), 404
                     
             obs, info = results[env_id]
-            return jsonify({"observation": obs, "info": info}), 200
+            return self._make_response({"observation": obs, "info": info})
                 
         @self.app.route('/step/<env_id>', methods=['POST'])
         def step_environment(env_id):
@@ -151,12 +245,12 @@ class BatchEnvServer:
                 return jsonify({"error": f"Environment {env_id} not found"}), 404
                     
             obs, reward, done, info = results[env_id]
-            return jsonify({
+            return self._make_response({
                 "observation": obs,
                 "reward": reward,
                 "done": done,
                 "info": info
-            }), 200
+            })
                 
         @self.app.route('/reward/<env_id>', methods=['GET'])
         def compute_reward(env_id):
@@ -174,6 +268,12 @@ class BatchEnvServer:
                 return jsonify({"error": f"Environment {env_id} not found"}), 404
             return jsonify({"system_prompt": prompts[env_id]}), 200
                 
+        @self.app.route('/shutdown', methods=['POST'])
+        def shutdown():
+            """Gracefully shut down: drain in-flight requests, close environments, stop serving"""
+            threading.Thread(target=self.stop, daemon=True).start()
+            return jsonify({"status": "shutting down"}), 200
+        
         @self.app.route('/close/<env_id>', methods=['DELETE'])
         def close_environment(env_id):
             """Close single environment endpoint"""
@@ -202,6 +302,7 @@ class BatchEnvServer:
             service_class = REGISTERED_ENV[env_name]["service_cls"]
             service_config = REGISTERED_ENV[env_name].get("service_config_cls", BaseServiceConfig)(**self.config.get(env_name, {}))
             self.services[env_name] = service_class(service_config)
+            self.service_locks[env_name] = threading.Lock()
                 
         return self.services[env_name]
     
@@ -222,6 +323,80 @@ class BatchEnvServer:
         service = self.services[env_name]
         return service, env_name
     
+    def _call_service(self, env_name: str, method_name: str, arg: Any) -> Any:
+        """
+        Call a batch method of a service while holding that service's lock.
+        Services are not thread-safe, and a call that timed out keeps running in the
+        background, so the next call to the same service waits for it to finish.
+        UNLOCKED_METHODS and the service's CONCURRENT_METHODS are called without the lock.
+        
+        Args:
+            env_name: Environment type of the service
+            method_name: Name of the BaseService batch method
+            arg: Argument of the batch method
+            
+        Returns:
+            Return value of the batch method
+        """
+        service = self.services[env_name]
+        if method_name in self.UNLOCKED_METHODS or method_name in service.CONCURRENT_METHODS:
+            return getattr(service, method_name)(arg)
+        with self.service_locks[env_name]:
+            return getattr(self.services[env_name], method_name)(arg)
+    
+    def _dispatch(self, method_name: str, service_groups: Dict[str, Any], errors: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Call a batch method on several services concurrently and merge their results.
+        
+        Args:
+            method_name: Name of the BaseService batch method
+            service_groups: Dictionary mapping environment types to the argument for their service
+            errors: If given, failed or timed out services are recorded here as
+                {env_name: {"error": message, "env_ids": [...]}} and the results of the other
+                services are returned. If None, any failure raises a RuntimeError.
+                
+        Returns:
+            Merged results of all services that succeeded
+        """
+        if len(service_groups) == 1 and self.service_timeout is None:
+            # Nothing to overlap, call inline
+            env_name, arg = next(iter(service_groups.items()))
+            try:
+                return self._call_service(env_name, method_name, arg) or {}
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[env_name] = {"error": f"{type(e).__name__}: {e}", "env_ids": list(arg)}
+                return {}
+        
+        futures = {
+            self.dispatch_executor.submit(self._call_service, env_name, method_name, arg): env_name
+            for env_name, arg in service_groups.items()
+        }
+        done, not_done = wait(futures, timeout=self.service_timeout)
+        
+        results = {}
+        failures = {}
+        for future in done:
+            env_name = futures[future]
+            try:
+                service_results = future.result()
+            except Exception as e:
+                failures[env_name] = {"error": f"{type(e).__name__}: {e}", "env_ids": list(service_groups[env_name])}
+                continue
+            if service_results:
+                results.update(service_results)
+        for future in not_done:
+            env_name = futures[future]
+            failures[env_name] = {"error": f"Timed out after {self.service_timeout}s", "env_ids": list(service_groups[env_name])}
+        
+        if failures:
+            if errors is None:
+                raise RuntimeError(f"{method_name} failed for services: {failures}")
+            print(f"[BatchEnvServer] {method_name} failed for services: {failures}")
+            errors.update(failures)
+        return results
+    
     def _create_environments_batch(self, ids2configs: Dict[Any, Any]) -> None:
         """
         Create multiple environments in batch.
@@ -252,17 +427,16 @@ class BatchEnvServer:
             service_to_configs[env_name][env_id] = config
         
         # Call create_environments_batch method on each service
-        for env_name, configs in service_to_configs.items():
-            service = self.services[env_name]
-            service.create_environments_batch(configs)
+        self._dispatch("create_environments_batch", service_to_configs)
     
     
-    def _reset_batch(self, ids2seeds: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    def _reset_batch(self, ids2seeds: Dict[str, Any], errors: Optional[Dict[str, Any]] = None) -> Dict[str, Tuple[Any, Any]]:
         """
         Reset multiple environments.
         
         Args:
             ids2seeds: Dictionary mapping environment IDs to seeds
+            errors: If given, collects failures instead of raising (see _dispatch)
             
         Returns:
             Dictionary mapping environment IDs to (observation, info) tuples
@@ -272,23 +446,19 @@ class BatchEnvServer:
         for env_id, seed in ids2seeds.items():
             service, env_name = self._get_service_for_env(env_id)
             if env_name not in service_groups:
-                service_groups[env_name] = (service, {})
-            service_groups[env_name][1][env_id] = seed
+                service_groups[env_name] = {}
+            service_groups[env_name][env_id] = seed
         
         # Reset environments through respective services
-        results = {}
-        for env_name, (service, group_ids2seeds) in service_groups.items():
-            service_results = service.reset_batch(group_ids2seeds)
-            results.update(service_results)
-        
-        return results
+        return self._dispatch("reset_batch", service_groups, errors=errors)
     
-    def _step_batch(self, ids2actions: Dict[str, Any]) -> Dict[str, Tuple[Dict, float, bool, Dict]]:
+    def _step_batch(self, ids2actions: Dict[str, Any], errors: Optional[Dict[str, Any]] = None) -> Dict[str, Tuple[Dict, float, bool, Dict]]:
         """
         Step multiple environments.
         
         Args:
             ids2actions: Dictionary mapping environment IDs to actions
+            errors: If given, collects failures instead of raising (see _dispatch)
             
         Returns:
             Dictionary mapping environment IDs to (observation, reward, done, info) tuples
@@ -298,16 +468,11 @@ class BatchEnvServer:
         for env_id, action in ids2actions.items():
             service, env_name = self._get_service_for_env(env_id)
             if env_name not in service_groups:
-                service_groups[env_name] = (service, {})
-            service_groups[env_name][1][env_id] = action
+                service_groups[env_name] = {}
+            service_groups[env_name][env_id] = action
 
         # Step environments through respective services
-        results = {}
-        for env_name, (service, group_ids2actions) in service_groups.items():
-            service_results = service.step_batch(group_ids2actions)
-            results.update(service_results)
-        
-        return results
+        return self._dispatch("step_batch", service_groups, errors=errors)
     
     def _compute_reward_batch(self, env_ids: List[str]) -> Dict[str, float]:
         """
@@ -324,16 +489,31 @@ class BatchEnvServer:
         for env_id in env_ids:
             service, env_name = self._get_service_for_env(env_id)
             if env_name not in service_groups:
-                service_groups[env_name] = (service, [])
-            service_groups[env_name][1].append(env_id)
+                service_groups[env_name] = []
+            service_groups[env_name].append(env_id)
         
         # Compute rewards through respective services
-        results = {}
-        for env_name, (service, group_env_ids) in service_groups.items():
-            service_results = service.compute_reward_batch(group_env_ids)
-            results.update(service_results)
+        return self._dispatch("compute_reward_batch", service_groups)
+    
+    def _collect_state_rewards_batch(self, env_ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """
+        Collect state rewards judged in the background for multiple environments.
         
-        return results
+        Args:
+            env_ids: List of environment IDs
+            
+        Returns:
+            Dictionary mapping environment IDs to {ticket: {"reward", "turn_metrics"}}
+        """
+        # Group environment IDs by service
+        service_groups = {}
+        for env_id in env_ids:
+            service, env_name = self._get_service_for_env(env_id)
+            if env_name not in service_groups:
+                service_groups[env_name] = []
+            service_groups[env_name].append(env_id)
+        
+        return self._dispatch("collect_state_rewards_batch", service_groups)
     
     def _get_system_prompts_batch(self, env_ids: List[str]) -> Dict[str, str]:
         """
@@ -350,16 +530,11 @@ class BatchEnvServer:
         for env_id in env_ids:
             service, env_name = self._get_service_for_env(env_id)
             if env_name not in service_groups:
-                service_groups[env_name] = (service, [])
-            service_groups[env_name][1].append(env_id)
+                service_groups[env_name] = []
+            service_groups[env_name].append(env_id)
         
         # Get system prompts through respective services
-        results = {}
-        for env_name, (service, group_env_ids) in service_groups.items():
-            service_results = service.get_system_prompts_batch(group_env_ids)
-            results.update(service_results)
-        
-        return results
+        return self._dispatch("get_system_prompts_batch", service_groups)
     
     def _close_batch(self, env_ids: List[str]) -> None:
         """
@@ -373,14 +548,13 @@ class BatchEnvServer:
         for env_id in env_ids:
             service, env_name = self._get_service_for_env(env_id)
             if env_name not in service_groups:
-                service_groups[env_name] = (service, [])
-            service_groups[env_name][1].append(env_id)
+                service_groups[env_name] = []
+            service_groups[env_name].append(env_id)
             # Remove from tracking
             del self.env_to_service[env_id]
 
         # Close environments through respective services
-        for env_name, (service, group_env_ids) in service_groups.items():
-            service.close_batch(group_env_ids)
+        self._dispatch("close_batch", service_groups)
     
     def _generate_env_id(self) -> str:
         """
@@ -431,24 +605,39 @@ class BatchEnvServer:
             self._run_server()
     
     def _run_server(self) -> None:
-        """Run the Flask server"""
-        self.app.run(host=self.host, port=self.port, debug=self.debug, use_reloader=False)
+        """Run the Flask app on a threaded WSGI server that can be shut down"""
+        self.http_server = HTTPServerThread(self.app, self.host, self.port)
+        self.http_server.serve_forever()
     
-    def stop(self) -> None:
-        """Stop the server and clean up resources"""
-        if not self.is_running:
-            return
+    def stop(self, drain_timeout: Optional[float] = None) -> None:
+        """
+        Stop the server and clean up resources.
+        New requests are rejected, in-flight requests are allowed to finish,
+        then all environments are closed and the HTTP server is shut down.
+        
+        Args:
+            drain_timeout: Seconds to wait for in-flight requests, defaults to server.drain_timeout
+        """
+        with self.stop_lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        
+        if drain_timeout is None:
+            drain_timeout = self.config.server.get("drain_timeout", 60.0)
+        if not self.limiter.drain(timeout=drain_timeout):
+            print(f"Shutting down with {self.limiter.inflight} requests still in flight")
             
         # Close all environments
         env_ids = list(self.env_to_service.keys())
         self._close_batch(env_ids)
         
-        # Shut down the Flask server
-        self.is_running = False
-        if self.server_thread and self.server_thread.is_alive():
-            import requests
-            requests.post(f"http://{self.host}:{self.port}/shutdown")
+        self.dispatch_executor.shutdown(wait=False)
         
+        # Shut down the HTTP server
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server = None
         
         if self.wandb_context:
             self.wandb_context.__exit__(None, None, None)
@@ -469,7 +658,13 @@ def main(cfg: DictConfig):
     """
     # Create and start server with configuration
     print(cfg)
+    if cfg.server.get("workers", 1) > 1:
+        # Pre-forked workers behind a router with sticky env_id -> worker routing
+        from vagen.server.router import serve_with_workers
+        serve_with_workers(cfg)
+        return
     server = BatchEnvServer(cfg)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.stop, daemon=True).start())
     print(f"Starting Batch Environment Server on http://{cfg.server.host}:{cfg.server.port}")
     server.start(background=False)
 
@@ -0,0 +1,117 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+from flask import Flask, g, jsonify, request
+from werkzeug.serving import make_server
+
+# Endpoints that are never rejected by backpressure or draining
+EXEMPT_ENDPOINTS = ("/health", "/shutdown")
+
+# Set in the worker processes of a multi-worker server (see router.run_worker)
+WORKER_INDEX_ENV = "VAGEN_SERVER_WORKER"
+WORKER_GROUP_ENV = "VAGEN_SERVER_WORKER_GROUP"
+
+
+def wandb_run_kwargs(run_name: str, run_id: str) -> Dict[str, Any]:
+    """
+    name (and group) of the LLM-judge wandb run of this process. The workers of a
+    multi-worker server each log to their own run, tagged with the worker index and
+    grouped under one name per server launch.
+    """
+    worker = os.environ.get(WORKER_INDEX_ENV)
+    if worker is None:
+        return {"name": f"{run_name}_{run_id}"}
+    return {
+        "name": f"{run_name}_{os.environ.get(WORKER_GROUP_ENV, run_id)}_worker{worker}",
+        "group": f"{run_name}_{os.environ.get(WORKER_GROUP_ENV, run_id)}",
+    }
+
+
+class InflightLimiter:
+    """
+    Backpressure for a Flask app: bounds the number of requests processed at once.
+    Requests wait up to `queue_timeout` seconds for a slot and are rejected with
+    503 + Retry-After afterwards, so overloaded servers push back on trainers
+    instead of queueing unboundedly. While draining, new requests are rejected
+    and in-flight ones are allowed to finish.
+    """
+
+    def __init__(self, max_inflight: Optional[int] = None, queue_timeout: float = 30.0):
+        """
+        Args:
+            max_inflight: Maximum number of requests processed concurrently (None: unbounded)
+            queue_timeout: Seconds a request may wait for a slot before being rejected
+        """
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self.semaphore = threading.BoundedSemaphore(max_inflight) if max_inflight else None
+        self.inflight = 0
+        self.draining = False
+        self.cond = threading.Condition()
+
+    def install(self, app: Flask) -> None:
+        """Register the request hooks on a Flask app."""
+
+        @app.before_request
+        def _acquire():
+            if request.path in EXEMPT_ENDPOINTS:
+                return None
+            if self.draining:
+                return jsonify({"error": "Server is shutting down"}), 503
+            if self.semaphore is not None and not self.semaphore.acquire(timeout=self.queue_timeout):
+                response = jsonify({"error": "Server is overloaded, retry later"})
+                response.headers["Retry-After"] = str(max(1, int(self.queue_timeout)))
+                return response, 503
+            g.inflight_slot = True
+            with self.cond:
+                self.inflight += 1
+            return None
+
+        @app.teardown_request
+        def _release(exc=None):
+            if not g.pop("inflight_slot", False):
+                return
+            if self.semaphore is not None:
+                self.semaphore.release()
+            with self.cond:
+                self.inflight -= 1
+                self.cond.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop accepting requests and wait for in-flight requests to finish.
+
+        Args:
+            timeout: Maximum seconds to wait (None: wait forever)
+
+        Returns:
+            True if all in-flight requests finished
+        """
+        self.draining = True
+        with self.cond:
+            return self.cond.wait_for(lambda: self.inflight == 0, timeout=timeout)
+
+
+class HTTPServerThread:
+    """
+    Threaded WSGI server around a Flask app that, unlike `app.run`, can be shut
+    down programmatically (used by the /shutdown route and SIGTERM handling).
+    """
+
+    def __init__(self, app: Flask, host: str, port: int):
+        self.server = make_server(host, port, app, threaded=True)
+        self.thread = None
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until shutdown() is called."""
+        self.server.serve_forever()
+
+    def start(self) -> None:
+        """Serve in a daemon thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown(self) -> None:
+        """Stop serving; returns once serve_forever has exited."""
+        self.server.shutdown()
+        self.server.server_close()
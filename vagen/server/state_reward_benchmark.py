@@ -0,0 +1,129 @@
+"""
+Offline benchmark of the state-reward (LLM-as-judge) overhead of a service's step_batch.
+
+Starts vagen/server/mock_llm_server.py in-process, points the judge at it and steps the same
+batch of environments with synthetic grounding/world-modeling responses three times:
+without state reward, with the synchronous judge, and with async_state_reward (plus the
+collect_state_rewards_batch call the rollout manager makes before the update).
+
+    python -m vagen.server.state_reward_benchmark --env sokoban --num_envs 32 --turns 5 --latency 0.5
+"""
+import os
+import time
+import random
+import argparse
+from typing import Dict, List
+
+from vagen.server.mock_llm_server import start_mock_llm_server
+
+_ACTIONS = {
+    "sokoban": ["Up", "Down", "Left", "Right"],
+    "frozenlake": ["Left", "Down", "Right", "Up"],
+}
+_VERTICAL_TEXT = {"above": "above the player", "below": "below the player", "same": "in the same row as the player"}
+_HORIZONTAL_TEXT = {"left": "to the left", "right": "to the right", "same": "in the same column"}
+
+
+def describe_state(state: List[Dict], rng: random.Random, error_rate: float) -> str:
+    """Natural-language description of get_env_state(), with some relations deliberately wrong"""
+    sentences = []
+    for item in state:
+        vertical, horizontal = item["vertical_relation"], item["horizontal_relation"]
+        if rng.random() < error_rate:
+            vertical = rng.choice(list(_VERTICAL_TEXT))
+        if rng.random() < error_rate:
+            horizontal = rng.choice(list(_HORIZONTAL_TEXT))
+        sentences.append(f"The {item['object_id']} is {_VERTICAL_TEXT[vertical]} and {_HORIZONTAL_TEXT[horizontal]}.")
+    return " ".join(sentences)
+
+
+def synthetic_response(env, env_name: str, rng: random.Random, error_rate: float) -> str:
+    actions = ",".join(rng.choice(_ACTIONS[env_name]) for _ in range(2))
+    observation = describe_state(env.get_env_state(), rng, error_rate)
+    prediction = describe_state(env.get_env_state(), rng, error_rate * 2)
+    return (f"<think><observation>{observation}</observation><reasoning>Move towards the target.</reasoning>"
+            f"<prediction>{prediction}</prediction></think><answer>{actions}</answer>")
+
+
+def run_service(env_name: str, num_envs: int, turns: int, seed: int, error_rate: float, **service_kwargs) -> Dict:
+    from vagen.env import REGISTERED_ENV
+
+    service_cls = REGISTERED_ENV[env_name]["service_cls"]
+    service_config_cls = REGISTERED_ENV[env_name]["service_config_cls"]
+    service = service_cls(service_config_cls(**service_kwargs))
+    use_state_reward = service_kwargs.get("use_state_reward", False)
+    env_ids = [f"{env_name}_{i}" for i in range(num_envs)]
+    service.create_environments_batch({env_id: {"env_name": env_name, "env_config": {
+        "render_mode": "text", "prompt_format": "grounding_worldmodeling", "use_state_reward": use_state_reward,
+    }} for env_id in env_ids})
+    service.reset_batch({env_id: seed + i for i, env_id in enumerate(env_ids)})
+
+    rng = random.Random(seed)
+    step_time, collect_time, total_reward, tickets = 0.0, 0.0, 0.0, 0
+    for _ in range(turns):
+        responses = {env_id: synthetic_response(service.environments[env_id], env_name, rng, error_rate)
+                     for env_id in env_ids}
+        start = time.perf_counter()
+        results = service.step_batch(responses)
+        step_time += time.perf_counter() - start
+        for env_id, (_, reward, _, info) in results.items():
+            total_reward += reward
+            tickets += "pending_state_reward" in info
+    if tickets:
+        start = time.perf_counter()
+        collected = service.collect_state_rewards_batch(env_ids)
+        collect_time = time.perf_counter() - start
+        total_reward += sum(entry["reward"] for per_env in collected.values() for entry in per_env.values())
+    service.close_batch(env_ids)
+    return {
+        "step_ms": step_time / turns * 1000,
+        "collect_ms": collect_time * 1000,
+        "mean_reward": total_reward / num_envs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--env", default="sokoban", choices=sorted(_ACTIONS))
+    parser.add_argument("--num_envs", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean judge latency in seconds")
+    parser.add_argument("--latency_std", type=float, default=0.2)
+    parser.add_argument("--rate_limit_rate", type=float, default=0.0, help="fraction of judge calls answered 429")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="fraction of judge calls answered 500")
+    parser.add_argument("--description_error_rate", type=float, default=0.2,
+                        help="fraction of wrong relations in the synthetic descriptions")
+    args = parser.parse_args()
+
+    server = start_mock_llm_server({
+        "port": 0,
+        "seed": args.seed,
+        "latency": {"distribution": "lognormal", "mean": args.latency, "std": args.latency_std},
+        "errors": {"rate_limit_rate": args.rate_limit_rate, "error_rate": args.error_rate},
+    })
+    # The judge client reads these when config.api.base_url / api_key are null
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+    # judge tables are still logged, to a local offline run
+    os.environ.setdefault("WANDB_MODE", "offline")
+
+    common = dict(env_name=args.env, num_envs=args.num_envs, turns=args.turns, seed=args.seed,
+                  error_rate=args.description_error_rate)
+    runs = {
+        "no state reward": run_service(**common, use_state_reward=False),
+        "sync judge": run_service(**common, use_state_reward=True),
+        "async judge": run_service(**common, use_state_reward=True, async_state_reward=True),
+    }
+    server.shutdown()
+
+    baseline = runs["no state reward"]["step_ms"]
+    print(f"\n{args.env}: {args.num_envs} envs x {args.turns} turns, judge latency {args.latency}s")
+    print(f"{'mode':<18}{'step_batch ms':>15}{'overhead ms':>13}{'collect ms':>12}{'reward/env':>12}")
+    for mode, result in runs.items():
+        print(f"{mode:<18}{result['step_ms']:>15.1f}{result['step_ms'] - baseline:>13.1f}"
+              f"{result['collect_ms']:>12.1f}{result['mean_reward']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
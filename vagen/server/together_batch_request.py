@@ -4,46 +4,7 @@ import time
 from typing import List, Dict, Any
 from together import AsyncTogether
 
-class RateLimiter:
-    """Rate limiter for Together AI API"""
-    def __init__(self, qps_limit=70, rpm_limit=4000, tps_limit=15000):
-        self.qps_limit = qps_limit
-        self.rpm_limit = rpm_limit
-        self.tps_limit = tps_limit
-        self.request_timestamps = []
-        self.token_counts = []
-        self.semaphore = asyncio.Semaphore(qps_limit)
-    
-    async def wait_if_needed(self, estimated_tokens=500):
-        now = time.time()
-        # Clean up old timestamps (older than 60 seconds)
-        self.request_timestamps = [ts for ts in self.request_timestamps if now - ts < 60]
-        self.token_counts = self.token_counts[-len(self.request_timestamps):]
-        
-        # Check RPM limit
-        rpm_current = len(self.request_timestamps)
-        if rpm_current >= self.rpm_limit:
-            oldest = self.request_timestamps[0]
-            wait_time = 60 - (now - oldest)
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-                return await self.wait_if_needed(estimated_tokens)
-        
-        # Check QPS limit (last 1 second)
-        recent_requests = sum(1 for ts in self.request_timestamps if now - ts < 1)
-        if recent_requests >= self.qps_limit:
-            await asyncio.sleep(0.1)
-            return await self.wait_if_needed(estimated_tokens)
-        
-        # Check TPS limit (last 1 second)
-        recent_tokens = sum(tokens for ts, tokens in zip(self.request_timestamps, self.token_counts) if now - ts < 1)
-        if recent_tokens + estimated_tokens >= self.tps_limit:
-            await asyncio.sleep(0.2)
-            return await self.wait_if_needed(estimated_tokens)
-        
-        # Update tracking
-        self.request_timestamps.append(now)
-        self.token_counts.append(estimated_tokens)
+from vagen.utils.rate_limiter import get_rate_limiter, is_throttle_error
 
 def run_together_request(prompts: List[str], config) -> List[Dict[str, Any]]:
     """
@@ -78,11 +39,14 @@ def run_together_request(prompts: List[str], config) -> List[Dict[str, Any]]:
 def _process_batch(prompts: List[str], config) -> List[Dict[str, Any]]:
     """Process a single batch with rate limiting"""
     async def _async_batch_completions():
-        async_client = AsyncTogether()
-        rate_limiter = RateLimiter(
-            qps_limit=config.get("qps_limit", 70),
-            rpm_limit=config.get("rpm_limit", 4000),
-            tps_limit=config.get("tps_limit", 15000)
+        # base_url / api_key default to the SDK's (TOGETHER_* env vars), e.g. the mock server for offline runs
+        async_client = AsyncTogether(base_url=config.get("base_url", None), api_key=config.get("api_key", None))
+        # Shared by all batches of the process, qps/tps limits are per second
+        rate_limiter = get_rate_limiter(
+            "together_batch_request",
+            requests_per_minute=min(config.get("rpm_limit", 4000), config.get("qps_limit", 70) * 60),
+            tokens_per_minute=config.get("tps_limit", 15000) * 60,
+            max_concurrency=config.get("qps_limit", 70),
         )
         
         results = [{"response": "", "success": False, "retries": 0, "error": None} for _ in prompts]
@@ -96,9 +60,7 @@ def _process_batch(prompts: List[str], config) -> List[Dict[str, Any]]:
             
             while retries <= config.get("max_retries", 3):
                 try:
-                    async with rate_limiter.semaphore:
-                        await rate_limiter.wait_if_needed(total_estimated_tokens)
-                        
+                    async with rate_limiter.limit_async(total_estimated_tokens):
                         response = await async_client.completions.create(
                             model=config.get("name", "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"),
                             prompt=prompt,
@@ -118,7 +80,7 @@ def _process_batch(prompts: List[str], config) -> List[Dict[str, Any]]:
                     retries += 1
                     
                     # Exponential backoff for rate limit errors
-                    if "rate_limit" in error_str.lower():
+                    if "rate_limit" in error_str.lower() or is_throttle_error(e):
                         backoff_time = config.get("retry_delay", 1) * (2 ** (retries - 1))
                         backoff_time += random.uniform(0, 1)  # Add jitter
                         backoff_time = min(backoff_time, 30)  # Cap at 30s
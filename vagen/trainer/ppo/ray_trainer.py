@@ -999,7 +999,7 @@ class RayPPOTrainer(object):
                                                     prefix=logging_prefix)
         metrics.update(global_balance_stats)
 
-    def _process_in_mini_batches(self,batch, rollout_manager, mini_batch_size):
+    def _process_in_mini_batches(self,batch, rollout_manager, mini_batch_size, timing_raw=None):
         """
         Process the batch in mini-batches.
         
@@ -1007,6 +1007,7 @@ class RayPPOTrainer(object):
             batch: DataProto containing the data
             rollout_manager: Manager for rollout operations
             mini_batch_size: Size of each mini-batch to process
+            timing_raw: If given, rollout timings reported by the rollout manager are summed into it
         
         Returns:
             Tuple of (final_combined_batch_output, combined_rst)
@@ -1032,6 +1033,9 @@ class RayPPOTrainer(object):
             # Reset and process this mini-batch
             rollout_manager.reset(mini_batch_env_configs)
             rollout_manager.rollout_loop()
+            if timing_raw is not None:
+                for name, value in getattr(rollout_manager, 'timing_raw', {}).items():
+                    timing_raw[name] = timing_raw.get(name, 0.0) + value
             mini_batch_output = rollout_manager.generate_batch_for_update()
             mini_batch_rst = rollout_manager.recording_to_log()
             
@@ -1124,9 +1128,11 @@ class RayPPOTrainer(object):
                     with _timer('gen', timing_raw):
                        
                         mini_batch_size=self.config.rollout_manager.get('mini_batch_size',len(batch))
-                        final_gen_batch_output, rst=self._process_in_mini_batches(batch, rollout_manager, mini_batch_size) 
+                        final_gen_batch_output, rst=self._process_in_mini_batches(batch, rollout_manager, mini_batch_size, timing_raw=timing_raw)
                         train_metrics=self.log_rst_to_metrics_dict(rst=rst,mode='train')
                         metrics.update(train_metrics)
+                        if hasattr(rollout_manager, 'cache_metrics'):
+                            metrics.update(rollout_manager.cache_metrics())
                     print(f"[DEBUG] step {self.global_steps} rollout ends")
                     batch = batch.union(final_gen_batch_output)
 
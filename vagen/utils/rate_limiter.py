@@ -0,0 +1,371 @@
+"""
+Rate limiting for API model calls (LLM-as-judge clients and the model_interface backends).
+
+RateLimiter combines two mechanisms:
+
+    - token buckets for requests per minute and tokens per minute. An acquire reserves its
+      share up front in O(1) and is told when it may start, so concurrent callers are spaced
+      out evenly instead of polling a list of timestamps. A bucket refills at
+      (limit - capacity) per minute, so no 60s window (a burst after idle time included)
+      admits more than the limit.
+    - an adaptive concurrency window (AIMD). Every success widens the window by
+      additive_increase / window (about +additive_increase per window of requests). A 429 or
+      a timeout shrinks it by multiplicative_decrease, at most once per window, since
+      requests that were already in flight fail together.
+
+The limiter is thread-safe. acquire/limit block the calling thread and acquire_async/
+limit_async suspend a coroutine; both kinds of caller can share one limiter.
+
+    limiter = get_rate_limiter("openai", requests_per_minute=3000, tokens_per_minute=10**6)
+    with limiter.limit(estimated_tokens) as permit:
+        response = client.chat.completions.create(...)
+        permit.used_tokens = response.usage.total_tokens
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Token bucket admitting at most rate_per_minute in any 60s window: it holds at most burst
+    tokens and refills at (rate_per_minute - burst) per minute.
+
+    Kept in virtual-scheduling form (GCRA): instead of a token level it stores the time at
+    which the bucket would be full again if nothing else were taken, so a reservation that
+    only starts later (another bucket made it wait) is charged at the time it actually starts.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, now: float):
+        # a full bucket plus a minute of refill must fit in the limit
+        burst = min(burst, rate_per_minute / 2.0)
+        self.rate = (rate_per_minute - burst) / 60.0
+        self.tolerance = burst / self.rate
+        self.full_at = now  # "theoretical arrival time" of GCRA
+
+    def earliest(self, now: float, amount: float) -> float:
+        """
+        Earliest time a reservation of amount made now can start: once the bucket holds
+        amount (an amount above the capacity waits for a full bucket)
+        """
+        return max(now, self.full_at + min(amount / self.rate, self.tolerance) - self.tolerance)
+
+    def reserve(self, amount: float, start: float) -> None:
+        """Take amount tokens for a call starting at start (not before earliest)"""
+        self.full_at = max(self.full_at, start) + amount / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back tokens that were reserved but not used (negative to charge more)"""
+        self.full_at -= amount / self.rate
+
+
+class Permit:
+    """One admitted call, handed back to RateLimiter.release"""
+    __slots__ = ("tokens", "epoch", "used_tokens")
+
+    def __init__(self, tokens: float, epoch: int):
+        self.tokens = tokens
+        self.epoch = epoch
+        self.used_tokens = None  # actual usage, corrects the token bucket on release if set
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether an API error means the provider is overloaded (429, request timeouts)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status in (408, 429):
+        return True
+    name = type(error).__name__.lower()
+    return isinstance(error, TimeoutError) or "timeout" in name or "ratelimit" in name or "resourceexhausted" in name
+
+
+class RateLimiter:
+    """Request/token buckets plus an AIMD concurrency window, shared by threads and coroutines"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_concurrency: int = 64, min_concurrency: int = 1, initial_concurrency: Optional[int] = None,
+                 additive_increase: float = 1.0, multiplicative_decrease: float = 0.5, burst_seconds: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            requests_per_minute: Request rate, None for no limit
+            tokens_per_minute: Token rate (prompt + completion), None for no limit
+            max_concurrency: Upper bound of the concurrency window
+            min_concurrency: Lower bound of the concurrency window
+            initial_concurrency: Starting window, defaults to max_concurrency
+            additive_increase: Window growth per window of successful calls
+            multiplicative_decrease: Window factor on a throttled call
+            burst_seconds: Bucket capacity in seconds of the rate, bounds bursts after idle time.
+                The buckets refill at the rate minus their capacity per minute, so the sustained
+                rate is (1 - burst_seconds / 60) of the limit
+            clock: Monotonic time source in seconds
+        """
+        self.clock = clock
+        now = clock()
+        self.requests = None
+        if requests_per_minute:
+            self.requests = TokenBucket(requests_per_minute, max(1.0, requests_per_minute / 60.0 * burst_seconds), now)
+        self.tokens = None
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0 * burst_seconds, now)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(initial_concurrency or max_concurrency)
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.in_flight = 0
+        self.epoch = 0  # bumped on every decrease, permits of older epochs do not decrease again
+        self.throttled = 0
+        self.completed = 0
+        self.waiters = deque()  # wake-up callbacks of callers waiting for a concurrency slot
+        self.lock = threading.Lock()
+
+    def _try_enter(self, tokens: float, waiter: Callable[[], None]) -> Optional[Tuple[Permit, float]]:
+        """Admit a call if the window has room (returns the permit and the bucket wait), else queue waiter"""
+        with self.lock:
+            if self.in_flight >= int(self.concurrency):
+                self.waiters.append(waiter)
+                return None
+            self.in_flight += 1
+            now = self.clock()
+            buckets = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+                       if bucket is not None and amount > 0]
+            start = max([bucket.earliest(now, amount) for bucket, amount in buckets], default=now)
+            for bucket, amount in buckets:
+                bucket.reserve(amount, start)
+            return Permit(tokens, self.epoch), start - now
+
+    def _wake(self, count: int) -> None:
+        for _ in range(count):
+            with self.lock:
+                if not self.waiters:
+                    return
+                waiter = self.waiters.popleft()
+            waiter()
+
+    def release(self, permit: Permit, outcome: str = "success") -> None:
+        """
+        Hand back a permit.
+
+        Args:
+            permit: From acquire/acquire_async
+            outcome: "success" widens the window, "throttled" (429, timeout) shrinks it,
+                "error" (any other failure) leaves it as is
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if self.tokens is not None and permit.used_tokens is not None:
+                self.tokens.refund(permit.tokens - permit.used_tokens)
+            wake = 1
+            if outcome == "throttled":
+                self.throttled += 1
+                if permit.epoch == self.epoch:
+                    self.concurrency = max(float(self.min_concurrency), self.concurrency * self.multiplicative_decrease)
+                    self.epoch += 1
+            elif outcome == "success":
+                self.completed += 1
+                before = int(self.concurrency)
+                self.concurrency = min(float(self.max_concurrency),
+                                       self.concurrency + self.additive_increase / self.concurrency)
+                wake += int(self.concurrency) - before
+        self._wake(wake)
+
+    def acquire(self, tokens: float = 0) -> Permit:
+        """Block until a call with this many (estimated) tokens may start"""
+        while True:
+            event = threading.Event()
+            admitted = self._try_enter(tokens, event.set)
+            if admitted is not None:
+                permit, wait = admitted
+                if wait > 0:
+                    time.sleep(wait)
+                return permit
+            event.wait()
+
+    async def acquire_async(self, tokens: float = 0) -> Permit:
+        """Coroutine version of acquire, for any event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            woken = loop.create_future()
+
+            def _deliver(future=woken):
+                if future.done():  # the waiting coroutine was cancelled, pass the wake-up on
+                    self._wake(1)
+                else:
+                    future.set_result(None)
+
+            admitted = self._try_enter(tokens, lambda: loop.call_soon_threadsafe(_deliver))
+            if admitted is not None:
+                permit, wait = admitted
+                if wait > 0:
+                    try:
+                        await asyncio.sleep(wait)
+                    except BaseException:
+                        self.release(permit, "error")
+                        raise
+                return permit
+            await woken
+
+    @contextmanager
+    def limit(self, tokens: float = 0):
+        """acquire/release around a block, the outcome is derived from the exception raised in it"""
+        permit = self.acquire(tokens)
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, "throttled" if is_throttle_error(e) else "error")
+            raise
+        self.release(permit, "success")
+
+    @asynccontextmanager
+    async def limit_async(self, tokens: float = 0):
+        """Coroutine version of limit"""
+        permit = await self.acquire_async(tokens)
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, "throttled" if is_throttle_error(e) else "error")
+            raise
+        self.release(permit, "success")
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "rate_limiter/concurrency": self.concurrency,
+                "rate_limiter/in_flight": self.in_flight,
+                "rate_limiter/throttled": self.throttled,
+                "rate_limiter/completed": self.completed,
+            }
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(name: str, **kwargs) -> RateLimiter:
+    """
+    The process-wide limiter of a provider/endpoint, created with kwargs on first use.
+    Later calls with the same name share it (and its limits).
+    """
+    with _LIMITERS_LOCK:
+        if name not in _LIMITERS:
+            _LIMITERS[name] = RateLimiter(**kwargs)
+        return _LIMITERS[name]
+
+
+if __name__ == "__main__":
+    # Discrete-event simulation on a fake clock: many workers hammer a provider through the limiter
+    import heapq
+    import random
+
+    def simulate(duration, workers, provider_concurrency, latency, limiter_kwargs, seed=0):
+        rng = random.Random(seed)
+        clock = [0.0]
+        limiter = RateLimiter(clock=lambda: clock[0], **limiter_kwargs)
+        events = []
+        counter = [0]
+        sends = []  # [time, tokens used]
+        provider = {"in_flight": 0, "rejected": 0}
+        windows = []
+
+        def push(t, kind, data):
+            counter[0] += 1
+            heapq.heappush(events, (t, counter[0], kind, data))
+
+        for w in range(workers):
+            push(0.0, "attempt", w)
+        while events:
+            t, _, kind, data = heapq.heappop(events)
+            if t > duration:
+                break
+            clock[0] = t
+            if kind == "attempt":
+                tokens = rng.randint(200, 800)
+                admitted = limiter._try_enter(tokens, lambda w=data: push(clock[0], "attempt", w))
+                if admitted is not None:
+                    permit, wait = admitted
+                    push(t + wait, "send", (data, permit))
+            elif kind == "send":
+                worker, permit = data
+                sends.append([t, permit.tokens])
+                permit.used_tokens = permit.tokens
+                provider["in_flight"] += 1
+                throttled = provider_concurrency is not None and provider["in_flight"] > provider_concurrency
+                provider["rejected"] += throttled
+                push(t + (0.05 if throttled else rng.uniform(*latency)), "done", (worker, permit, throttled, len(sends) - 1))
+            elif kind == "done":
+                worker, permit, throttled, _ = data
+                provider["in_flight"] -= 1
+                # the estimate is an upper bound, calls use 60-100% of it
+                permit.used_tokens = permit.tokens * (0.0 if throttled else rng.uniform(0.6, 1.0))
+                sends[data[3]][1] = permit.used_tokens
+                limiter.release(permit, "throttled" if throttled else "success")
+                windows.append(limiter.concurrency)
+                push(t, "attempt", worker)
+        return sends, provider, limiter, windows
+
+    def max_in_window(sends, window, weight):
+        best, total, lo = 0.0, 0.0, 0
+        for hi in range(len(sends)):
+            total += weight(sends[hi])
+            while sends[hi][0] - sends[lo][0] >= window:
+                total -= weight(sends[lo])
+                lo += 1
+            best = max(best, total)
+        return best
+
+    # 1. Fixed rate limits, ample provider capacity: the buckets alone set the pace
+    rpm, tpm, duration = 1200, 500000, 600.0
+    sends, provider, limiter, _ = simulate(duration, workers=200, provider_concurrency=None, latency=(0.5, 1.5),
+                                           limiter_kwargs=dict(requests_per_minute=rpm, tokens_per_minute=tpm,
+                                                               max_concurrency=256))
+    peak_requests = max_in_window(sends, 60.0, lambda s: 1)
+    peak_tokens = max_in_window(sends, 60.0, lambda s: s[1])
+    mean_rpm = len(sends) / duration * 60
+    print(f"[buckets] target {rpm} rpm / {tpm} tpm: mean {mean_rpm:.0f} rpm, "
+          f"peak 60s window {peak_requests:.0f} requests / {peak_tokens:.0f} tokens")
+    assert peak_requests <= rpm, "request rate overshoot"
+    assert peak_tokens <= tpm, "token rate overshoot"
+    assert max(mean_rpm / rpm, sum(s[1] for s in sends) / duration * 60 / tpm) > 0.97, "rate not reached"
+
+    # 2. No configured limits, provider rejects above 40 concurrent calls: AIMD finds the window
+    sends, provider, limiter, windows = simulate(300.0, workers=300, provider_concurrency=40, latency=(0.5, 1.5),
+                                                 limiter_kwargs=dict(max_concurrency=256))
+    settled = windows[len(windows) // 2:]
+    rejected = provider["rejected"] / len(sends)
+    print(f"[aimd] provider cap 40: window {min(settled):.1f}..{max(settled):.1f} after warm-up, "
+          f"{rejected:.2%} of calls throttled, {len(sends) / 300.0:.1f} calls/s")
+    # AIMD saw-tooth between half the cap and the cap
+    assert max(settled) <= 42 and min(settled) >= 19, "window did not settle around the provider cap"
+    assert rejected < 0.05, "too many throttled calls"
+
+    # 3. Real threads and coroutines sharing one limiter
+    limiter = RateLimiter(requests_per_minute=6000, max_concurrency=8)
+    peak = [0]
+
+    def thread_call():
+        with limiter.limit():
+            peak[0] = max(peak[0], limiter.in_flight)
+            time.sleep(0.01)
+
+    async def coroutine_calls():
+        async def one():
+            async with limiter.limit_async():
+                peak[0] = max(peak[0], limiter.in_flight)
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*(one() for _ in range(100)))
+
+    start = time.time()
+    threads = [threading.Thread(target=lambda: [thread_call() for _ in range(25)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(coroutine_calls())
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    print(f"[mixed] 200 calls at 100/s from threads and coroutines: {elapsed:.2f}s, peak in flight {peak[0]}")
+    assert peak[0] <= 8 and limiter.in_flight == 0 and elapsed >= 1.0